@@ -0,0 +1,193 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from uuid import uuid4
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete
+from models.ai_job import AIJob, AIJobStatus
+from database.models import AIJob as AIJobModel
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Claimable jobs looked at per claim; losing all of them to other workers just means another round
+CLAIM_CANDIDATES = 5
+CLAIMABLE_STATUSES = (AIJobStatus.QUEUED.value, AIJobStatus.RUNNING.value)
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    id: str
+    user_id: str
+    request: dict
+    attempts: int
+
+
+def _model_to_job(job_model: AIJobModel) -> AIJob:
+    return AIJob(
+        id=job_model.id,
+        status=AIJobStatus(job_model.status),
+        model=json.loads(job_model.request).get("model"),
+        result=job_model.result,
+        error=job_model.error,
+        error_status=job_model.error_status,
+        attempts=job_model.attempts,
+        created_at=job_model.created_at,
+        started_at=job_model.started_at,
+        finished_at=job_model.finished_at,
+        expires_at=job_model.expires_at,
+    )
+
+
+async def create_job(session: AsyncSession, user_id: str, request: dict, now: Optional[datetime] = None) -> AIJob:
+    """Queue a job and commit"""
+    now = now or datetime.now()
+    job_model = AIJobModel(
+        id=str(uuid4()),
+        user_id=user_id,
+        status=AIJobStatus.QUEUED.value,
+        request=json.dumps(request, ensure_ascii=False),
+        attempts=0,
+        available_at=now,
+        created_at=now,
+    )
+    session.add(job_model)
+    await session.commit()
+    return _model_to_job(job_model)
+
+
+async def get_job(session: AsyncSession, job_id: str, user_id: str) -> Optional[AIJob]:
+    """The user's job, or None if it does not exist (anymore) or belongs to someone else"""
+    result = await session.execute(
+        select(AIJobModel)
+        .where(AIJobModel.id == job_id, AIJobModel.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )
+    job_model = result.scalar_one_or_none()
+    return _model_to_job(job_model) if job_model else None
+
+
+async def claim_job(session: AsyncSession, worker_id: str, now: datetime, lease_until: datetime,
+                    max_attempts: int, ttl: float) -> Optional[ClaimedJob]:
+    """
+    Take the oldest claimable job: queued and due, or running with an expired lease
+    (its worker died). The claim is a compare-and-set UPDATE on the row as it was
+    read, so of several workers racing for one job exactly one wins. Jobs whose
+    lease expired max_attempts times are failed instead of retried forever and,
+    like finished jobs, deleted ttl seconds later.
+    """
+    while True:
+        result = await session.execute(
+            select(AIJobModel.id, AIJobModel.user_id, AIJobModel.status, AIJobModel.request, AIJobModel.attempts)
+            .where(AIJobModel.status.in_(CLAIMABLE_STATUSES), AIJobModel.available_at <= now)
+            .order_by(AIJobModel.available_at)
+            .limit(CLAIM_CANDIDATES)
+        )
+        candidates = result.all()
+        if not candidates:
+            return None
+
+        for candidate in candidates:
+            unchanged = (
+                AIJobModel.id == candidate.id,
+                AIJobModel.status == candidate.status,
+                AIJobModel.attempts == candidate.attempts,
+                AIJobModel.available_at <= now,
+            )
+            if candidate.attempts >= max_attempts:
+                await session.execute(
+                    update(AIJobModel).where(*unchanged).values(
+                        status=AIJobStatus.FAILED.value,
+                        error=f"Zadanie AI przerwane {candidate.attempts} razy",
+                        error_status=500,
+                        finished_at=now,
+                        expires_at=now + timedelta(seconds=ttl),
+                    )
+                )
+                await session.commit()
+                logger.warning(f"Zadanie AI {candidate.id} porzucone po {candidate.attempts} próbach")
+                continue
+
+            claimed = await session.execute(
+                update(AIJobModel).where(*unchanged).values(
+                    status=AIJobStatus.RUNNING.value,
+                    worker_id=worker_id,
+                    attempts=candidate.attempts + 1,
+                    available_at=lease_until,
+                    started_at=now,
+                )
+            )
+            await session.commit()
+            if claimed.rowcount == 1:
+                return ClaimedJob(
+                    id=candidate.id,
+                    user_id=candidate.user_id,
+                    request=json.loads(candidate.request),
+                    attempts=candidate.attempts + 1,
+                )
+
+
+async def finish_job(session: AsyncSession, job_id: str, worker_id: str, status: AIJobStatus, now: datetime,
+                     ttl: float, result: Optional[str] = None, error: Optional[str] = None,
+                     error_status: Optional[int] = None) -> bool:
+    """
+    Store the outcome of a claimed job and commit. False if the claim was lost
+    (lease expired and another worker took the job) - that worker's outcome counts.
+    """
+    finished = await session.execute(
+        update(AIJobModel)
+        .where(
+            AIJobModel.id == job_id,
+            AIJobModel.worker_id == worker_id,
+            AIJobModel.status == AIJobStatus.RUNNING.value,
+        )
+        .values(
+            status=status.value,
+            result=result,
+            error=error,
+            error_status=error_status,
+            finished_at=now,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+    )
+    await session.commit()
+    return finished.rowcount == 1
+
+
+async def requeue_job(session: AsyncSession, job_id: str, worker_id: str, available_at: datetime) -> bool:
+    """Put a claimed job back in the queue, not to be claimed before available_at"""
+    requeued = await session.execute(
+        update(AIJobModel)
+        .where(
+            AIJobModel.id == job_id,
+            AIJobModel.worker_id == worker_id,
+            AIJobModel.status == AIJobStatus.RUNNING.value,
+        )
+        .values(status=AIJobStatus.QUEUED.value, worker_id=None, available_at=available_at)
+    )
+    await session.commit()
+    return requeued.rowcount == 1
+
+
+async def release_worker_jobs(session: AsyncSession, worker_id: str, now: datetime) -> int:
+    """Requeue the jobs a stopping worker still runs; the interrupted attempt does not count"""
+    released = await session.execute(
+        update(AIJobModel)
+        .where(AIJobModel.worker_id == worker_id, AIJobModel.status == AIJobStatus.RUNNING.value)
+        .values(
+            status=AIJobStatus.QUEUED.value,
+            worker_id=None,
+            attempts=AIJobModel.attempts - 1,
+            available_at=now,
+        )
+    )
+    await session.commit()
+    return released.rowcount
+
+
+async def delete_expired_jobs(session: AsyncSession, now: datetime) -> int:
+    """Delete finished jobs past their TTL and commit"""
+    deleted = await session.execute(delete(AIJobModel).where(AIJobModel.expires_at < now))
+    await session.commit()
+    return deleted.rowcount
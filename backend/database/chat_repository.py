@@ -1,108 +1,253 @@
 from datetime import datetime
 from uuid import uuid4
-from typing import List
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from models.chat import ChatMessage, ChatMessageCreate, MessageRole, ChatHistory
-from database.models import ChatMessage as ChatMessageModel, Session as SessionModel
-from database.connection import get_db
+from sqlalchemy import select, delete, update, true, or_
+from sqlalchemy.exc import IntegrityError
+from models.chat import ChatMessage, ChatMessageCreate, MessageRole, ChatHistory, ChatContext
+from database.models import (
+    ChatMessage as ChatMessageModel,
+    ChatSummary as ChatSummaryModel,
+    Session as SessionModel,
+    Topic as TopicModel,
+    Project as ProjectModel,
+)
 from exceptions import ValidationError, UnauthorizedAccessError
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def create_message(message_data: ChatMessageCreate, user_id: str, role: MessageRole) -> ChatMessage:
+async def _verify_session_owner(session: AsyncSession, session_id: str, user_id: str) -> SessionModel:
+    """Load learning session from the identity map (or DB) and verify ownership"""
+    session_model = await session.get(SessionModel, session_id)
+
+    if not session_model:
+        raise ValidationError(f"Session {session_id} not found")
+
+    if session_model.user_id != user_id:
+        raise UnauthorizedAccessError(f"session {session_id}")
+
+    return session_model
+
+
+async def create_message(session: AsyncSession, message_data: ChatMessageCreate, user_id: str, role: MessageRole) -> ChatMessage:
     """Create chat message"""
-    async for session in get_db():
-        # Verify session ownership
-        result = await session.execute(
-            select(SessionModel.user_id).where(SessionModel.id == str(message_data.session_id))
+    await _verify_session_owner(session, str(message_data.session_id), user_id)
+    return await store_message(session, str(message_data.session_id), role, message_data.content, datetime.now())
+
+
+async def store_message(session: AsyncSession, session_id: str, role: MessageRole, content: str,
+                        timestamp: datetime) -> ChatMessage:
+    """Insert one message of an already verified session and commit"""
+    message_model = ChatMessageModel(
+        id=str(uuid4()),
+        session_id=session_id,
+        role=role.value,
+        content=content,
+        timestamp=timestamp
+    )
+    session.add(message_model)
+    await session.commit()
+
+    return _model_to_message(message_model)
+
+
+async def get_chat_context(session: AsyncSession, session_id: str, user_id: str, limit: int = 10) -> Optional[ChatContext]:
+    """
+    Load everything /chat/message needs in one query: topic and project names of
+    the user's session, its rolling summary and the last `limit` messages not yet
+    folded into the summary. None if the session does not exist or is not the user's.
+    """
+    covered_until = (
+        select(ChatSummaryModel.covered_until)
+        .where(ChatSummaryModel.session_id == session_id)
+        .scalar_subquery()
+    )
+    recent = (
+        select(ChatMessageModel)
+        .where(
+            ChatMessageModel.session_id == session_id,
+            or_(covered_until.is_(None), ChatMessageModel.timestamp > covered_until),
         )
-        session_user_id = result.scalar_one_or_none()
-        
-        if not session_user_id:
-            raise ValidationError(f"Session {message_data.session_id} not found")
-        
-        if session_user_id != user_id:
-            raise UnauthorizedAccessError(f"session {message_data.session_id}")
-        
-        message_id = str(uuid4())
-        now = datetime.now()
-        
-        message_model = ChatMessageModel(
-            id=message_id,
-            session_id=str(message_data.session_id),
-            role=role.value,
-            content=message_data.content,
-            timestamp=now
+        .order_by(ChatMessageModel.timestamp.desc())
+        .limit(limit)
+        .subquery()
+    )
+    result = await session.execute(
+        select(
+            TopicModel.name.label("topic_name"),
+            ProjectModel.name.label("project_name"),
+            ChatSummaryModel.content.label("summary"),
+            recent.c.id,
+            recent.c.role,
+            recent.c.content,
+            recent.c.timestamp,
         )
-        session.add(message_model)
-        await session.commit()
-        await session.refresh(message_model)
-        
-        return ChatMessage(
-            id=message_model.id,
-            session_id=message_model.session_id,
-            role=MessageRole(message_model.role),
-            content=message_model.content,
-            timestamp=message_model.timestamp
+        .select_from(SessionModel)
+        .join(TopicModel, SessionModel.topic_id == TopicModel.id)
+        .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
+        .outerjoin(ChatSummaryModel, ChatSummaryModel.session_id == SessionModel.id)
+        .outerjoin(recent, true())
+        .where(
+            SessionModel.id == session_id,
+            SessionModel.user_id == user_id,
+            ProjectModel.user_id == user_id,
+        )
+        .order_by(recent.c.timestamp.asc())
+    )
+    rows = result.all()
+    if not rows:
+        return None
+    
+    history = [
+        ChatMessage(
+            id=row.id,
+            session_id=session_id,
+            role=MessageRole(row.role),
+            content=row.content,
+            timestamp=row.timestamp
         )
+        for row in rows if row.id is not None
+    ]
+    return ChatContext(
+        session_id=session_id,
+        topic_name=rows[0].topic_name,
+        project_name=rows[0].project_name,
+        summary=rows[0].summary,
+        history=history
+    )
 
 
-async def get_chat_history(session_id: str, user_id: str) -> ChatHistory:
-    """Get chat history for session"""
-    async for session in get_db():
-        # Verify session ownership
-        result = await session.execute(
-            select(SessionModel.user_id).where(SessionModel.id == session_id)
-        )
-        session_user_id = result.scalar_one_or_none()
-        
-        if not session_user_id:
-            raise ValidationError(f"Session {session_id} not found")
-        
-        if session_user_id != user_id:
-            raise UnauthorizedAccessError(f"session {session_id}")
-        
-        result = await session.execute(
-            select(ChatMessageModel)
-            .where(ChatMessageModel.session_id == session_id)
-            .order_by(ChatMessageModel.timestamp.asc())
-        )
-        message_models = result.scalars().all()
-        
-        messages = []
-        for message_model in message_models:
-            message = ChatMessage(
-                id=message_model.id,
-                session_id=message_model.session_id,
-                role=MessageRole(message_model.role),
-                content=message_model.content,
-                timestamp=message_model.timestamp
-            )
-            messages.append(message)
-        
-        return ChatHistory(session_id=session_id, messages=messages)
+async def create_exchange(session: AsyncSession, session_id: str, user_content: str, assistant_content: str,
+                          asked_at: datetime, answered_at: Optional[datetime] = None) -> ChatMessage:
+    """Store the user's question and the assistant's answer in one transaction; returns the answer"""
+    user_model = ChatMessageModel(
+        id=str(uuid4()),
+        session_id=session_id,
+        role=MessageRole.USER.value,
+        content=user_content,
+        timestamp=asked_at
+    )
+    assistant_model = ChatMessageModel(
+        id=str(uuid4()),
+        session_id=session_id,
+        role=MessageRole.ASSISTANT.value,
+        content=assistant_content,
+        timestamp=answered_at or datetime.now()
+    )
+    session.add_all([user_model, assistant_model])
+    await session.commit()
+    
+    return _model_to_message(assistant_model)
 
 
-async def delete_chat_history(session_id: str, user_id: str) -> bool:
-    """Delete chat history for session"""
-    async for session in get_db():
-        # Verify session ownership
-        result = await session.execute(
-            select(SessionModel.user_id).where(SessionModel.id == session_id)
-        )
-        session_user_id = result.scalar_one_or_none()
-        
-        if not session_user_id:
-            return False
-        
-        if session_user_id != user_id:
-            raise UnauthorizedAccessError(f"session {session_id}")
+async def get_chat_summary(session: AsyncSession, session_id: str) -> Optional[ChatSummaryModel]:
+    """Get session's rolling summary, if any"""
+    result = await session.execute(
+        select(ChatSummaryModel).where(ChatSummaryModel.session_id == session_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_unsummarized_messages(session: AsyncSession, session_id: str, after: Optional[datetime],
+                                    limit: int) -> List[ChatMessage]:
+    """Oldest `limit` messages newer than the summary, oldest first"""
+    query = select(ChatMessageModel).where(ChatMessageModel.session_id == session_id)
+    if after is not None:
+        query = query.where(ChatMessageModel.timestamp > after)
+    result = await session.execute(
+        query.order_by(ChatMessageModel.timestamp.asc()).limit(limit)
+    )
+    return [_model_to_message(model) for model in result.scalars().all()]
+
+
+async def save_chat_summary(session: AsyncSession, session_id: str, content: str, covered_until: datetime,
+                            messages_count: int, previous_until: Optional[datetime]) -> bool:
+    """
+    Store a new summary, provided it still extends the one it was built from
+    (previous_until; None = no summary yet). Returns False when another writer
+    got there first.
+    """
+    now = datetime.now()
+    try:
+        if previous_until is None:
+            session.add(ChatSummaryModel(
+                session_id=session_id,
+                content=content,
+                covered_until=covered_until,
+                messages_count=messages_count,
+                updated_at=now
+            ))
+            await session.commit()
+            return True
         
         result = await session.execute(
-            delete(ChatMessageModel).where(ChatMessageModel.session_id == session_id)
+            update(ChatSummaryModel)
+            .where(
+                ChatSummaryModel.session_id == session_id,
+                ChatSummaryModel.covered_until == previous_until,
+            )
+            .values(
+                content=content,
+                covered_until=covered_until,
+                messages_count=ChatSummaryModel.messages_count + messages_count,
+                updated_at=now
+            )
+            .execution_options(synchronize_session=False)
         )
         await session.commit()
-        
         return result.rowcount > 0
+    except IntegrityError:
+        # Session deleted meanwhile, or a concurrent first summary won
+        await session.rollback()
+        return False
+
+
+async def get_chat_history(session: AsyncSession, session_id: str, user_id: str) -> ChatHistory:
+    """Get chat history for session"""
+    await _verify_session_owner(session, session_id, user_id)
+
+    result = await session.execute(
+        select(ChatMessageModel)
+        .where(ChatMessageModel.session_id == session_id)
+        .order_by(ChatMessageModel.timestamp.asc())
+    )
+    message_models = result.scalars().all()
+
+    messages = []
+    for message_model in message_models:
+        messages.append(_model_to_message(message_model))
+
+    return ChatHistory(session_id=session_id, messages=messages)
+
+
+async def delete_chat_history(session: AsyncSession, session_id: str, user_id: str) -> bool:
+    """Delete chat history for session"""
+    session_model = await session.get(SessionModel, session_id)
+
+    if not session_model:
+        return False
+
+    if session_model.user_id != user_id:
+        raise UnauthorizedAccessError(f"session {session_id}")
+
+    await session.execute(
+        delete(ChatSummaryModel).where(ChatSummaryModel.session_id == session_id)
+    )
+    result = await session.execute(
+        delete(ChatMessageModel).where(ChatMessageModel.session_id == session_id)
+    )
+    await session.commit()
+
+    return result.rowcount > 0
+
+
+def _model_to_message(message_model: ChatMessageModel) -> ChatMessage:
+    """Convert SQLAlchemy model to ChatMessage object"""
+    return ChatMessage(
+        id=message_model.id,
+        session_id=message_model.session_id,
+        role=MessageRole(message_model.role),
+        content=message_model.content,
+        timestamp=message_model.timestamp
+    )
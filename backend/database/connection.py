@@ -1,21 +1,19 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from typing import AsyncGenerator
-from database.user_db import get_async_session, create_db_and_tables
+from database.user_db import get_async_session
+from database.migrations import run_migrations
 import logging
 import asyncio
 
 logger = logging.getLogger(__name__)
 
 async def init_db():
-    """Initialize database tables with retry logic"""
+    """Apply pending schema migrations with retry logic"""
     max_retries = 5
     retry_delay = 2
     
     for attempt in range(max_retries):
         try:
-            # Create all tables (users, projects, topics, sessions, chat_messages, subjects, client_logs)
-            await create_db_and_tables()
-            logger.info("Database tables created successfully")
+            applied = await run_migrations()
+            logger.info(f"Database schema up to date (applied migrations: {applied or 'none'})")
             return
         except Exception as e:
             if attempt < max_retries - 1:
@@ -25,7 +23,8 @@ async def init_db():
                 logger.error(f"Failed to initialize database after {max_retries} attempts: {e}", exc_info=True)
                 raise
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    """Get database session"""
-    async for session in get_async_session():
-        yield session
+# Request-scoped unit of work. FastAPI caches dependencies per request by
+# callable, so routers, repositories and fastapi-users (get_user_db) all share
+# one AsyncSession - one pooled connection and one identity map per request.
+# The session is closed deterministically when the request finishes.
+get_db = get_async_session
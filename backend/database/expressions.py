@@ -0,0 +1,70 @@
+"""
+Dialect-specific SQL expressions used by the repositories.
+
+Timestamps are naive local datetimes stored at whole-second resolution
+(MySQL DATETIME), so date arithmetic happens in whole seconds on every dialect.
+"""
+
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class seconds_between(FunctionElement):
+    """Whole seconds from the first to the second timestamp expression"""
+    type = Integer()
+    name = "seconds_between"
+    inherit_cache = True
+
+
+@compiles(seconds_between)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    # SQLite: strftime('%s') gives whole seconds since epoch of the (naive) timestamp
+    epoch = lambda value: cast(func.strftime("%s", value), Integer)
+    return compiler.process((epoch(end) - epoch(start)).self_group(), **kw)
+
+
+@compiles(seconds_between, "mysql")
+def _seconds_between_mysql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "TIMESTAMPDIFF(SECOND, %s, %s)" % (compiler.process(start, **kw), compiler.process(end, **kw))
+
+
+class days_between(FunctionElement):
+    """Whole days from the first to the second timestamp expression (truncated toward zero)"""
+    type = Integer()
+    name = "days_between"
+    inherit_cache = True
+
+
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    start, end = list(element.clauses)
+    # Integer operands: SQLite's / is integer division
+    return compiler.process((seconds_between(start, end) // 86400).self_group(), **kw)
+
+
+@compiles(days_between, "mysql")
+def _days_between_mysql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return "TIMESTAMPDIFF(DAY, %s, %s)" % (compiler.process(start, **kw), compiler.process(end, **kw))
+
+
+class day_number(FunctionElement):
+    """Whole-day ordinal of a date expression (consecutive days differ by 1)"""
+    type = Integer()
+    name = "day_number"
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _day_number_default(element, compiler, **kw):
+    (day,) = list(element.clauses)
+    return compiler.process(cast(func.julianday(day), Integer), **kw)
+
+
+@compiles(day_number, "mysql")
+def _day_number_mysql(element, compiler, **kw):
+    (day,) = list(element.clauses)
+    return "TO_DAYS(%s)" % compiler.process(day, **kw)
@@ -0,0 +1,30 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def advisory_lock(conn: AsyncConnection, name: str, timeout: int = 0) -> AsyncIterator[bool]:
+    """
+    Named, connection-scoped lock shared by all workers using the same database.
+
+    Yields True when the lock was acquired. On MySQL this is GET_LOCK/RELEASE_LOCK;
+    other dialects (SQLite in development) run a single process, so the lock is a no-op.
+    """
+    if conn.dialect.name != "mysql":
+        yield True
+        return
+
+    result = await conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout})
+    acquired = result.scalar() == 1
+    if not acquired:
+        logger.info(f"Advisory lock {name} is held by another worker")
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            await conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
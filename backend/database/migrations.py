@@ -0,0 +1,231 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once, in order, and is recorded in the schema_migrations
+table. init_db applies pending migrations at startup; they can also be run by hand:
+
+    python -m database.migrations upgrade
+    python -m database.migrations status
+
+Migrations must be idempotent (checkfirst / inspector checks), because MySQL DDL
+is not transactional and a crash can leave a migration applied but unrecorded.
+"""
+
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import Index, insert, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from database.user_db import Base, User, engine as default_engine
+from database.models import (
+    Project,
+    Topic,
+    Session,
+    ChatMessage,
+    ChatSummary,
+    AIJob,
+    Subject,
+    ClientLog,
+    UserStats,
+    ProjectStats,
+    DailyStudyStats,
+    SessionEvent,
+    SchemaMigration,
+)
+from database.locks import advisory_lock
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_NAME = "focusflow_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+
+
+async def _create_tables(conn: AsyncConnection, *models) -> None:
+    tables = [model.__table__ for model in models]
+    await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=tables, checkfirst=True))
+
+
+async def _create_indexes(conn: AsyncConnection, *indexes: Index) -> None:
+    def _create(sync_conn):
+        inspector = inspect(sync_conn)
+        for index in indexes:
+            existing = {ix["name"] for ix in inspector.get_indexes(index.table.name)}
+            if index.name not in existing:
+                logger.info(f"Tworzenie indeksu {index.name}")
+                index.create(sync_conn)
+
+    await conn.run_sync(_create)
+
+
+async def _add_columns(conn: AsyncConnection, model, *names: str) -> None:
+    table = model.__table__
+
+    def _add(sync_conn):
+        existing = {column["name"] for column in inspect(sync_conn).get_columns(table.name)}
+        for name in names:
+            if name not in existing:
+                logger.info(f"Dodawanie kolumny {table.name}.{name}")
+                column_ddl = CreateColumn(table.c[name]).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+
+    await conn.run_sync(_add)
+
+
+def _index(model, name: str) -> Index:
+    return next(ix for ix in model.__table__.indexes if ix.name == name)
+
+
+async def _m0001_initial_schema(conn: AsyncConnection) -> None:
+    await _create_tables(conn, User, Project, Topic, Session, ChatMessage, Subject, ClientLog)
+
+
+async def _m0002_hot_path_indexes(conn: AsyncConnection) -> None:
+    await _create_indexes(
+        conn,
+        _index(Session, "ix_sessions_user_id_completed"),
+        _index(Session, "ix_sessions_topic_id"),
+        _index(Topic, "ix_topics_project_id_priority_score"),
+        _index(ChatMessage, "ix_chat_messages_session_id_timestamp"),
+        _index(Project, "ix_projects_user_id_created_at"),
+    )
+
+
+async def _m0003_materialized_stats(conn: AsyncConnection) -> None:
+    from database.stats_repository import (
+        USER_STATS_COLUMNS, PROJECT_STATS_COLUMNS, user_stats_source, project_stats_source,
+    )
+
+    await _create_tables(conn, UserStats, ProjectStats)
+    # Backfill in one set-based statement per table; rows that already exist came
+    # from a previous, unrecorded run of this migration
+    await conn.execute(UserStats.__table__.delete())
+    await conn.execute(ProjectStats.__table__.delete())
+    await conn.execute(
+        insert(UserStats).from_select(["user_id", *USER_STATS_COLUMNS], user_stats_source())
+    )
+    await conn.execute(
+        insert(ProjectStats).from_select(["project_id", "user_id", *PROJECT_STATS_COLUMNS], project_stats_source())
+    )
+
+
+async def _m0004_daily_study_stats(conn: AsyncConnection) -> None:
+    from database.stats_repository import daily_study_source
+
+    await _create_tables(conn, DailyStudyStats)
+    await conn.execute(DailyStudyStats.__table__.delete())
+    await conn.execute(
+        insert(DailyStudyStats).from_select(
+            ["user_id", "project_id", "topic_id", "day", "study_time", "sessions_completed"],
+            daily_study_source(),
+        )
+    )
+
+
+async def _m0005_session_events(conn: AsyncConnection) -> None:
+    # No backfill: pause/resume history of older sessions was never stored.
+    # Their timeline falls back to sessions.duration.
+    await _create_tables(conn, SessionEvent)
+
+
+async def _m0006_project_priority_days(conn: AsyncConnection) -> None:
+    # NULL = never refreshed; the priority scheduler picks these up first
+    await _add_columns(conn, Project, "priority_days")
+
+
+async def _m0007_chat_summaries(conn: AsyncConnection) -> None:
+    # Existing chats get summarized the next time someone writes in them
+    await _create_tables(conn, ChatSummary)
+
+
+async def _m0008_ai_jobs(conn: AsyncConnection) -> None:
+    await _create_tables(conn, AIJob)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial_schema", _m0001_initial_schema),
+    Migration(2, "hot_path_indexes", _m0002_hot_path_indexes),
+    Migration(3, "materialized_stats", _m0003_materialized_stats),
+    Migration(4, "daily_study_stats", _m0004_daily_study_stats),
+    Migration(5, "session_events", _m0005_session_events),
+    Migration(6, "project_priority_days", _m0006_project_priority_days),
+    Migration(7, "chat_summaries", _m0007_chat_summaries),
+    Migration(8, "ai_jobs", _m0008_ai_jobs),
+]
+
+
+async def _applied_versions(conn: AsyncConnection) -> set:
+    await _create_tables(conn, SchemaMigration)
+    await conn.commit()
+    result = await conn.execute(select(SchemaMigration.version))
+    return set(result.scalars().all())
+
+
+async def run_migrations(engine: Optional[AsyncEngine] = None) -> List[int]:
+    """Apply pending migrations in order. Returns the versions applied by this call."""
+    engine = engine or default_engine
+    applied_now = []
+
+    async with engine.connect() as conn:
+        async with advisory_lock(conn, MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT) as acquired:
+            if not acquired:
+                raise RuntimeError("Nie udało się uzyskać blokady migracji")
+
+            applied = await _applied_versions(conn)
+            for migration in MIGRATIONS:
+                if migration.version in applied:
+                    continue
+
+                logger.info(f"Migracja {migration.version:04d}_{migration.name}")
+                await migration.upgrade(conn)
+                await conn.execute(
+                    insert(SchemaMigration).values(
+                        version=migration.version,
+                        name=migration.name,
+                        applied_at=datetime.now(),
+                    )
+                )
+                await conn.commit()
+                applied_now.append(migration.version)
+
+    return applied_now
+
+
+async def migration_status(engine: Optional[AsyncEngine] = None) -> List[dict]:
+    engine = engine or default_engine
+    async with engine.connect() as conn:
+        applied = await _applied_versions(conn)
+    return [
+        {"version": m.version, "name": m.name, "applied": m.version in applied}
+        for m in MIGRATIONS
+    ]
+
+
+async def _main(command: str) -> None:
+    if command == "upgrade":
+        applied = await run_migrations()
+        print(f"Zastosowano migracje: {applied}" if applied else "Schemat jest aktualny")
+    else:
+        for row in await migration_status():
+            print(f"{row['version']:04d}  {'applied' if row['applied'] else 'pending':8}  {row['name']}")
+    await default_engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="FocusFlow schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status"], nargs="?", default="upgrade")
+    args = parser.parse_args()
+    asyncio.run(_main(args.command))
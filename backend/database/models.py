@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, BigInteger, Float, Boolean, Date, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database.user_db import Base
@@ -16,9 +16,15 @@ class Project(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     progress = Column(Float, default=0.0)
     completed = Column(Boolean, default=False)
+    # Days-to-deadline bucket the topics' priority_score was computed for (see services/priority_scheduler.py)
+    priority_days = Column(Integer, nullable=True)
     
     # Relationships
     topics = relationship("Topic", back_populates="project", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_projects_user_id_created_at", "user_id", "created_at"),
+    )
 
 
 class Topic(Base):
@@ -36,6 +42,10 @@ class Topic(Base):
     # Relationships
     project = relationship("Project", back_populates="topics")
     sessions = relationship("Session", back_populates="topic", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_topics_project_id_priority_score", "project_id", "priority_score"),
+    )
 
 
 class Session(Base):
@@ -56,6 +66,25 @@ class Session(Base):
     # Relationships
     topic = relationship("Topic", back_populates="sessions")
     chat_messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_sessions_user_id_completed", "user_id", "completed"),
+        Index("ix_sessions_topic_id", "topic_id"),
+    )
+
+
+class SessionEvent(Base):
+    """Append-only session history: start, pause, resume, stuck, complete"""
+    __tablename__ = "session_events"
+    __table_args__ = (
+        Index("ix_session_events_session_id_created_at", "session_id", "created_at"),
+    )
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    type = Column(String(20), nullable=False)
+    created_at = Column(DateTime, nullable=False)
 
 
 class ChatMessage(Base):
@@ -69,6 +98,49 @@ class ChatMessage(Base):
     
     # Relationships
     session = relationship("Session", back_populates="chat_messages")
+    
+    __table_args__ = (
+        Index("ix_chat_messages_session_id_timestamp", "session_id", "timestamp"),
+    )
+
+
+class ChatSummary(Base):
+    """Rolling summary of a session's older chat messages (see services/chat_summarizer.py)"""
+    __tablename__ = "chat_summaries"
+    
+    session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    content = Column(Text, nullable=False)
+    # Messages up to and including this timestamp are folded into content
+    covered_until = Column(DateTime, nullable=False)
+    messages_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class AIJob(Base):
+    """Queued AI generation (see services/ai_jobs.py)"""
+    __tablename__ = "ai_jobs"
+    __table_args__ = (
+        Index("ix_ai_jobs_status_available_at", "status", "available_at"),
+        Index("ix_ai_jobs_expires_at", "expires_at"),
+    )
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid4()))
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False)
+    # JSON: messages, model, timeout, bypass_cache
+    request = Column(Text, nullable=False)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    error_status = Column(Integer, nullable=True)  # HTTP status the error maps to
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(100), nullable=True)
+    # queued: not to be claimed before; running: lease, after it the job is claimable again
+    available_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Finished jobs are deleted after this
+    expires_at = Column(DateTime, nullable=True)
 
 
 class Subject(Base):
@@ -93,3 +165,51 @@ class ClientLog(Base):
     client_ip = Column(String(50), nullable=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
+
+
+class UserStats(Base):
+    """Incrementally maintained per-user totals (see database/stats_repository.py)"""
+    __tablename__ = "user_stats"
+    
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_sessions = Column(Integer, nullable=False, default=0)
+    completed_sessions = Column(Integer, nullable=False, default=0)
+    total_study_time = Column(Integer, nullable=False, default=0)
+    total_projects = Column(Integer, nullable=False, default=0)
+    total_topics = Column(Integer, nullable=False, default=0)
+
+
+class ProjectStats(Base):
+    """Incrementally maintained per-project totals (see database/stats_repository.py)"""
+    __tablename__ = "project_stats"
+    
+    project_id = Column(String(36), ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    total_sessions = Column(Integer, nullable=False, default=0)
+    completed_sessions = Column(Integer, nullable=False, default=0)
+    total_study_time = Column(Integer, nullable=False, default=0)
+    topics_count = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Integer, nullable=False, default=0)
+
+
+class DailyStudyStats(Base):
+    """Study time per (user, project, topic, day), fed when a session completes"""
+    __tablename__ = "daily_study_stats"
+    __table_args__ = (
+        Index("ix_daily_study_stats_user_id_day", "user_id", "day"),
+    )
+    
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    project_id = Column(String(36), ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    topic_id = Column(String(36), ForeignKey("topics.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    study_time = Column(Integer, nullable=False, default=0)  # seconds
+    sessions_completed = Column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=False)
+    applied_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -2,94 +2,122 @@ from datetime import datetime
 from uuid import uuid4
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, update
+from sqlalchemy import select, delete, update, func, Update
 from sqlalchemy.orm import selectinload
 from models.project import Project, ProjectCreate, ProjectUpdate
 from models.topic import Topic
-from database.models import Project as ProjectModel, Topic as TopicModel
-from database.connection import get_db
-from services.priority_service import calculate_priority, calculate_days_to_deadline
+from database.models import Project as ProjectModel, Topic as TopicModel, ProjectStats as ProjectStatsModel
+from database import stats_repository
+from services.priority_service import (
+    calculate_priority,
+    days_to_deadline_at,
+    days_to_deadline_expression,
+    priority_expression,
+)
 from exceptions import ProjectNotFoundError, UnauthorizedAccessError, ValidationError
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def create_project(project_data: ProjectCreate, user_id: str) -> Project:
+async def create_project(session: AsyncSession, project_data: ProjectCreate, user_id: str) -> Project:
     """Tworzy nowy projekt"""
     
     project_id = str(uuid4())
-    now = datetime.now()
-    
-    async for session in get_db():
-        project_model = ProjectModel(
-            id=project_id,
-            user_id=user_id,
-            name=project_data.name,
-            subject=project_data.subject,
-            deadline=project_data.deadline,
-            created_at=now
+    now = datetime.now().replace(microsecond=0)
+    # Bazy przechowują czas lokalny bez strefy, z dokładnością do sekundy
+    deadline = project_data.deadline.replace(tzinfo=None, microsecond=0)
+    
+    # Nowe tematy: confidence_level = 1, stuck_count = 0, więc priorytet jest wspólny;
+    # dni liczone jak w topic_priorities_update, żeby późniejsze przeliczenie dało ten sam wynik
+    days_to_deadline = days_to_deadline_at(deadline, now)
+    priority = calculate_priority(1, 0, days_to_deadline)
+    
+    project_model = ProjectModel(
+        id=project_id,
+        user_id=user_id,
+        name=project_data.name,
+        subject=project_data.subject,
+        deadline=deadline,
+        created_at=now,
+        progress=0.0,
+        completed=False,
+        priority_days=days_to_deadline
+    )
+    session.add(project_model)
+    
+    topic_models = []
+    for topic_name in project_data.topics:
+        topic_model = TopicModel(
+            id=str(uuid4()),
+            project_id=project_id,
+            name=topic_name,
+            confidence_level=1,
+            priority_score=priority,
+            stuck_count=0,
+            created_at=now,
+            completed=False
         )
-        session.add(project_model)
-        
-        for topic_name in project_data.topics:
-            topic_id = str(uuid4())
-            topic_model = TopicModel(
-                id=topic_id,
-                project_id=project_id,
-                name=topic_name,
-                created_at=now
-            )
-            session.add(topic_model)
-        
-        await session.commit()
-        break
+        session.add(topic_model)
+        topic_models.append(topic_model)
+    
+    topics_count = len(topic_models)
+    session.add(ProjectStatsModel(
+        project_id=project_id,
+        user_id=user_id,
+        total_sessions=0,
+        completed_sessions=0,
+        total_study_time=0,
+        topics_count=topics_count,
+        confidence_sum=topics_count,  # nowe tematy mają confidence_level = 1
+    ))
+    await stats_repository.apply_user_delta(session, user_id, total_projects=1, total_topics=topics_count)
+    await session.commit()
     
-    await update_priorities(project_id)
-    return await get_project(project_id, user_id)
+    # Wszystko jest już w pamięci; nie ma potrzeby ponownego odczytu
+    return _build_project(project_model, topic_models)
 
 
-async def get_all_projects(user_id: str) -> List[Project]:
+async def get_all_projects(session: AsyncSession, user_id: str) -> List[Project]:
     """Pobiera wszystkie projekty użytkownika"""
-    async for session in get_db():
-        result = await session.execute(
-            select(ProjectModel)
-            .where(ProjectModel.user_id == user_id)
-            .options(selectinload(ProjectModel.topics))
-            .order_by(ProjectModel.created_at.desc())
-        )
-        project_models = result.scalars().all()
-        
-        projects = []
-        for project_model in project_models:
-            projects.append(await _model_to_project(project_model))
-        
-        return projects
+    result = await session.execute(
+        select(ProjectModel)
+        .where(ProjectModel.user_id == user_id)
+        .options(selectinload(ProjectModel.topics))
+        .order_by(ProjectModel.created_at.desc())
+    )
+    project_models = result.scalars().all()
+    
+    projects = []
+    for project_model in project_models:
+        projects.append(await _model_to_project(project_model))
+    
+    return projects
 
 
-async def get_project(project_id: str, user_id: str = None) -> Optional[Project]:
+async def get_project(session: AsyncSession, project_id: str, user_id: str = None) -> Optional[Project]:
     """Pobiera projekt po ID z opcjonalną walidacją użytkownika"""
-    async for session in get_db():
-        query = select(ProjectModel).where(ProjectModel.id == project_id)
-        if user_id:
-            query = query.where(ProjectModel.user_id == user_id)
-        
-        query = query.options(selectinload(ProjectModel.topics))
-        result = await session.execute(query)
-        project_model = result.scalar_one_or_none()
-        
-        if not project_model:
-            return None
-        
-        if user_id and project_model.user_id != user_id:
-            raise UnauthorizedAccessError(f"project {project_id}")
-        
-        return await _model_to_project(project_model)
-
-
-async def update_project(project_id: str, update_data: ProjectUpdate, user_id: str) -> Optional[Project]:
+    query = select(ProjectModel).where(ProjectModel.id == project_id)
+    if user_id:
+        query = query.where(ProjectModel.user_id == user_id)
+    
+    # populate_existing refreshes topics already held in the request's identity map
+    query = query.options(selectinload(ProjectModel.topics)).execution_options(populate_existing=True)
+    result = await session.execute(query)
+    project_model = result.scalar_one_or_none()
+    
+    if not project_model:
+        return None
+    
+    if user_id and project_model.user_id != user_id:
+        raise UnauthorizedAccessError(f"project {project_id}")
+    
+    return await _model_to_project(project_model)
+
+
+async def update_project(session: AsyncSession, project_id: str, update_data: ProjectUpdate, user_id: str) -> Optional[Project]:
     """Aktualizuje projekt z walidacją użytkownika"""
-    existing_project = await get_project(project_id, user_id)
+    existing_project = await get_project(session, project_id, user_id)
     if not existing_project:
         raise ProjectNotFoundError(project_id)
     
@@ -104,73 +132,117 @@ async def update_project(project_id: str, update_data: ProjectUpdate, user_id: s
     if not safe_updates:
         return existing_project
     
-    async for session in get_db():
-        stmt = (
-            update(ProjectModel)
-            .where(ProjectModel.id == project_id)
-            .where(ProjectModel.user_id == user_id)
-            .values(**safe_updates)
-        )
-        await session.execute(stmt)
-        await session.commit()
-        break
+    stmt = (
+        update(ProjectModel)
+        .where(ProjectModel.id == project_id)
+        .where(ProjectModel.user_id == user_id)
+        .values(**safe_updates)
+    )
+    await session.execute(stmt)
     
-    await update_priorities(project_id)
-    return await get_project(project_id, user_id)
+    if 'deadline' in safe_updates:
+        await update_priorities(session, project_id)
+    else:
+        await session.commit()
+    return await get_project(session, project_id, user_id)
 
 
-async def delete_project(project_id: str, user_id: str) -> bool:
+async def delete_project(session: AsyncSession, project_id: str, user_id: str) -> bool:
     """Usuwa projekt z walidacją użytkownika"""
-    existing_project = await get_project(project_id, user_id)
-    if not existing_project:
+    result = await session.execute(
+        select(ProjectModel.id).where(
+            ProjectModel.id == project_id,
+            ProjectModel.user_id == user_id
+        )
+    )
+    if not result.scalar_one_or_none():
         raise ProjectNotFoundError(project_id)
     
-    async for session in get_db():
-        await session.execute(
-            delete(TopicModel).where(TopicModel.project_id == project_id)
-        )
-        
-        result = await session.execute(
-            delete(ProjectModel)
-            .where(ProjectModel.id == project_id)
-            .where(ProjectModel.user_id == user_id)
-        )
-        await session.commit()
-        
-        return result.rowcount > 0
+    # Topics and their sessions disappear with the project; take their counters off user_stats
+    removed = await stats_repository.get_project_session_totals(session, project_id, user_id)
+    topics_count = (await session.execute(
+        select(func.count(TopicModel.id)).where(TopicModel.project_id == project_id)
+    )).scalar()
+    
+    await session.execute(
+        delete(TopicModel).where(TopicModel.project_id == project_id)
+    )
+    await session.execute(
+        delete(ProjectStatsModel).where(ProjectStatsModel.project_id == project_id)
+    )
+    await stats_repository.apply_user_delta(
+        session, user_id,
+        total_projects=-1,
+        total_topics=-topics_count,
+        **{name: -value for name, value in removed.items()},
+    )
+    
+    result = await session.execute(
+        delete(ProjectModel)
+        .where(ProjectModel.id == project_id)
+        .where(ProjectModel.user_id == user_id)
+    )
+    await session.commit()
+    
+    return result.rowcount > 0
 
 
-async def update_priorities(project_id: str):
-    """Aktualizuje priorytety tematów projektu"""
-    async for session in get_db():
-        result = await session.execute(
-            select(ProjectModel.deadline).where(ProjectModel.id == project_id)
-        )
-        deadline_row = result.scalar_one_or_none()
-        if not deadline_row:
-            return
-        
-        deadline = deadline_row
-        days_to_deadline = calculate_days_to_deadline(deadline)
-        
-        result = await session.execute(
-            select(TopicModel)
-            .where(TopicModel.project_id == project_id)
-        )
-        topics = result.scalars().all()
-        
-        for topic in topics:
-            priority = calculate_priority(topic.confidence_level, topic.stuck_count, days_to_deadline)
-            topic.priority_score = priority
-        
-        await session.commit()
-        break
+async def update_priorities(session: AsyncSession, project_id: str, now: Optional[datetime] = None):
+    """Aktualizuje priorytety tematów projektu jednym UPDATE"""
+    now = now or datetime.now().replace(microsecond=0)
+    await session.execute(topic_priorities_update(now, TopicModel.project_id == project_id))
+    await session.execute(
+        update(ProjectModel)
+        .where(ProjectModel.id == project_id)
+        .values(priority_days=days_to_deadline_expression(ProjectModel.deadline, now))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def update_user_priorities(session: AsyncSession, user_id: str, now: Optional[datetime] = None):
+    """Aktualizuje priorytety tematów wszystkich projektów użytkownika jednym UPDATE"""
+    now = now or datetime.now().replace(microsecond=0)
+    user_projects = select(ProjectModel.id).where(ProjectModel.user_id == user_id)
+    await session.execute(topic_priorities_update(now, TopicModel.project_id.in_(user_projects)))
+    await session.execute(
+        update(ProjectModel)
+        .where(ProjectModel.user_id == user_id)
+        .values(priority_days=days_to_deadline_expression(ProjectModel.deadline, now))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+def topic_priorities_update(now: datetime, *criteria) -> Update:
+    """UPDATE topics SET priority_score = calculate_priority(...) computed in SQL, for topics matching criteria"""
+    deadline = (
+        select(ProjectModel.deadline)
+        .where(ProjectModel.id == TopicModel.project_id)
+        .correlate(TopicModel)
+        .scalar_subquery()
+    )
+    return (
+        update(TopicModel)
+        .where(*criteria)
+        .values(priority_score=priority_expression(
+            TopicModel.confidence_level,
+            func.coalesce(TopicModel.stuck_count, 0),
+            days_to_deadline_expression(deadline, now),
+        ))
+        .execution_options(synchronize_session=False)
+    )
 
 
 async def _model_to_project(project_model: ProjectModel) -> Project:
     """Konwertuje model SQLAlchemy do obiektu Project"""
+    return _build_project(project_model, project_model.topics)
+
+
+def _build_project(project_model: ProjectModel, topic_models) -> Project:
+    """Buduje obiekt Project z modelu projektu i jego tematów"""
     topics = []
-    for topic_model in project_model.topics:
+    for topic_model in topic_models:
         topic = Topic(
             id=topic_model.id,
             project_id=topic_model.project_id,
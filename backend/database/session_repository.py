@@ -1,199 +1,294 @@
 from datetime import datetime
 from uuid import uuid4
-from typing import Optional
+from typing import Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from models.session import Session, SessionStart, SessionStatus, SessionStatusResponse
-from database.models import Session as SessionModel, Topic as TopicModel, Project as ProjectModel
-from database.connection import get_db
-from exceptions import ValidationError, UnauthorizedAccessError
+from sqlalchemy import select, update, insert, func, literal, bindparam, Integer, Row
+from models.session import Session, SessionStart, SessionStatus, SessionStatusResponse, SessionEventType
+from database.models import (
+    Session as SessionModel,
+    SessionEvent as SessionEventModel,
+    Topic as TopicModel,
+    Project as ProjectModel,
+)
+from database import stats_repository
+from database.expressions import seconds_between
+from exceptions import ValidationError, UnauthorizedAccessError, ConflictError
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def start_session(session_data: SessionStart, user_id: str) -> Session:
+# Start of the current active stretch: the last resume, or the start
+ACTIVE_SINCE = func.coalesce(SessionModel.resume_time, SessionModel.start_time)
+
+async def start_session(session: AsyncSession, session_data: SessionStart, user_id: str) -> Session:
     """Start new learning session"""
-    async for session in get_db():
-        # Verify topic ownership
-        result = await session.execute(
-            select(ProjectModel.user_id)
-            .join(TopicModel, TopicModel.project_id == ProjectModel.id)
-            .where(TopicModel.id == str(session_data.topic_id))
-        )
-        project_user_id = result.scalar_one_or_none()
-        
-        if not project_user_id:
-            raise ValidationError(f"Topic {session_data.topic_id} not found")
-        
-        if project_user_id != user_id:
-            raise UnauthorizedAccessError(f"topic {session_data.topic_id}")
-        
-        session_id = str(uuid4())
-        now = datetime.now()
-        
-        session_model = SessionModel(
-            id=session_id,
-            topic_id=str(session_data.topic_id),
-            user_id=user_id,
-            status=SessionStatus.ACTIVE.value,
-            start_time=now,
-            duration=0,
-            stuck_moments=0,
-            completed=False
-        )
-        session.add(session_model)
-        await session.commit()
-        await session.refresh(session_model)
-        
-        return await get_session(session_id, user_id)
+    # Verify topic ownership
+    result = await session.execute(
+        select(ProjectModel.user_id, ProjectModel.id)
+        .join(TopicModel, TopicModel.project_id == ProjectModel.id)
+        .where(TopicModel.id == str(session_data.topic_id))
+    )
+    project_user_id, project_id = result.one_or_none() or (None, None)
+    
+    if not project_user_id:
+        raise ValidationError(f"Topic {session_data.topic_id} not found")
+    
+    if project_user_id != user_id:
+        raise UnauthorizedAccessError(f"topic {session_data.topic_id}")
+    
+    session_id = str(uuid4())
+    now = _now()
+    
+    session_model = SessionModel(
+        id=session_id,
+        topic_id=str(session_data.topic_id),
+        user_id=user_id,
+        status=SessionStatus.ACTIVE.value,
+        start_time=now,
+        duration=0,
+        stuck_moments=0,
+        completed=False
+    )
+    session.add(session_model)
+    await record_event(session, session_id, user_id, SessionEventType.START, now)
+    await stats_repository.apply_session_delta(session, user_id, project_id, total_sessions=1)
+    await session.commit()
+    
+    return _model_to_session(session_model)
 
 
-async def pause_session(session_id: str, user_id: str) -> Session:
+async def pause_session(session: AsyncSession, session_id: str, user_id: str) -> Optional[Session]:
     """Pause active session"""
-    session_obj = await get_session(session_id, user_id)
-    if not session_obj:
-        raise ValidationError(f"Session {session_id} not found")
+    now = _now()
+    elapsed = seconds_between(ACTIVE_SINCE, now)
+    row = await _transition(session, session_id, user_id, SessionStatus.ACTIVE, {
+        "status": SessionStatus.PAUSED.value,
+        "pause_time": now,
+        "duration": SessionModel.duration + elapsed,
+    }, elapsed)
+    if row is None:
+        return await _transition_failed(session, session_id, user_id, "paused")
     
-    if session_obj.status != SessionStatus.ACTIVE:
-        raise ValidationError(f"Session is not active")
+    await record_event(session, session_id, user_id, SessionEventType.PAUSE, now)
+    await stats_repository.apply_session_delta(session, user_id, row.project_id, total_study_time=row.elapsed)
+    await session.commit()
     
-    async for session in get_db():
-        result = await session.execute(
-            select(SessionModel).where(
-                SessionModel.id == session_id,
-                SessionModel.user_id == user_id
-            )
-        )
-        session_model = result.scalar_one_or_none()
-        if not session_model:
-            raise ValidationError(f"Session {session_id} not found")
-        
-        now = datetime.now()
-        
-        # Calculate duration up to pause
-        start_time = session_model.start_time
-        pause_time = now
-        duration = session_model.duration + int((pause_time - start_time).total_seconds())
-        
-        session_model.status = SessionStatus.PAUSED.value
-        session_model.pause_time = now
-        session_model.duration = duration
-        
-        await session.commit()
-        await session.refresh(session_model)
-        break
-    
-    return await get_session(session_id, user_id)
-
-
-async def resume_session(session_id: str, user_id: str) -> Session:
+    return _model_to_session(row)
+
+
+async def resume_session(session: AsyncSession, session_id: str, user_id: str) -> Optional[Session]:
     """Resume paused session"""
-    session_obj = await get_session(session_id, user_id)
-    if not session_obj:
-        raise ValidationError(f"Session {session_id} not found")
+    now = _now()
+    row = await _transition(session, session_id, user_id, SessionStatus.PAUSED, {
+        "status": SessionStatus.ACTIVE.value,
+        "resume_time": now,
+    }, literal(0, Integer))
+    if row is None:
+        return await _transition_failed(session, session_id, user_id, "resumed")
     
-    if session_obj.status != SessionStatus.PAUSED:
-        raise ValidationError(f"Session is not paused")
+    await record_event(session, session_id, user_id, SessionEventType.RESUME, now)
+    await session.commit()
     
-    async for session in get_db():
-        result = await session.execute(
-            select(SessionModel).where(
-                SessionModel.id == session_id,
-                SessionModel.user_id == user_id
-            )
-        )
-        session_model = result.scalar_one_or_none()
-        if not session_model:
-            raise ValidationError(f"Session {session_id} not found")
-        
-        now = datetime.now()
-        
-        session_model.status = SessionStatus.ACTIVE.value
-        session_model.resume_time = now
-        
-        await session.commit()
-        await session.refresh(session_model)
-        break
-    
-    return await get_session(session_id, user_id)
-
-
-async def complete_session(session_id: str, user_id: str) -> Session:
+    return _model_to_session(row)
+
+
+async def complete_session(session: AsyncSession, session_id: str, user_id: str) -> Optional[Session]:
     """Complete session"""
-    session_obj = await get_session(session_id, user_id)
-    if not session_obj:
-        raise ValidationError(f"Session {session_id} not found")
+    now = _now()
+    elapsed = seconds_between(ACTIVE_SINCE, now)
+    done = {
+        "status": SessionStatus.COMPLETED.value,
+        "end_time": now,
+        "completed": True,
+    }
+    row = await _transition(session, session_id, user_id, SessionStatus.ACTIVE, {
+        **done,
+        "duration": SessionModel.duration + elapsed,
+    }, elapsed)
+    if row is None:
+        # A paused session has already banked its time
+        row = await _transition(session, session_id, user_id, SessionStatus.PAUSED, done, literal(0, Integer))
+    if row is None:
+        return await _transition_failed(session, session_id, user_id, "completed")
     
-    if session_obj.status == SessionStatus.COMPLETED:
-        raise ValidationError(f"Session already completed")
+    await record_event(session, session_id, user_id, SessionEventType.COMPLETE, now)
+    await stats_repository.apply_session_delta(
+        session, user_id, row.project_id, completed_sessions=1, total_study_time=row.elapsed
+    )
+    await stats_repository.record_study_day(
+        session, user_id, row.project_id, row.topic_id, now.date(), row.duration
+    )
+    await session.commit()
     
-    async for session in get_db():
-        result = await session.execute(
-            select(SessionModel).where(
-                SessionModel.id == session_id,
-                SessionModel.user_id == user_id
-            )
+    return _model_to_session(row)
+
+
+async def record_event(session: AsyncSession, session_id: str, user_id: str,
+                       event_type: SessionEventType, at: datetime):
+    """Append one session event, in the caller's transaction"""
+    await session.execute(
+        insert(SessionEventModel).values(
+            session_id=session_id,
+            user_id=user_id,
+            type=event_type.value,
+            created_at=at,
         )
-        session_model = result.scalar_one_or_none()
-        if not session_model:
-            raise ValidationError(f"Session {session_id} not found")
-        
-        now = datetime.now()
-        
-        # Calculate final duration
-        start_time = session_model.start_time
-        end_time = now
-        duration = session_model.duration
-        
-        if session_model.status == SessionStatus.ACTIVE.value:
-            duration += int((end_time - start_time).total_seconds())
-        
-        session_model.status = SessionStatus.COMPLETED.value
-        session_model.end_time = now
-        session_model.duration = duration
-        session_model.completed = True
-        
-        await session.commit()
-        await session.refresh(session_model)
-        break
-    
-    return await get_session(session_id, user_id)
-
-
-async def get_session(session_id: str, user_id: str) -> Optional[Session]:
-    """Get session by ID"""
-    async for session in get_db():
-        result = await session.execute(
-            select(SessionModel).where(
-                SessionModel.id == session_id,
-                SessionModel.user_id == user_id
-            )
+    )
+
+
+async def get_session_events(session: AsyncSession, session_id: str, user_id: str) -> List[SessionEventModel]:
+    """Session events in the order they happened"""
+    result = await session.execute(
+        select(SessionEventModel)
+        .where(SessionEventModel.session_id == session_id, SessionEventModel.user_id == user_id)
+        .order_by(SessionEventModel.created_at, SessionEventModel.id)
+    )
+    return list(result.scalars().all())
+
+
+async def apply_stuck_counts(session: AsyncSession, session_counts: Dict[str, int], events: List[dict]) -> List[str]:
+    """
+    Apply buffered "stuck" clicks in batches: one executemany UPDATE per table
+    (stuck = stuck + n) and one multi-row INSERT of stuck events.
+    Sessions deleted since the click are skipped, together with their topic's
+    increments. Returns the ids of the topics whose stuck_count changed.
+    """
+    result = await session.execute(
+        select(SessionModel.id, SessionModel.topic_id).where(SessionModel.id.in_(list(session_counts)))
+    )
+    topic_of = dict(result.all())
+    if not topic_of:
+        return []
+    
+    topic_counts: Dict[str, int] = {}
+    for session_id, topic_id in topic_of.items():
+        topic_counts[topic_id] = topic_counts.get(topic_id, 0) + session_counts[session_id]
+    
+    sessions_table = SessionModel.__table__
+    await session.execute(
+        update(sessions_table)
+        .where(sessions_table.c.id == bindparam("b_id"))
+        .values(stuck_moments=func.coalesce(sessions_table.c.stuck_moments, 0) + bindparam("b_count")),
+        [{"b_id": session_id, "b_count": session_counts[session_id]} for session_id in topic_of]
+    )
+    
+    topics_table = TopicModel.__table__
+    await session.execute(
+        update(topics_table)
+        .where(topics_table.c.id == bindparam("b_id"))
+        .values(stuck_count=func.coalesce(topics_table.c.stuck_count, 0) + bindparam("b_count")),
+        [{"b_id": topic_id, "b_count": count} for topic_id, count in topic_counts.items()]
+    )
+    
+    await session.execute(
+        insert(SessionEventModel.__table__),
+        [
+            {"session_id": event["session_id"], "user_id": event["user_id"],
+             "type": SessionEventType.STUCK.value, "created_at": event["created_at"]}
+            for event in events if event["session_id"] in topic_of
+        ]
+    )
+    return list(topic_counts)
+
+
+def _now() -> datetime:
+    """Current time at the whole-second resolution the database stores"""
+    return datetime.now().replace(microsecond=0)
+
+
+async def _transition(session: AsyncSession, session_id: str, user_id: str, from_status: SessionStatus,
+                      values: dict, elapsed) -> Optional[Row]:
+    """
+    Apply a status transition as one conditional UPDATE guarded by the current status.
+    
+    Returns the updated session row plus `elapsed` (seconds added to duration) and
+    `project_id`, or None when no row matched (not found, not owned, or another
+    request changed the status first).
+    """
+    project_id = (
+        select(TopicModel.project_id)
+        .where(TopicModel.id == SessionModel.topic_id)
+        .correlate(SessionModel)
+        .scalar_subquery()
+    )
+    returned = (*SessionModel.__table__.c, elapsed.label("elapsed"), project_id.label("project_id"))
+    stmt = (
+        update(SessionModel)
+        .where(
+            SessionModel.id == session_id,
+            SessionModel.user_id == user_id,
+            SessionModel.status == from_status.value,
         )
-        session_model = result.scalar_one_or_none()
-        
-        if not session_model:
-            return None
-        
-        return _model_to_session(session_model)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+    
+    # The UPDATE bypasses the ORM; drop a copy the request may hold in its identity map
+    cached = session.identity_map.get(session.identity_key(SessionModel, session_id))
+    if cached is not None:
+        session.expire(cached)
+    
+    if session.bind.dialect.update_returning:
+        result = await session.execute(stmt.returning(*returned))
+        return result.one_or_none()
+    
+    # MySQL has no UPDATE ... RETURNING; our row lock keeps the re-read consistent
+    result = await session.execute(stmt)
+    if not result.rowcount:
+        return None
+    result = await session.execute(select(*returned).where(SessionModel.id == session_id))
+    return result.one()
 
 
-async def get_session_status(session_id: str, user_id: str) -> Optional[SessionStatusResponse]:
+async def _transition_failed(session: AsyncSession, session_id: str, user_id: str, action: str) -> None:
+    """Return None for a missing session (404); raise ConflictError when its status did not allow the transition"""
+    result = await session.execute(
+        select(SessionModel.status).where(SessionModel.id == session_id, SessionModel.user_id == user_id)
+    )
+    status = result.scalar_one_or_none()
+    if status is None:
+        return None
+    
+    raise ConflictError(f"Session cannot be {action}: it is {status}")
+
+
+async def get_session(session: AsyncSession, session_id: str, user_id: str) -> Optional[Session]:
+    """Get session by ID"""
+    session_model = await _get_session_model(session, session_id, user_id)
+    
+    if not session_model:
+        return None
+    
+    return _model_to_session(session_model)
+
+
+async def _get_session_model(session: AsyncSession, session_id: str, user_id: str) -> Optional[SessionModel]:
+    """Get session model by ID, served from the request's identity map when already loaded"""
+    session_model = await session.get(SessionModel, session_id)
+    
+    if not session_model or session_model.user_id != user_id:
+        return None
+    
+    return session_model
+
+
+async def get_session_status(session: AsyncSession, session_id: str, user_id: str) -> Optional[SessionStatusResponse]:
     """Get session status"""
-    session = await get_session(session_id, user_id)
-    if not session:
+    session_obj = await get_session(session, session_id, user_id)
+    if not session_obj:
         return None
     
     return SessionStatusResponse(
-        id=session.id,
-        status=session.status,
-        duration=session.duration,
-        stuck_moments=session.stuck_moments,
-        completed=session.completed
+        id=session_obj.id,
+        status=session_obj.status,
+        duration=session_obj.duration,
+        stuck_moments=session_obj.stuck_moments,
+        completed=session_obj.completed
     )
 
 
-def _model_to_session(session_model: SessionModel) -> Session:
-    """Convert SQLAlchemy model to Session object"""
+def _model_to_session(session_model) -> Session:
+    """Convert SQLAlchemy model (or a returned sessions row) to Session object"""
     return Session(
         id=session_model.id,
         topic_id=session_model.topic_id,
@@ -0,0 +1,374 @@
+"""
+Materialized per-user and per-project statistics.
+
+user_stats / project_stats rows are maintained incrementally by the repositories
+that change the underlying data (sessions, topics, projects), inside the same
+transaction as the change. Reads are a primary-key lookup instead of an
+aggregate over the user's whole session history.
+
+daily_study_stats holds one row per (user, project, topic, day) and is fed when a
+session completes, so time-range and streak queries read day buckets instead of
+scanning sessions. The current streak is walked back from today a window of days
+at a time; the longest streak is a single SQL aggregate.
+
+Missing user_stats / project_stats rows are rebuilt lazily from the source tables. A full rebuild (backfill
+or drift repair) is available as:
+
+    python -m database.stats_repository rebuild
+    python -m database.stats_repository rebuild --user <user_id>
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import select, func, case, update, delete, insert, Select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.expressions import day_number
+from database.user_db import User
+from database.models import (
+    Session as SessionModel,
+    Project as ProjectModel,
+    Topic as TopicModel,
+    UserStats as UserStatsModel,
+    ProjectStats as ProjectStatsModel,
+    DailyStudyStats as DailyStudyStatsModel,
+)
+
+logger = logging.getLogger(__name__)
+
+USER_STATS_COLUMNS = ["total_sessions", "completed_sessions", "total_study_time", "total_projects", "total_topics"]
+PROJECT_STATS_COLUMNS = ["total_sessions", "completed_sessions", "total_study_time", "topics_count", "confidence_sum"]
+
+
+def _session_counters():
+    return (
+        func.count(SessionModel.id).label("total_sessions"),
+        func.sum(case((SessionModel.completed == True, 1), else_=0)).label("completed_sessions"),
+        func.sum(SessionModel.duration).label("total_study_time"),
+    )
+
+
+def user_stats_source(user_id: Optional[str] = None) -> Select:
+    """Recompute user_stats rows from the source tables (all users, or one)"""
+    sessions = select(SessionModel.user_id, *_session_counters()).group_by(SessionModel.user_id)
+    projects = (
+        select(ProjectModel.user_id, func.count(ProjectModel.id).label("total_projects"))
+        .group_by(ProjectModel.user_id)
+    )
+    topics = (
+        select(ProjectModel.user_id, func.count(TopicModel.id).label("total_topics"))
+        .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
+        .group_by(ProjectModel.user_id)
+    )
+    if user_id:
+        sessions = sessions.where(SessionModel.user_id == user_id)
+        projects = projects.where(ProjectModel.user_id == user_id)
+        topics = topics.where(ProjectModel.user_id == user_id)
+    sessions, projects, topics = sessions.subquery(), projects.subquery(), topics.subquery()
+
+    stmt = (
+        select(
+            User.id,
+            func.coalesce(sessions.c.total_sessions, 0),
+            func.coalesce(sessions.c.completed_sessions, 0),
+            func.coalesce(sessions.c.total_study_time, 0),
+            func.coalesce(projects.c.total_projects, 0),
+            func.coalesce(topics.c.total_topics, 0),
+        )
+        .outerjoin(sessions, sessions.c.user_id == User.id)
+        .outerjoin(projects, projects.c.user_id == User.id)
+        .outerjoin(topics, topics.c.user_id == User.id)
+    )
+    if user_id:
+        stmt = stmt.where(User.id == user_id)
+    return stmt
+
+
+def project_stats_source(project_id: Optional[str] = None, user_id: Optional[str] = None) -> Select:
+    """Recompute project_stats rows from the source tables (all projects, one user's, or one)"""
+    sessions = (
+        select(TopicModel.project_id, *_session_counters())
+        .join(TopicModel, SessionModel.topic_id == TopicModel.id)
+        .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
+        .where(SessionModel.user_id == ProjectModel.user_id)
+        .group_by(TopicModel.project_id)
+    )
+    topics = (
+        select(
+            TopicModel.project_id,
+            func.count(TopicModel.id).label("topics_count"),
+            func.sum(TopicModel.confidence_level).label("confidence_sum"),
+        )
+        .group_by(TopicModel.project_id)
+    )
+    if project_id:
+        sessions = sessions.where(TopicModel.project_id == project_id)
+        topics = topics.where(TopicModel.project_id == project_id)
+    if user_id:
+        sessions = sessions.where(ProjectModel.user_id == user_id)
+    sessions, topics = sessions.subquery(), topics.subquery()
+
+    stmt = (
+        select(
+            ProjectModel.id,
+            ProjectModel.user_id,
+            func.coalesce(sessions.c.total_sessions, 0),
+            func.coalesce(sessions.c.completed_sessions, 0),
+            func.coalesce(sessions.c.total_study_time, 0),
+            func.coalesce(topics.c.topics_count, 0),
+            func.coalesce(topics.c.confidence_sum, 0),
+        )
+        .outerjoin(sessions, sessions.c.project_id == ProjectModel.id)
+        .outerjoin(topics, topics.c.project_id == ProjectModel.id)
+    )
+    if project_id:
+        stmt = stmt.where(ProjectModel.id == project_id)
+    if user_id:
+        stmt = stmt.where(ProjectModel.user_id == user_id)
+    return stmt
+
+
+async def rebuild_user_stats(session: AsyncSession, user_id: Optional[str] = None):
+    """Replace user_stats rows (all, or one user's) with values recomputed from source tables"""
+    clear = delete(UserStatsModel)
+    if user_id:
+        clear = clear.where(UserStatsModel.user_id == user_id)
+    await session.execute(clear.execution_options(synchronize_session=False))
+    await session.execute(
+        insert(UserStatsModel).from_select(["user_id", *USER_STATS_COLUMNS], user_stats_source(user_id))
+    )
+
+
+async def rebuild_project_stats(session: AsyncSession, project_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Replace project_stats rows (all, one user's, or one project's) with recomputed values"""
+    clear = delete(ProjectStatsModel)
+    if project_id:
+        clear = clear.where(ProjectStatsModel.project_id == project_id)
+    if user_id:
+        clear = clear.where(ProjectStatsModel.user_id == user_id)
+    await session.execute(clear.execution_options(synchronize_session=False))
+    await session.execute(
+        insert(ProjectStatsModel).from_select(
+            ["project_id", "user_id", *PROJECT_STATS_COLUMNS], project_stats_source(project_id, user_id)
+        )
+    )
+
+
+async def _apply_delta(session: AsyncSession, model, key_column, key: str, rebuild, deltas: dict):
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    stmt = (
+        update(model)
+        .where(key_column == key)
+        .values({name: getattr(model, name) + value for name, value in deltas.items()})
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(stmt)
+    if result.rowcount:
+        return
+
+    # No row yet: materialize it from the source tables, which already include the
+    # change being recorded. A concurrent request may win the insert; then retry the delta.
+    try:
+        async with session.begin_nested():
+            await rebuild()
+    except IntegrityError:
+        await session.execute(stmt)
+
+
+async def apply_user_delta(session: AsyncSession, user_id: str, **deltas: int):
+    """Add deltas to the user's user_stats row, in the caller's transaction"""
+    await _apply_delta(
+        session, UserStatsModel, UserStatsModel.user_id, user_id,
+        lambda: rebuild_user_stats(session, user_id), deltas,
+    )
+
+
+async def apply_project_delta(session: AsyncSession, project_id: str, **deltas: int):
+    """Add deltas to the project's project_stats row, in the caller's transaction"""
+    await _apply_delta(
+        session, ProjectStatsModel, ProjectStatsModel.project_id, project_id,
+        lambda: rebuild_project_stats(session, project_id), deltas,
+    )
+
+
+async def apply_session_delta(session: AsyncSession, user_id: str, project_id: str, **deltas: int):
+    """Apply session counter deltas (total_sessions, completed_sessions, total_study_time) to both tables"""
+    await apply_user_delta(session, user_id, **deltas)
+    await apply_project_delta(session, project_id, **deltas)
+
+
+async def get_project_session_totals(session: AsyncSession, project_id: str, user_id: str, topic_id: Optional[str] = None) -> dict:
+    """Session counters of a project (or one of its topics), used before cascading deletes"""
+    stmt = (
+        select(*_session_counters())
+        .join(TopicModel, SessionModel.topic_id == TopicModel.id)
+        .where(TopicModel.project_id == project_id, SessionModel.user_id == user_id)
+    )
+    if topic_id:
+        stmt = stmt.where(TopicModel.id == topic_id)
+    row = (await session.execute(stmt)).one()
+    return {
+        "total_sessions": row.total_sessions or 0,
+        "completed_sessions": int(row.completed_sessions or 0),
+        "total_study_time": int(row.total_study_time or 0),
+    }
+
+
+async def get_user_stats(session: AsyncSession, user_id: str) -> UserStatsModel:
+    """Read the user's stats row, materializing it on first access"""
+    stats_model = await session.get(UserStatsModel, user_id, populate_existing=True)
+    if stats_model is None:
+        await rebuild_user_stats(session, user_id)
+        await session.commit()
+        stats_model = await session.get(UserStatsModel, user_id)
+    if stats_model is None:
+        stats_model = UserStatsModel(user_id=user_id, **{name: 0 for name in USER_STATS_COLUMNS})
+    return stats_model
+
+
+async def get_project_stats(session: AsyncSession, project_id: str, user_id: str) -> Optional[ProjectStatsModel]:
+    """Read the project's stats row (None if the user does not own the project)"""
+    stats_model = await session.get(ProjectStatsModel, project_id, populate_existing=True)
+    if stats_model is None:
+        # Rebuild (and commit) only for a project the user owns
+        owned = await session.scalar(
+            select(ProjectModel.id).where(ProjectModel.id == project_id, ProjectModel.user_id == user_id)
+        )
+        if owned is None:
+            return None
+        await rebuild_project_stats(session, project_id)
+        await session.commit()
+        stats_model = await session.get(ProjectStatsModel, project_id)
+    if stats_model is None or stats_model.user_id != user_id:
+        return None
+    return stats_model
+
+
+def daily_study_source() -> Select:
+    """Day buckets recomputed from completed sessions (backfill)"""
+    day = func.date(func.coalesce(SessionModel.end_time, SessionModel.start_time))
+    return (
+        select(
+            SessionModel.user_id,
+            TopicModel.project_id,
+            SessionModel.topic_id,
+            day,
+            func.sum(SessionModel.duration),
+            func.count(SessionModel.id),
+        )
+        .join(TopicModel, SessionModel.topic_id == TopicModel.id)
+        .where(SessionModel.completed == True)
+        .group_by(SessionModel.user_id, TopicModel.project_id, SessionModel.topic_id, day)
+    )
+
+
+async def record_study_day(session: AsyncSession, user_id: str, project_id: str, topic_id: str,
+                           day: date, study_time: int, sessions_completed: int = 1):
+    """Add a completed session to its day bucket (single upsert, in the caller's transaction)"""
+    values = {
+        "user_id": user_id,
+        "project_id": project_id,
+        "topic_id": topic_id,
+        "day": day,
+        "study_time": study_time,
+        "sessions_completed": sessions_completed,
+    }
+    table = DailyStudyStatsModel.__table__
+    if session.bind.dialect.name == "mysql":
+        stmt = mysql_insert(table).values(values)
+        stmt = stmt.on_duplicate_key_update(
+            study_time=table.c.study_time + stmt.inserted.study_time,
+            sessions_completed=table.c.sessions_completed + stmt.inserted.sessions_completed,
+        )
+    else:
+        stmt = sqlite_insert(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.project_id, table.c.topic_id, table.c.day],
+            set_={
+                "study_time": table.c.study_time + stmt.excluded.study_time,
+                "sessions_completed": table.c.sessions_completed + stmt.excluded.sessions_completed,
+            },
+        )
+    await session.execute(stmt)
+
+
+async def get_daily_totals(session: AsyncSession, user_id: str, start: date, end: date,
+                           project_id: Optional[str] = None) -> List:
+    """Per-day (day, study_time, sessions_completed) rows in [start, end]; days without study are absent"""
+    stmt = (
+        select(
+            DailyStudyStatsModel.day,
+            func.sum(DailyStudyStatsModel.study_time).label("study_time"),
+            func.sum(DailyStudyStatsModel.sessions_completed).label("sessions_completed"),
+        )
+        .where(
+            DailyStudyStatsModel.user_id == user_id,
+            DailyStudyStatsModel.day >= start,
+            DailyStudyStatsModel.day <= end,
+        )
+        .group_by(DailyStudyStatsModel.day)
+        .order_by(DailyStudyStatsModel.day)
+    )
+    if project_id:
+        stmt = stmt.where(DailyStudyStatsModel.project_id == project_id)
+    result = await session.execute(stmt)
+    return result.all()
+
+
+def _study_days(user_id: str) -> Select:
+    return (
+        select(DailyStudyStatsModel.day)
+        .where(DailyStudyStatsModel.user_id == user_id, DailyStudyStatsModel.sessions_completed > 0)
+        .distinct()
+    )
+
+
+async def get_study_days(session: AsyncSession, user_id: str, limit: int,
+                         before: Optional[date] = None) -> List[date]:
+    """Newest distinct days with at least one completed session (before `before`), descending"""
+    stmt = _study_days(user_id).order_by(DailyStudyStatsModel.day.desc()).limit(limit)
+    if before is not None:
+        stmt = stmt.where(DailyStudyStatsModel.day < before)
+    result = await session.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def get_longest_streak(session: AsyncSession, user_id: str) -> int:
+    """Longest run of consecutive study days, aggregated in SQL (gaps and islands)"""
+    days = _study_days(user_id).subquery()
+    # Consecutive days share day_number - row_number
+    islands = select(
+        (day_number(days.c.day) - func.row_number().over(order_by=days.c.day)).label("island")
+    ).subquery()
+    runs = select(func.count().label("run_length")).select_from(islands).group_by(islands.c.island).subquery()
+    return await session.scalar(select(func.coalesce(func.max(runs.c.run_length), 0)))
+
+
+async def _main(user_id: Optional[str]) -> None:
+    from database.user_db import async_session_maker, engine
+
+    async with async_session_maker() as session:
+        await rebuild_user_stats(session, user_id)
+        await rebuild_project_stats(session, user_id=user_id)
+        await session.commit()
+    print(f"Przebudowano statystyki dla {'użytkownika ' + user_id if user_id else 'wszystkich użytkowników'}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild materialized user/project statistics")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user", default=None, help="rebuild only this user's rows")
+    args = parser.parse_args()
+    asyncio.run(_main(args.user))
@@ -5,94 +5,82 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, func
 from models.subject import Subject, SubjectCreate
 from database.models import Subject as SubjectModel
-from database.connection import get_db
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def create_subject(subject_data: SubjectCreate, user_id: str) -> Subject:
+async def create_subject(session: AsyncSession, subject_data: SubjectCreate, user_id: str) -> Subject:
     """Create new subject"""
-    async for session in get_db():
-        # Check if subject with this name already exists for user
-        result = await session.execute(
-            select(SubjectModel.id).where(
-                SubjectModel.user_id == user_id,
-                func.lower(SubjectModel.name) == func.lower(subject_data.name)
-            )
+    # Check if subject with this name already exists for user
+    result = await session.execute(
+        select(SubjectModel.id).where(
+            SubjectModel.user_id == user_id,
+            func.lower(SubjectModel.name) == func.lower(subject_data.name)
         )
-        existing = result.scalar_one_or_none()
-        if existing:
-            # Return existing subject
-            return await get_subject(existing, user_id)
-        
-        subject_id = str(uuid4())
-        now = datetime.now()
-        
-        subject_model = SubjectModel(
-            id=subject_id,
-            user_id=user_id,
-            name=subject_data.name,
-            created_at=now
-        )
-        session.add(subject_model)
-        await session.commit()
-        await session.refresh(subject_model)
-        
-        return await get_subject(subject_id, user_id)
+    )
+    existing = result.scalar_one_or_none()
+    if existing:
+        # Return existing subject
+        return await get_subject(session, existing, user_id)
+    
+    subject_id = str(uuid4())
+    now = datetime.now()
+    
+    subject_model = SubjectModel(
+        id=subject_id,
+        user_id=user_id,
+        name=subject_data.name,
+        created_at=now
+    )
+    session.add(subject_model)
+    await session.commit()
+    
+    return await get_subject(session, subject_id, user_id)
 
 
-async def get_all_subjects(user_id: str) -> List[Subject]:
+async def get_all_subjects(session: AsyncSession, user_id: str) -> List[Subject]:
     """Get all user subjects"""
-    async for session in get_db():
-        result = await session.execute(
-            select(SubjectModel)
-            .where(SubjectModel.user_id == user_id)
-            .order_by(SubjectModel.name.asc())
-        )
-        subject_models = result.scalars().all()
-        
-        subjects = []
-        for subject_model in subject_models:
-            subjects.append(Subject(
-                id=subject_model.id,
-                user_id=subject_model.user_id,
-                name=subject_model.name,
-                created_at=subject_model.created_at
-            ))
-        
-        return subjects
-
-
-async def get_subject(subject_id: str, user_id: str) -> Optional[Subject]:
-    """Get subject by ID"""
-    async for session in get_db():
-        result = await session.execute(
-            select(SubjectModel).where(
-                SubjectModel.id == subject_id,
-                SubjectModel.user_id == user_id
-            )
-        )
-        subject_model = result.scalar_one_or_none()
-        
-        if not subject_model:
-            return None
-        
-        return Subject(
+    result = await session.execute(
+        select(SubjectModel)
+        .where(SubjectModel.user_id == user_id)
+        .order_by(SubjectModel.name.asc())
+    )
+    subject_models = result.scalars().all()
+    
+    subjects = []
+    for subject_model in subject_models:
+        subjects.append(Subject(
             id=subject_model.id,
             user_id=subject_model.user_id,
             name=subject_model.name,
             created_at=subject_model.created_at
-        )
+        ))
+    
+    return subjects
+
+
+async def get_subject(session: AsyncSession, subject_id: str, user_id: str) -> Optional[Subject]:
+    """Get subject by ID"""
+    subject_model = await session.get(SubjectModel, subject_id)
+    
+    if not subject_model or subject_model.user_id != user_id:
+        return None
+    
+    return Subject(
+        id=subject_model.id,
+        user_id=subject_model.user_id,
+        name=subject_model.name,
+        created_at=subject_model.created_at
+    )
 
 
-async def delete_subject(subject_id: str, user_id: str) -> bool:
+async def delete_subject(session: AsyncSession, subject_id: str, user_id: str) -> bool:
     """Delete subject"""
-    async for session in get_db():
-        result = await session.execute(
-            delete(SubjectModel).where(
-                SubjectModel.id == subject_id,
-                SubjectModel.user_id == user_id
-            )
+    result = await session.execute(
+        delete(SubjectModel).where(
+            SubjectModel.id == subject_id,
+            SubjectModel.user_id == user_id
         )
-        await session.commit()
-        return result.rowcount > 0
+    )
+    await session.commit()
+    return result.rowcount > 0
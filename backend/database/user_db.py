@@ -1,9 +1,9 @@
 from typing import AsyncGenerator
 from fastapi import Depends
 from fastapi_users.db import SQLAlchemyUserDatabase
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy import Column, String, Boolean, DateTime, event
 from sqlalchemy.sql import func
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID
 from config import settings
@@ -29,6 +29,19 @@ engine = create_async_engine(
 )
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+def enable_sqlite_foreign_keys(async_engine: AsyncEngine):
+    """SQLite ignores ON DELETE CASCADE unless enabled per connection; keep it consistent with MySQL"""
+    if async_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+enable_sqlite_foreign_keys(engine)
+
 async def create_db_and_tables():
     try:
         logger.info(f"Connecting to database: {settings.DATABASE_URL.split('@')[1] if '@' in settings.DATABASE_URL else 'hidden'}")
@@ -1,6 +1,7 @@
-from fastapi import Depends
+from fastapi import Depends, Request
 from auth.users import current_active_user
 from database.user_db import User
+from services.rate_limiter import STATE_KEY, get_rate_limiter
 
 async def get_current_user(user: User = Depends(current_active_user)):
     return {
@@ -9,3 +10,15 @@ async def get_current_user(user: User = Depends(current_active_user)):
         "name": user.name,
         "created_at": user.created_at.isoformat() if hasattr(user, 'created_at') and user.created_at else None
     }
+
+
+def rate_limit(group: str):
+    """Dependency: one token from the user's bucket of `group` (services/rate_limiter.py), 429 when empty"""
+    async def check_rate_limit(request: Request, current_user: dict = Depends(get_current_user)) -> None:
+        limiter = get_rate_limiter()
+        if limiter is None:
+            return
+        # 429 carries its own headers; the rest go out via RateLimitHeadersMiddleware
+        result = await limiter.hit(group, current_user["id"])
+        setattr(request.state, STATE_KEY, result.headers)
+    return check_rate_limit
@@ -1,15 +1,22 @@
 from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
 import logging
+import math
+from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
 class FocusFlowException(Exception):
-    def __init__(self, message: str, status_code: int = 500):
+    def __init__(self, message: str, status_code: int = 500, headers: Optional[Dict[str, str]] = None):
         self.message = message
         self.status_code = status_code
+        self.headers = headers
         super().__init__(self.message)
 
+
+def _retry_after_headers(retry_after: Optional[float]) -> Optional[Dict[str, str]]:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
+
 class ProjectNotFoundError(FocusFlowException):
     def __init__(self, project_id: str):
         super().__init__(f"Projekt {project_id} nie został znaleziony", 404)
@@ -22,17 +29,25 @@ class ValidationError(FocusFlowException):
     def __init__(self, message: str):
         super().__init__(message, 400)
 
+class ConflictError(FocusFlowException):
+    def __init__(self, message: str):
+        super().__init__(message, 409)
+
 class AIUnavailableError(FocusFlowException):
-    def __init__(self, message: str = "Serwis AI jest obecnie niedostępny"):
-        super().__init__(message, 503)
+    def __init__(self, message: str = "Serwis AI jest obecnie niedostępny", retry_after: Optional[float] = None):
+        super().__init__(message, 503, _retry_after_headers(retry_after))
+
+class AIOverloadedError(AIUnavailableError):
+    def __init__(self, message: str = "Serwis AI jest przeciążony. Spróbuj ponownie za chwilę", retry_after: Optional[float] = None):
+        super().__init__(message, retry_after)
 
 class AITimeoutError(FocusFlowException):
     def __init__(self, message: str = "Żądanie AI przekroczyło limit czasu"):
         super().__init__(message, 504)
 
 class AIRateLimitError(FocusFlowException):
-    def __init__(self, message: str = "Przekroczono limit żądań AI. Spróbuj ponownie później"):
-        super().__init__(message, 429)
+    def __init__(self, message: str = "Przekroczono limit żądań AI. Spróbuj ponownie później", retry_after: Optional[float] = None):
+        super().__init__(message, 429, _retry_after_headers(retry_after))
 
 class AIValidationError(FocusFlowException):
     def __init__(self, message: str = "Nieprawidłowe żądanie AI"):
@@ -42,5 +57,6 @@ async def exception_handler(request: Request, exc: FocusFlowException):
     logger.error(f"Błąd FocusFlow: {exc.message}")
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.message}
+        content={"detail": exc.message},
+        headers=exc.headers
     )
\ No newline at end of file
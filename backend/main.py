@@ -19,6 +19,10 @@ from routers.subjects import router as subjects_router
 from routers.logs import router as logs_router
 from database.user_db import create_db_and_tables
 from database.connection import init_db
+from services.stuck_buffer import get_stuck_buffer
+from services.priority_scheduler import create_priority_scheduler
+from services.rate_limiter import RateLimitHeadersMiddleware, get_rate_limiter
+from services.ai_jobs import get_ai_job_worker
 from exceptions import (
     FocusFlowException,
     exception_handler,
@@ -38,7 +42,22 @@ async def lifespan(app: FastAPI):
         logger.info("Baza danych zainicjalizowana pomyślnie")
     except Exception as e:
         logger.error(f"Nie udało się zainicjalizować bazy danych: {e}", exc_info=True)
+    
+    stuck_buffer = get_stuck_buffer()
+    stuck_buffer.start()
+    priority_scheduler = create_priority_scheduler()
+    priority_scheduler.start()
+    ai_job_worker = get_ai_job_worker()
+    if ai_job_worker is not None:
+        ai_job_worker.start()
     yield
+    if ai_job_worker is not None:
+        await ai_job_worker.stop()
+    await priority_scheduler.stop()
+    await stuck_buffer.stop()
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        rate_limiter.close()
 
 app = FastAPI(lifespan=lifespan, title="FocusFlow API", version="1.0.0")
 
@@ -56,14 +75,18 @@ app.add_middleware(
     allow_credentials=CORS_CREDENTIALS,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the frontend read back-off hints on cross-origin responses
+    expose_headers=["Retry-After", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy"],
 )
+app.add_middleware(RateLimitHeadersMiddleware)
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.warning(f"HTTPException: {exc.status_code} - {exc.detail}")
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=exc.headers
     )
 
 @app.exception_handler(RequestValidationError)
@@ -80,14 +103,17 @@ async def global_exception_handler(request: Request, exc: Exception):
         logger.warning(f"HTTPException: {exc.status_code} - {exc.detail}")
         return JSONResponse(
             status_code=exc.status_code,
-            content={"detail": exc.detail}
+            content={"detail": exc.detail},
+            headers=exc.headers
         )
     
     logger.error(f"Nieobsłużony wyjątek: {exc}", exc_info=True)
 
+    headers = None
     if isinstance(exc, (FocusFlowException, AIUnavailableError, AITimeoutError, AIRateLimitError, AIValidationError)):
         status_code = exc.status_code
         detail = exc.message
+        headers = exc.headers
     else:
         status_code = 500
         detail = str(exc) if str(exc) else "Wewnętrzny błąd serwera"
@@ -95,7 +121,8 @@ async def global_exception_handler(request: Request, exc: Exception):
 
     return JSONResponse(
         status_code=status_code,
-        content={"detail": detail}
+        content={"detail": detail},
+        headers=headers
     )
 
 app.add_exception_handler(FocusFlowException, exception_handler)
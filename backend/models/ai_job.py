@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+from enum import Enum
+
+class AIJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+FINISHED_STATUSES = (AIJobStatus.SUCCEEDED, AIJobStatus.FAILED)
+
+class AIJob(BaseModel):
+    id: UUID
+    status: AIJobStatus
+    model: Optional[str] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None  # HTTP status /ai/generate would have returned
+    attempts: int = 0
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 from enum import Enum
 
@@ -21,4 +21,11 @@ class ChatMessage(BaseModel):
 
 class ChatHistory(BaseModel):
     session_id: UUID
-    messages: List[ChatMessage]
\ No newline at end of file
+    messages: List[ChatMessage]
+
+class ChatContext(BaseModel):
+    session_id: UUID
+    topic_name: str
+    project_name: str
+    summary: Optional[str] = None  # rolling summary of messages older than history
+    history: List[ChatMessage]  # last N unsummarized messages, oldest first
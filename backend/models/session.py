@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 from enum import Enum
 
@@ -9,6 +9,13 @@ class SessionStatus(str, Enum):
     PAUSED = "paused"
     COMPLETED = "completed"
 
+class SessionEventType(str, Enum):
+    START = "start"
+    PAUSE = "pause"
+    RESUME = "resume"
+    STUCK = "stuck"
+    COMPLETE = "complete"
+
 class SessionStart(BaseModel):
     topic_id: UUID
 
@@ -30,4 +37,22 @@ class SessionStatusResponse(BaseModel):
     status: SessionStatus
     duration: int
     stuck_moments: int
-    completed: bool
\ No newline at end of file
+    completed: bool
+
+class SessionEvent(BaseModel):
+    type: SessionEventType
+    timestamp: datetime
+
+class FocusSegment(BaseModel):
+    start: datetime
+    end: datetime
+    duration: int  # seconds
+
+class SessionTimeline(BaseModel):
+    session_id: UUID
+    status: SessionStatus
+    events: List[SessionEvent]
+    segments: List[FocusSegment]  # active stretches between start/resume and pause/complete
+    active_time: int  # seconds
+    paused_time: int  # seconds
+    stuck_moments: int
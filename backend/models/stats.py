@@ -1,6 +1,7 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from uuid import UUID
+from datetime import date
 
 class StatsOverview(BaseModel):
     total_sessions: int
@@ -25,4 +26,20 @@ class StuckTopic(BaseModel):
     confidence_level: int
 
 class StuckTopics(BaseModel):
-    topics: List[StuckTopic]
\ No newline at end of file
+    topics: List[StuckTopic]
+
+class DailyStudy(BaseModel):
+    day: date
+    study_time: int  # seconds
+    sessions_completed: int
+
+class DailyStats(BaseModel):
+    start: date
+    end: date
+    total_study_time: int
+    days: List[DailyStudy]  # one entry per day in range, zero-filled
+
+class StudyStreak(BaseModel):
+    current_streak: int  # days
+    longest_streak: int
+    last_study_day: Optional[date] = None
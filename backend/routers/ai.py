@@ -1,18 +1,24 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 import logging
-import json
 
 from services.g4f_service import get_g4f_service, G4FService
+from services.sse import SSECoalescer, SSE_HEADERS, get_sse_metrics
+from services.rate_limiter import get_rate_limiter
+from services.ai_jobs import AIJobWorker, get_ai_job_worker
+from database import ai_job_repository
+from database.connection import get_db
+from models.ai_job import AIJob
+from sqlalchemy.ext.asyncio import AsyncSession
 from exceptions import (
     AIUnavailableError,
     AITimeoutError,
     AIRateLimitError,
     AIValidationError,
 )
-from dependencies import get_current_user
+from dependencies import get_current_user, rate_limit
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +41,7 @@ class GenerateRequest(BaseModel):
     model: Optional[str] = Field(None, description="Nazwa modelu (opcjonalne)")
     timeout: Optional[float] = Field(None, ge=1.0, le=300.0, description="Timeout w sekundach (1-300)")
     stream: bool = Field(False, description="Czy streamować odpowiedź")
+    bypass_cache: bool = Field(False, description="Pomiń cache odpowiedzi i zapytaj AI ponownie")
 
 
 class GenerateResponse(BaseModel):
@@ -43,7 +50,7 @@ class GenerateResponse(BaseModel):
     finish_reason: Optional[str] = Field(None, description="Powód zakończenia")
 
 
-@router.post("/ai/generate", response_model=GenerateResponse)
+@router.post("/ai/generate", response_model=GenerateResponse, dependencies=[Depends(rate_limit("ai"))])
 async def generate_ai(
     request: GenerateRequest,
     current_user: dict = Depends(get_current_user),
@@ -64,6 +71,8 @@ async def generate_ai(
             model=request.model,
             stream=False,
             timeout=request.timeout,
+            bypass_cache=request.bypass_cache,
+            user_id=current_user.get('id'),
         )
         
         logger.info(f"Generowanie AI zakończone dla użytkownika {current_user.get('id')}")
@@ -79,13 +88,13 @@ async def generate_ai(
         raise HTTPException(status_code=400, detail=str(e))
     except AIRateLimitError as e:
         logger.warning(f"Limit żądań dla użytkownika {current_user.get('id')}: {str(e)}")
-        raise HTTPException(status_code=429, detail=str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
     except AITimeoutError as e:
         logger.warning(f"Timeout dla użytkownika {current_user.get('id')}: {str(e)}")
         raise HTTPException(status_code=504, detail=str(e))
     except AIUnavailableError as e:
         logger.error(f"AI niedostępne dla użytkownika {current_user.get('id')}: {str(e)}")
-        raise HTTPException(status_code=503, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers=e.headers)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -93,7 +102,7 @@ async def generate_ai(
         raise HTTPException(status_code=500, detail="Wewnętrzny błąd serwera")
 
 
-@router.post("/ai/stream")
+@router.post("/ai/stream", dependencies=[Depends(rate_limit("ai"))])
 async def stream_ai(
     request: GenerateRequest,
     current_user: dict = Depends(get_current_user),
@@ -102,66 +111,180 @@ async def stream_ai(
     try:
         messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
         
-        async def generate_stream():
-            try:
-                chunk_count = 0
-                async for chunk in g4f_service.stream_chat(
-                    messages=messages,
-                    model=request.model,
-                    timeout=request.timeout,
-                ):
-                    if chunk:
-                        chunk_count += 1
-                        chunk_size = 10
-                        for i in range(0, len(chunk), chunk_size):
-                            sub_chunk = chunk[i:i + chunk_size]
-                            if sub_chunk:
-                                data = json.dumps({"content": sub_chunk})
-                                yield f"data: {data}\n\n"
-                
-                logger.info(f"Streaming zakończony, łącznie chunków: {chunk_count}")
-                yield "data: [DONE]\n\n"
-                
-            except Exception as e:
-                logger.error(f"Błąd streamingu: {str(e)}", exc_info=True)
-                error_data = json.dumps({"error": str(e)})
-                yield f"data: {error_data}\n\n"
-                raise
-        
-        logger.info(f"Streaming AI rozpoczęty dla użytkownika {current_user.get('id')}")
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            }
+        coalescer = SSECoalescer.from_settings()
+        chunks = g4f_service.stream_chat(
+            messages=messages,
+            model=request.model,
+            timeout=request.timeout,
+            user_id=current_user.get('id'),
         )
+        # Wait for the first chunk (bulkhead slot, validation, upstream call) so that
+        # rejections are plain 4xx/5xx responses with Retry-After, not an error frame
+        try:
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = ""
+        
+        try:
+            logger.info(f"Streaming AI rozpoczęty dla użytkownika {current_user.get('id')}")
+            
+            return StreamingResponse(
+                _sse_stream(coalescer, first_chunk, chunks),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS
+            )
+        except BaseException:
+            # The primed stream holds a bulkhead slot and the upstream stream: release them now
+            await chunks.aclose()
+            raise
         
     except AIValidationError as e:
         logger.warning(f"Błąd walidacji dla użytkownika {current_user.get('id')}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
     except AIRateLimitError as e:
         logger.warning(f"Limit żądań dla użytkownika {current_user.get('id')}: {str(e)}")
-        raise HTTPException(status_code=429, detail=str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
     except AITimeoutError as e:
         logger.warning(f"Timeout dla użytkownika {current_user.get('id')}: {str(e)}")
         raise HTTPException(status_code=504, detail=str(e))
     except AIUnavailableError as e:
         logger.error(f"AI niedostępne dla użytkownika {current_user.get('id')}: {str(e)}")
-        raise HTTPException(status_code=503, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers=e.headers)
     except Exception as e:
         logger.error(f"Nieoczekiwany błąd w streamingu AI: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Wewnętrzny błąd serwera")
 
 
+async def _sse_stream(coalescer: SSECoalescer, first_chunk: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        async for frame in coalescer.frames(_primed(first_chunk, chunks)):
+            yield frame
+        
+        logger.info(
+            f"Streaming zakończony: chunków={coalescer.upstream_chunks}, "
+            f"ramek={coalescer.frames_sent}, bajtów={coalescer.bytes_sent}"
+        )
+        yield coalescer.done()
+        
+    except Exception as e:
+        logger.error(f"Błąd streamingu: {str(e)}", exc_info=True)
+        yield coalescer.event({"error": str(e)})
+        raise
+
+
+async def _primed(first_chunk: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    if first_chunk:
+        yield first_chunk
+    async for chunk in chunks:
+        yield chunk
+
+
+def _job_worker() -> AIJobWorker:
+    worker = get_ai_job_worker()
+    if worker is None:
+        raise HTTPException(status_code=503, detail="Kolejka zadań AI jest wyłączona")
+    return worker
+
+
+@router.post("/ai/jobs", response_model=AIJob, status_code=202, dependencies=[Depends(rate_limit("ai"))])
+async def create_ai_job(
+    request: GenerateRequest,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+    g4f_service: G4FService = Depends(get_g4f_service),
+    worker: AIJobWorker = Depends(_job_worker),
+):
+    """
+    Jak /ai/generate, ale od razu zwraca id zadania. Wynik: GET /ai/jobs/{id}
+    albo SSE z /ai/jobs/{id}/events. `stream` jest ignorowane.
+    """
+    if not g4f_service.enabled or not g4f_service.client:
+        raise HTTPException(
+            status_code=503,
+            detail="Serwis AI jest obecnie niedostępny. Spróbuj ponownie później."
+        )
+    
+    job = await ai_job_repository.create_job(session, current_user["id"], {
+        "messages": [{"role": msg.role, "content": msg.content} for msg in request.messages],
+        "model": request.model,
+        "timeout": request.timeout,
+        "bypass_cache": request.bypass_cache,
+    })
+    worker.notify_new_job()
+    logger.info(f"Zadanie AI {job.id} w kolejce dla użytkownika {current_user.get('id')}")
+    return job
+
+
+@router.get("/ai/jobs/{job_id}", response_model=AIJob)
+async def get_ai_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+):
+    job = await ai_job_repository.get_job(session, job_id, current_user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Zadanie nie zostało znalezione")
+    return job
+
+
+@router.get("/ai/jobs/{job_id}/events")
+async def ai_job_events(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db),
+    worker: AIJobWorker = Depends(_job_worker),
+):
+    """
+    SSE: `data: {zadanie}` przy każdej zmianie statusu, po succeeded/failed `data: [DONE]`.
+    """
+    if await ai_job_repository.get_job(session, job_id, current_user["id"]) is None:
+        raise HTTPException(status_code=404, detail="Zadanie nie zostało znalezione")
+    # Nie trzymaj połączenia z bazą przez cały czas subskrypcji
+    await session.commit()
+    
+    coalescer = SSECoalescer.from_settings()
+    
+    async def job_stream():
+        async for job in worker.watch(job_id, current_user["id"], coalescer.keepalive_interval):
+            if job is None:
+                yield coalescer.keepalive()
+            else:
+                yield coalescer.event(job.model_dump(mode="json"))
+        yield coalescer.done()
+    
+    return StreamingResponse(job_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.get("/ai/health")
 async def ai_health(g4f_service: G4FService = Depends(get_g4f_service)):
     return {
         "enabled": g4f_service.enabled,
         "available": g4f_service.enabled and g4f_service.client is not None,
         "default_model": g4f_service.default_model if g4f_service.enabled else None,
+        "cache": g4f_service.cache.metrics() if g4f_service.cache else None,
+        "single_flight": g4f_service.flight_metrics() if g4f_service.single_flight else None,
+        "hedging": g4f_service.hedging.metrics() if g4f_service.hedging else None,
+        "latency": g4f_service.latencies.metrics(),
+        "circuit_breaker": g4f_service.breaker.metrics() if g4f_service.breaker else None,
+        "bulkhead": g4f_service.bulkhead.metrics() if g4f_service.bulkhead else None,
+        "sse": get_sse_metrics(),
+        "rate_limit": get_rate_limiter().metrics() if get_rate_limiter() else None,
+        "jobs": get_ai_job_worker().metrics() if get_ai_job_worker() else None,
     }
 
+
+@router.get("/ai/debug/routing")
+async def ai_routing_debug(
+    current_user: dict = Depends(get_current_user),
+    g4f_service: G4FService = Depends(get_g4f_service),
+):
+    """Statystyki modeli i ostatnie decyzje routera (kolejność, oczekiwane latencje, timeouty)"""
+    if g4f_service.router is None:
+        return {"enabled": False, "models": {}, "decisions": []}
+    return {
+        "enabled": True,
+        "default_model": g4f_service.default_model,
+        "fallback_models": g4f_service.fallback_models,
+        "models": g4f_service.router.metrics(),
+        "decisions": list(reversed(g4f_service.router.decisions)),
+    }
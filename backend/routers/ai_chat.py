@@ -1,52 +1,165 @@
-from fastapi import APIRouter, HTTPException, Depends
-from models.chat import ChatMessage, ChatMessageCreate, ChatHistory, MessageRole
+import asyncio
+import logging
+from datetime import datetime
+from typing import AsyncIterator
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from models.chat import ChatMessage, ChatMessageCreate, ChatHistory, ChatContext, MessageRole
 from database import chat_repository as db
-from database import session_repository, topic_repository, project_repository
-from services import ai_service
-from dependencies import get_current_user
+from services import ai_service, chat_summarizer
+from services.prompt_builder import DEFAULT_HISTORY_MESSAGES
+from services.sse import SSECoalescer, SSE_HEADERS
+from config import settings
+from sqlalchemy.ext.asyncio import AsyncSession
+from dependencies import get_current_user, rate_limit
+from database.connection import get_db
+from database.user_db import async_session_maker
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post("/chat/message", response_model=ChatMessage)
-async def send_message(message_data: ChatMessageCreate, current_user: dict = Depends(get_current_user)):
-    user_message = await db.create_message(message_data, current_user["id"], MessageRole.USER)
-    
-    session = await session_repository.get_session(str(message_data.session_id), current_user["id"])
-    if not session:
+# Reply writes and summaries started by streams, kept until done
+_pending_writes: set = set()
+
+
+def _history_limit() -> int:
+    # Enough history to also tell whether the chat needs summarizing
+    return max(
+        getattr(settings, 'AI_HISTORY_MESSAGES', DEFAULT_HISTORY_MESSAGES),
+        getattr(settings, 'CHAT_SUMMARY_THRESHOLD', chat_summarizer.DEFAULT_THRESHOLD),
+    )
+
+
+async def _load_context(session: AsyncSession, session_id: str, user_id: str) -> ChatContext:
+    context = await db.get_chat_context(session, session_id, user_id, limit=_history_limit())
+    if not context:
         raise HTTPException(status_code=404, detail="Sesja nie została znaleziona")
+    # Nie trzymaj połączenia z bazą w trakcie wywołania AI
+    await session.commit()
+    return context
+
+@router.post("/chat/message", response_model=ChatMessage, dependencies=[Depends(rate_limit("chat"))])
+async def send_message(message_data: ChatMessageCreate, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    asked_at = datetime.now()
+    session_id = str(message_data.session_id)
     
-    topic = await topic_repository.get_topic(str(session.topic_id), current_user["id"])
-    if not topic:
-        raise HTTPException(status_code=404, detail="Temat nie został znaleziony")
-    
-    project = await project_repository.get_project(str(topic.project_id), current_user["id"])
-    if not project:
-        raise HTTPException(status_code=404, detail="Projekt nie został znaleziony")
-    
-    history = await db.get_chat_history(str(message_data.session_id), current_user["id"])
+    context = await _load_context(session, session_id, current_user["id"])
     
     ai_response_text = await ai_service.generate_ai_response(
         message_data.content,
-        topic.name,
-        project.name,
-        history.messages
+        context.topic_name,
+        context.project_name,
+        context.history,
+        summary=context.summary,
+        user_id=current_user["id"]
     )
     
-    ai_response = await db.create_message(
-        ChatMessageCreate(session_id=message_data.session_id, content=ai_response_text),
-        current_user["id"],
-        MessageRole.ASSISTANT
+    answer = await db.create_exchange(session, session_id, message_data.content, ai_response_text, asked_at)
+    
+    if chat_summarizer.needs_summary(len(context.history) + 2):
+        background_tasks.add_task(chat_summarizer.summarize_chat, session_id)
+    return answer
+
+@router.post("/chat/message/stream", dependencies=[Depends(rate_limit("chat"))])
+async def stream_message(message_data: ChatMessageCreate, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Jak /chat/message, ale odpowiedź przychodzi jako SSE (`data: {"content": ...}`,
+    na końcu `data: [DONE]`). Pytanie jest zapisywane przed pierwszym chunkiem,
+    odpowiedź raz, po zakończeniu strumienia - także częściowa, gdy klient się rozłączy.
+    """
+    asked_at = datetime.now()
+    session_id = str(message_data.session_id)
+    context = await _load_context(session, session_id, current_user["id"])
+    
+    chunks = ai_service.stream_ai_response(
+        message_data.content,
+        context.topic_name,
+        context.project_name,
+        context.history,
+        summary=context.summary,
+        user_id=current_user["id"]
     )
+    # Wait for the first chunk so that a rejected question is a plain 400, not a stream
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
     
-    return ai_response
+    try:
+        await db.store_message(session, session_id, MessageRole.USER, message_data.content, asked_at)
+        
+        return StreamingResponse(
+            _reply_stream(session_id, first_chunk, chunks, len(context.history) + 2),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+    except BaseException:
+        # The primed stream holds a bulkhead slot and the upstream stream: release them now
+        await chunks.aclose()
+        raise
+
+
+async def _recorded(first_chunk: str, chunks: AsyncIterator[str], parts: list) -> AsyncIterator[str]:
+    if first_chunk:
+        parts.append(first_chunk)
+        yield first_chunk
+    async for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+
+
+async def _reply_stream(session_id: str, first_chunk: str, chunks: AsyncIterator[str], unsummarized: int):
+    coalescer = SSECoalescer.from_settings()
+    parts = []
+    try:
+        async for frame in coalescer.frames(_recorded(first_chunk, chunks, parts)):
+            yield frame
+        yield coalescer.done()
+    except Exception as e:
+        logger.error(f"Błąd streamingu odpowiedzi czatu: {str(e)}", exc_info=True)
+        yield coalescer.event({"error": str(e)})
+    finally:
+        content = "".join(parts)
+        if content:
+            write = _keep(asyncio.create_task(_save_reply(session_id, content, datetime.now())))
+            if chat_summarizer.needs_summary(unsummarized):
+                # Summarized in the background like after /chat/message: the stream does not wait for it
+                write.add_done_callback(lambda done: _summarize_if_stored(done, session_id))
+            # Shielded: a disconnect cancels this generator, the write must still happen
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                pass
+
+
+def _keep(task: asyncio.Task) -> asyncio.Task:
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+    return task
+
+
+def _summarize_if_stored(write: asyncio.Task, session_id: str) -> None:
+    if not write.cancelled() and write.result():
+        _keep(asyncio.create_task(chat_summarizer.summarize_chat(session_id)))
+
+
+async def _save_reply(session_id: str, content: str, answered_at: datetime) -> bool:
+    try:
+        async with async_session_maker() as session:
+            await db.store_message(session, session_id, MessageRole.ASSISTANT, content, answered_at)
+    except Exception as e:
+        logger.error(f"Nie udało się zapisać odpowiedzi czatu sesji {session_id}: {e}", exc_info=True)
+        return False
+    return True
 
 @router.get("/chat/{session_id}/history", response_model=ChatHistory)
-async def get_chat_history(session_id: str, current_user: dict = Depends(get_current_user)):
-    return await db.get_chat_history(session_id, current_user["id"])
+async def get_chat_history(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    return await db.get_chat_history(session, session_id, current_user["id"])
 
 @router.delete("/chat/{session_id}")
-async def delete_chat_history(session_id: str, current_user: dict = Depends(get_current_user)):
-    success = await db.delete_chat_history(session_id, current_user["id"])
+async def delete_chat_history(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    success = await db.delete_chat_history(session, session_id, current_user["id"])
     if not success:
         raise HTTPException(status_code=404, detail="Sesja nie została znaleziona")
     return {"message": "Historia czatu została usunięta"}
\ No newline at end of file
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Request, BackgroundTasks, status
 from models.log import ClientLogCreate
 from database.log_repository import insert_client_log
+from database.user_db import async_session_maker
 
 router = APIRouter()
 
@@ -8,7 +9,9 @@ async def _store_log(log: ClientLogCreate, request: Request):
     user_agent = request.headers.get('user-agent')
     path = log.path or request.headers.get('referer')
     client_ip = request.client.host if request.client else None
-    await insert_client_log(log, user_agent, path, client_ip)
+    # Runs after the response is sent, so it cannot borrow the request-scoped session
+    async with async_session_maker() as session:
+        await insert_client_log(session, log, user_agent, path, client_ip)
 
 @router.post('/logs', status_code=status.HTTP_201_CREATED)
 async def ingest_log(log: ClientLogCreate, request: Request, background_tasks: BackgroundTasks):
@@ -1,43 +1,62 @@
 from fastapi import APIRouter, HTTPException, Depends
-from models.session import Session, SessionStart, SessionStatusResponse
+from models.session import Session, SessionStart, SessionStatusResponse, SessionTimeline
 from database import session_repository as db
+from services import session_timeline, stuck_buffer
+from sqlalchemy.ext.asyncio import AsyncSession
 from dependencies import get_current_user
+from database.connection import get_db
 
 router = APIRouter()
 
 @router.post("/sessions/start", response_model=Session)
-async def start_session(session_data: SessionStart, current_user: dict = Depends(get_current_user)):
+async def start_session(session_data: SessionStart, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Start new learning session"""
-    return await db.start_session(session_data, current_user["id"])
+    return await db.start_session(session, session_data, current_user["id"])
 
 @router.put("/sessions/{session_id}/pause", response_model=Session)
-async def pause_session(session_id: str, current_user: dict = Depends(get_current_user)):
+async def pause_session(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Pause active session"""
-    session = await db.pause_session(session_id, current_user["id"])
-    if not session:
+    session_obj = await db.pause_session(session, session_id, current_user["id"])
+    if not session_obj:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return session_obj
 
 @router.put("/sessions/{session_id}/resume", response_model=Session)
-async def resume_session(session_id: str, current_user: dict = Depends(get_current_user)):
+async def resume_session(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Resume paused session"""
-    session = await db.resume_session(session_id, current_user["id"])
-    if not session:
+    session_obj = await db.resume_session(session, session_id, current_user["id"])
+    if not session_obj:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return session_obj
 
 @router.put("/sessions/{session_id}/complete", response_model=Session)
-async def complete_session(session_id: str, current_user: dict = Depends(get_current_user)):
+async def complete_session(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Complete session"""
-    session = await db.complete_session(session_id, current_user["id"])
-    if not session:
+    session_obj = await db.complete_session(session, session_id, current_user["id"])
+    if not session_obj:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return session_obj
+
+@router.post("/sessions/{session_id}/stuck", response_model=SessionStatusResponse)
+async def report_stuck(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """Record an "I'm stuck" moment (buffered, written in batches)"""
+    status = await stuck_buffer.report_stuck(session, session_id, current_user["id"])
+    if not status:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return status
 
 @router.get("/sessions/{session_id}/status", response_model=SessionStatusResponse)
-async def get_session_status(session_id: str, current_user: dict = Depends(get_current_user)):
+async def get_session_status(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Get session status"""
-    status = await db.get_session_status(session_id, current_user["id"])
+    status = await db.get_session_status(session, session_id, current_user["id"])
     if not status:
         raise HTTPException(status_code=404, detail="Session not found")
-    return status
\ No newline at end of file
+    return status
+
+@router.get("/sessions/{session_id}/timeline", response_model=SessionTimeline)
+async def get_session_timeline(session_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """Get session events with focus segments derived from them"""
+    timeline = await session_timeline.get_session_timeline(session, session_id, current_user["id"])
+    if not timeline:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return timeline
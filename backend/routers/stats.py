@@ -1,24 +1,44 @@
-from fastapi import APIRouter, HTTPException, Depends
-from models.stats import StatsOverview, ProjectStats, StuckTopics
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from models.stats import StatsOverview, ProjectStats, StuckTopics, DailyStats, StudyStreak
 from services import stats
+from sqlalchemy.ext.asyncio import AsyncSession
 from dependencies import get_current_user
+from database.connection import get_db
 
 router = APIRouter()
 
 @router.get("/stats/overview", response_model=StatsOverview)
-async def get_overview(current_user: dict = Depends(get_current_user)):
+async def get_overview(current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Get overall statistics"""
-    return await stats.get_overview_stats(current_user["id"])
+    return await stats.get_overview_stats(session, current_user["id"])
 
 @router.get("/stats/projects/{project_id}", response_model=ProjectStats)
-async def get_project_stats(project_id: str, current_user: dict = Depends(get_current_user)):
+async def get_project_stats(project_id: str, current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Get project statistics"""
-    project_stats = await stats.get_project_stats(project_id, current_user["id"])
+    project_stats = await stats.get_project_stats(session, project_id, current_user["id"])
     if not project_stats:
         raise HTTPException(status_code=404, detail="Project not found")
     return project_stats
 
 @router.get("/stats/stuck-topics", response_model=StuckTopics)
-async def get_stuck_topics(current_user: dict = Depends(get_current_user)):
+async def get_stuck_topics(current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """Get topics with most stuck moments"""
-    return await stats.get_stuck_topics(current_user["id"])
\ No newline at end of file
+    return await stats.get_stuck_topics(session, current_user["id"])
+
+@router.get("/stats/daily", response_model=DailyStats)
+async def get_daily_stats(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    project_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db)
+):
+    """Get study time per day (heatmap / last N days)"""
+    return await stats.get_daily_stats(session, current_user["id"], start, end, project_id)
+
+@router.get("/stats/streak", response_model=StudyStreak)
+async def get_streak(current_user: dict = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """Get current and longest study streak"""
+    return await stats.get_study_streak(session, current_user["id"])
@@ -0,0 +1,269 @@
+"""
+Asynchronous AI jobs.
+
+POST /api/ai/jobs stores the request in ai_jobs and returns at once; the
+client polls GET /api/ai/jobs/{id} or follows /api/ai/jobs/{id}/events (SSE)
+until the job is succeeded or failed. No HTTP connection waits for the model,
+so a generation may take longer than the proxy timeout (AI_JOB_DEADLINE
+instead of G4F_DEADLINE).
+
+Every process runs AI_JOB_WORKERS worker coroutines. A worker claims the
+oldest due job with a compare-and-set UPDATE (database/ai_job_repository.py)
+and holds a lease of AI_JOB_DEADLINE + LEASE_MARGIN seconds. If the process
+dies, the lease runs out and any worker takes the job again, at most
+AI_JOB_MAX_ATTEMPTS times; a graceful shutdown hands its jobs back right away.
+Overload and rate-limit rejections from G4FService requeue the job after
+Retry-After. Finished jobs are deleted AI_JOB_TTL seconds after they finish.
+
+Workers in the process that queued a job are woken at once; others notice it
+within AI_JOB_POLL_INTERVAL.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set
+from uuid import uuid4
+
+from database import ai_job_repository as db
+from database.ai_job_repository import ClaimedJob
+from models.ai_job import AIJob, AIJobStatus, FINISHED_STATUSES
+from exceptions import AIRateLimitError, AIOverloadedError, FocusFlowException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_DEADLINE = 170.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_TTL = 3600.0
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_CLEANUP_INTERVAL = 300.0
+# Lease beyond the deadline: bulkhead queueing, writing the result
+LEASE_MARGIN = 30.0
+# Requeue delay when a rejection carries no Retry-After
+DEFAULT_REQUEUE_DELAY = 5.0
+
+
+async def _wait(event: asyncio.Event, timeout: float) -> None:
+    """Wait for the event at most timeout seconds"""
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        # asyncio.wait (unlike wait_for) never swallows a cancellation racing the wake-up,
+        # which would leave stop() waiting for a worker forever
+        await asyncio.wait([waiter], timeout=timeout)
+    finally:
+        waiter.cancel()
+
+
+class AIJobWorker:
+    def __init__(self, session_maker=None, g4f_service=None, workers: int = DEFAULT_WORKERS,
+                 deadline: float = DEFAULT_DEADLINE, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 ttl: float = DEFAULT_TTL, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 cleanup_interval: float = DEFAULT_CLEANUP_INTERVAL):
+        self._session_maker = session_maker
+        self._g4f_service = g4f_service
+        self.workers = workers
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.cleanup_interval = cleanup_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"succeeded": 0, "failed": 0, "requeued": 0, "lost": 0}
+
+    def notify_new_job(self) -> None:
+        """Wake idle workers of this process (called after queueing a job)"""
+        self._wakeup.set()
+
+    async def run_once(self) -> bool:
+        """Claim and process one job. Returns False if there was nothing to do."""
+        now = datetime.now()
+        async with self._get_session_maker()() as session:
+            job = await db.claim_job(
+                session, self.worker_id, now,
+                lease_until=now + timedelta(seconds=self.deadline + LEASE_MARGIN),
+                max_attempts=self.max_attempts,
+                ttl=self.ttl,
+            )
+        if job is None:
+            return False
+        self._notify(job.id)
+        try:
+            await self._process(job)
+        finally:
+            self._notify(job.id)
+        return True
+
+    async def _process(self, job: ClaimedJob) -> None:
+        request = job.request
+        try:
+            result = await self._get_g4f_service().generate_chat(
+                request["messages"],
+                request.get("model"),
+                timeout=request.get("timeout"),
+                bypass_cache=request.get("bypass_cache", False),
+                user_id=job.user_id,
+                deadline_budget=self.deadline,
+            )
+        except (AIRateLimitError, AIOverloadedError) as e:
+            if job.attempts < self.max_attempts:
+                delay = float(e.headers["Retry-After"]) if e.headers else DEFAULT_REQUEUE_DELAY
+                await self._requeue(job, delay)
+                return
+            await self._finish(job, AIJobStatus.FAILED, error=e.message, error_status=e.status_code)
+        except FocusFlowException as e:
+            await self._finish(job, AIJobStatus.FAILED, error=e.message, error_status=e.status_code)
+        except Exception as e:
+            logger.error(f"Nieoczekiwany błąd zadania AI {job.id}: {e}", exc_info=True)
+            await self._finish(job, AIJobStatus.FAILED, error="Wewnętrzny błąd serwera", error_status=500)
+        else:
+            await self._finish(job, AIJobStatus.SUCCEEDED, result=result or "")
+
+    async def _finish(self, job: ClaimedJob, status: AIJobStatus, **outcome) -> None:
+        async with self._get_session_maker()() as session:
+            stored = await db.finish_job(session, job.id, self.worker_id, status, datetime.now(), self.ttl, **outcome)
+        if not stored:
+            self.stats["lost"] += 1
+            logger.warning(f"Zadanie AI {job.id} przejął inny worker, wynik odrzucony")
+            return
+        self.stats["succeeded" if status == AIJobStatus.SUCCEEDED else "failed"] += 1
+
+    async def _requeue(self, job: ClaimedJob, delay: float) -> None:
+        async with self._get_session_maker()() as session:
+            await db.requeue_job(session, job.id, self.worker_id, datetime.now() + timedelta(seconds=delay))
+        self.stats["requeued"] += 1
+        logger.info(f"Zadanie AI {job.id} wraca do kolejki za {delay:.0f}s")
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Pobranie zadania AI nie powiodło się: {e}", exc_info=True)
+            await _wait(self._wakeup, self.poll_interval)
+            self._wakeup.clear()
+
+    async def cleanup(self) -> int:
+        """Delete finished jobs past their TTL. Returns the number deleted."""
+        async with self._get_session_maker()() as session:
+            deleted = await db.delete_expired_jobs(session, datetime.now())
+        if deleted:
+            logger.info(f"Usunięto {deleted} wygasłych zadań AI")
+        return deleted
+
+    async def _clean(self) -> None:
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.error(f"Czyszczenie zadań AI nie powiodło się: {e}", exc_info=True)
+            await asyncio.sleep(self.cleanup_interval)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._clean()))
+
+    async def stop(self) -> None:
+        """Stop the workers and hand their running jobs back to the queue"""
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            async with self._get_session_maker()() as session:
+                released = await db.release_worker_jobs(session, self.worker_id, datetime.now())
+        except Exception as e:
+            logger.error(f"Nie udało się zwolnić zadań AI workera: {e}", exc_info=True)
+            return
+        if released:
+            logger.info(f"Zwrócono do kolejki {released} przerwanych zadań AI")
+
+    async def watch(self, job_id: str, user_id: str, keepalive_interval: float) -> AsyncIterator[Optional[AIJob]]:
+        """
+        Yield the job whenever its status changes, until it is finished; None after
+        keepalive_interval without a change. Stops without yielding if the job is gone.
+
+        Jobs of this process wake the watcher at once, others are polled.
+        """
+        changed = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(changed)
+        loop = asyncio.get_running_loop()
+        last_status, last_sent = None, loop.time()
+        try:
+            while True:
+                changed.clear()
+                # Own session per poll: no connection is held between polls
+                async with self._get_session_maker()() as session:
+                    job = await db.get_job(session, job_id, user_id)
+                if job is None:
+                    return
+                if job.status != last_status:
+                    last_status, last_sent = job.status, loop.time()
+                    yield job
+                    if job.status in FINISHED_STATUSES:
+                        return
+                elif loop.time() - last_sent >= keepalive_interval:
+                    last_sent = loop.time()
+                    yield None
+                await _wait(changed, self.poll_interval)
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(changed)
+                if not watchers:
+                    del self._watchers[job_id]
+
+    def _notify(self, job_id: str) -> None:
+        for changed in self._watchers.get(job_id, ()):
+            changed.set()
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "workers": self.workers,
+            "running": bool(self._tasks),
+            "watchers": sum(len(w) for w in self._watchers.values()),
+            **self.stats,
+        }
+
+    def _get_session_maker(self):
+        if self._session_maker is None:
+            from database.user_db import async_session_maker
+            self._session_maker = async_session_maker
+        return self._session_maker
+
+    def _get_g4f_service(self):
+        if self._g4f_service is None:
+            from services.g4f_service import get_g4f_service
+            self._g4f_service = get_g4f_service()
+        return self._g4f_service
+
+
+_worker_instance: Optional[AIJobWorker] = None
+_worker_loaded = False
+
+
+def get_ai_job_worker() -> Optional[AIJobWorker]:
+    """Pobiera lub tworzy globalną pulę workerów zadań AI (None, gdy kolejka wyłączona)."""
+    global _worker_instance, _worker_loaded
+    if not _worker_loaded:
+        from config import settings
+        if getattr(settings, 'AI_JOBS_ENABLED', True):
+            _worker_instance = AIJobWorker(
+                workers=getattr(settings, 'AI_JOB_WORKERS', DEFAULT_WORKERS),
+                deadline=getattr(settings, 'AI_JOB_DEADLINE', DEFAULT_DEADLINE),
+                max_attempts=getattr(settings, 'AI_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+                ttl=getattr(settings, 'AI_JOB_TTL', DEFAULT_TTL),
+                poll_interval=getattr(settings, 'AI_JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+                cleanup_interval=getattr(settings, 'AI_JOB_CLEANUP_INTERVAL', DEFAULT_CLEANUP_INTERVAL),
+            )
+        _worker_loaded = True
+    return _worker_instance
@@ -1,11 +1,15 @@
+import contextlib
 import os
-from typing import List
+from typing import AsyncIterator, List, Optional
 from models.chat import ChatMessage, MessageRole
 import logging
 
+from config import settings
 from services.g4f_service import get_g4f_service
+from services.prompt_builder import build_messages, DEFAULT_TOKEN_BUDGET
 from exceptions import (
     AIUnavailableError,
+    AIOverloadedError,
     AITimeoutError,
     AIRateLimitError,
     AIValidationError,
@@ -14,11 +18,52 @@ from exceptions import (
 logger = logging.getLogger(__name__)
 
 
+def build_prompt(
+    user_message: str,
+    topic_name: str,
+    project_name: str,
+    chat_history: List[ChatMessage],
+    summary: Optional[str] = None
+) -> List[dict]:
+    """Buduje listę wiadomości dla AI: prompt systemowy, historia w budżecie tokenów i pytanie"""
+    system_prompt = f"""Jesteś asystentem AI w aplikacji FocusFlow. 
+Użytkownik studiuje temat: "{topic_name}" 
+w ramach projektu: "{project_name}".
+
+Twoim zadaniem jest:
+- Dawać krótkie, zrozumiałe wyjaśnienia
+- Nie rozpraszać od nauki
+- Motywować do kontynuacji sesji
+- Odpowiadać po polsku
+
+Użytkownik utknął i potrzebuje pomocy."""
+    
+    return build_messages(
+        system_prompt,
+        chat_history,
+        user_message,
+        token_budget=getattr(settings, 'AI_PROMPT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET),
+        summary=summary,
+    )
+
+
+def fallback_response(topic_name: str) -> str:
+    """Odpowiedź zapasowa, gdy AI jest niedostępne"""
+    return f"Pomogę Ci zrozumieć temat '{topic_name}'. Co dokładnie sprawia trudności?"
+
+
+def _is_rejection(error: Exception) -> bool:
+    """Odrzucenie przez bulkhead: klient ma ponowić po Retry-After, a nie dostać odpowiedź zapasową"""
+    return isinstance(error, AIOverloadedError) or (isinstance(error, AIRateLimitError) and bool(error.headers))
+
+
 async def generate_ai_response(
     user_message: str,
     topic_name: str,
     project_name: str,
-    chat_history: List[ChatMessage]
+    chat_history: List[ChatMessage],
+    summary: Optional[str] = None,
+    user_id: Optional[str] = None
 ) -> str:
     """
     Generuje odpowiedź AI używając serwisu g4f z kontekstem.
@@ -27,46 +72,24 @@ async def generate_ai_response(
         user_message: Wiadomość/pytanie użytkownika
         topic_name: Aktualnie studiowany temat
         project_name: Nazwa projektu/egzaminu
-        chat_history: Poprzednie wiadomości czatu dla kontekstu
+        chat_history: Poprzednie wiadomości czatu (od najstarszej); najstarsze
+            odpadają, gdy prompt przekroczyłby AI_PROMPT_TOKEN_BUDGET
+        summary: Podsumowanie starszej części rozmowy (zastępuje jej wiadomości)
+        user_id: Użytkownik (kolejka w bulkheadzie G4FService)
         
     Returns:
         Wygenerowany tekst odpowiedzi AI
         
     Raises:
-        AIUnavailableError: Gdy serwis AI jest niedostępny
-        AITimeoutError: Gdy żądanie przekroczy limit czasu
-        AIRateLimitError: Gdy przekroczono limit żądań
+        AIOverloadedError: Gdy bulkhead odrzuci żądanie (503 z Retry-After)
+        AIRateLimitError: Gdy kolejka użytkownika w bulkheadzie jest pełna (429 z Retry-After)
         AIValidationError: Gdy walidacja wejścia nie powiodła się
+        
+    Pozostałe błędy AI kończą się odpowiedzią zapasową.
     """
     try:
         g4f_service = get_g4f_service()
-        
-        system_prompt = f"""Jesteś asystentem AI w aplikacji FocusFlow. 
-Użytkownik studiuje temat: "{topic_name}" 
-w ramach projektu: "{project_name}".
-
-Twoim zadaniem jest:
-- Dawać krótkie, zrozumiałe wyjaśnienia
-- Nie rozpraszać od nauki
-- Motywować do kontynuacji sesji
-- Odpowiadać po polsku
-
-Użytkownik utknął i potrzebuje pomocy."""
-        
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        for msg in chat_history[-10:]:
-            messages.append({
-                "role": msg.role.value,
-                "content": msg.content
-            })
-        
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
+        messages = build_prompt(user_message, topic_name, project_name, chat_history, summary)
         
         logger.info(f"Żądanie AI dla tematu: {topic_name}, wiadomość: {user_message[:50]}...")
         
@@ -74,14 +97,18 @@ Użytkownik utknął i potrzebuje pomocy."""
             messages=messages,
             stream=False,
             timeout=60.0,
+            user_id=user_id,
         )
         
         logger.info(f"Odpowiedź AI wygenerowana pomyślnie dla tematu: {topic_name}")
-        return response or f"Pomogę Ci zrozumieć temat '{topic_name}'. Co dokładnie sprawia trudności?"
+        return response or fallback_response(topic_name)
         
     except (AIUnavailableError, AITimeoutError, AIRateLimitError) as e:
+        if _is_rejection(e):
+            logger.warning(f"Żądanie AI odrzucone: {str(e)}")
+            raise
         logger.warning(f"Błąd serwisu AI: {str(e)}, używam odpowiedzi zapasowej")
-        return f"Pomogę Ci zrozumieć temat '{topic_name}'. Co dokładnie sprawia trudności?"
+        return fallback_response(topic_name)
     
     except AIValidationError as e:
         logger.error(f"Błąd walidacji AI: {str(e)}")
@@ -89,4 +116,50 @@ Użytkownik utknął i potrzebuje pomocy."""
     
     except Exception as e:
         logger.error(f"Nieoczekiwany błąd w generowaniu AI: {str(e)}", exc_info=True)
-        return f"Pomogę Ci zrozumieć temat '{topic_name}'. Co dokładnie sprawia trudności?"
\ No newline at end of file
+        return fallback_response(topic_name)
+
+
+async def stream_ai_response(
+    user_message: str,
+    topic_name: str,
+    project_name: str,
+    chat_history: List[ChatMessage],
+    summary: Optional[str] = None,
+    user_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Streamuje odpowiedź AI chunk po chunku (argumenty jak w generate_ai_response).
+    
+    Gdy AI zawiedzie przed pierwszym chunkiem, zwraca odpowiedź zapasową, tak jak
+    generate_ai_response. Błąd w trakcie streamingu jest propagowany, żeby wywołujący
+    mógł zachować dotychczasową część odpowiedzi.
+    
+    Raises:
+        AIOverloadedError, AIRateLimitError: Gdy bulkhead odrzuci żądanie (jak w generate_ai_response)
+        AIValidationError: Gdy walidacja wejścia nie powiodła się
+    """
+    g4f_service = get_g4f_service()
+    messages = build_prompt(user_message, topic_name, project_name, chat_history, summary)
+    
+    logger.info(f"Streaming AI dla tematu: {topic_name}, wiadomość: {user_message[:50]}...")
+    
+    started = False
+    try:
+        # aclosing: closing this generator must also close the upstream one (and free its bulkhead slot)
+        async with contextlib.aclosing(
+            g4f_service.stream_chat(messages=messages, timeout=60.0, user_id=user_id)
+        ) as upstream:
+            async for chunk in upstream:
+                if chunk:
+                    started = True
+                    yield chunk
+    except AIValidationError as e:
+        logger.error(f"Błąd walidacji AI: {str(e)}")
+        raise
+    except Exception as e:
+        if started or _is_rejection(e):
+            raise
+        logger.warning(f"Błąd serwisu AI: {str(e)}, używam odpowiedzi zapasowej")
+    
+    if not started:
+        yield fallback_response(topic_name)
@@ -7,7 +7,6 @@ from uuid import uuid4
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database.user_db import User
-from database.connection import get_db
 from config import settings
 import logging
 
@@ -50,71 +49,68 @@ def verify_token(token: str):
             detail="Invalid token"
         )
 
-async def create_user(email: str, password: str, name: str):
-    async for session in get_db():
-        result = await session.execute(
-            select(User.id).where(User.email == email)
-        )
-        if result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        user_id = str(uuid4())
-        hashed_password = get_password_hash(password)
-        now = datetime.now()
-        
-        user_model = User(
-            id=user_id,
-            email=email,
-            name=name,
-            hashed_password=hashed_password,
-            created_at=now
+async def create_user(session: AsyncSession, email: str, password: str, name: str):
+    result = await session.execute(
+        select(User.id).where(User.email == email)
+    )
+    if result.scalar_one_or_none():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
         )
-        session.add(user_model)
-        await session.commit()
-        
-        return {
-            "id": user_id,
-            "email": email,
-            "name": name,
-            "created_at": now.isoformat()
-        }
+    
+    user_id = str(uuid4())
+    hashed_password = get_password_hash(password)
+    now = datetime.now()
+    
+    user_model = User(
+        id=user_id,
+        email=email,
+        name=name,
+        hashed_password=hashed_password,
+        created_at=now
+    )
+    session.add(user_model)
+    await session.commit()
+    
+    return {
+        "id": user_id,
+        "email": email,
+        "name": name,
+        "created_at": now.isoformat()
+    }
 
-async def authenticate_user(email: str, password: str):
-    async for session in get_db():
-        result = await session.execute(
-            select(User).where(User.email == email)
-        )
-        user_model = result.scalar_one_or_none()
-        
-        if not user_model:
-            return False
-        
-        if not verify_password(password, user_model.hashed_password):
-            return False
-        
-        return {
-            "id": str(user_model.id),
-            "email": user_model.email,
-            "name": user_model.name,
-            "created_at": user_model.created_at.isoformat() if user_model.created_at else None
-        }
+async def authenticate_user(session: AsyncSession, email: str, password: str):
+    result = await session.execute(
+        select(User).where(User.email == email)
+    )
+    user_model = result.scalar_one_or_none()
+    
+    if not user_model:
+        return False
+    
+    if not verify_password(password, user_model.hashed_password):
+        return False
+    
+    return {
+        "id": str(user_model.id),
+        "email": user_model.email,
+        "name": user_model.name,
+        "created_at": user_model.created_at.isoformat() if user_model.created_at else None
+    }
 
-async def get_user_by_email(email: str):
-    async for session in get_db():
-        result = await session.execute(
-            select(User).where(User.email == email)
-        )
-        user_model = result.scalar_one_or_none()
-        
-        if not user_model:
-            return None
-        
-        return {
-            "id": str(user_model.id),
-            "email": user_model.email,
-            "name": user_model.name,
-            "created_at": user_model.created_at.isoformat() if user_model.created_at else None
-        }
+async def get_user_by_email(session: AsyncSession, email: str):
+    result = await session.execute(
+        select(User).where(User.email == email)
+    )
+    user_model = result.scalar_one_or_none()
+    
+    if not user_model:
+        return None
+    
+    return {
+        "id": str(user_model.id),
+        "email": user_model.email,
+        "name": user_model.name,
+        "created_at": user_model.created_at.isoformat() if user_model.created_at else None
+    }
@@ -0,0 +1,167 @@
+"""
+Bulkhead for upstream AI calls.
+
+At most AI_MAX_CONCURRENT upstream calls run at once in this process. Callers
+beyond that wait in per-user FIFO queues. A freed slot goes to the users in
+round-robin order, so one user with many requests queued cannot starve the
+others. Waiting is bounded:
+- AI_MAX_QUEUE waiters in total, beyond that the call fails fast with 503;
+- AI_MAX_QUEUE_PER_USER waiters per user, beyond that 429;
+- AI_QUEUE_TIMEOUT seconds of waiting, then 503.
+
+Every rejection carries a Retry-After estimated from recent slot hold times.
+"""
+
+import asyncio
+import logging
+import math
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from exceptions import AIOverloadedError, AIRateLimitError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 8
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_QUEUE_PER_USER = 4
+DEFAULT_QUEUE_TIMEOUT = 10.0
+# Initial guess of how long a slot is held, before any call has finished
+DEFAULT_HOLD_SECONDS = 5.0
+HOLD_EWMA_ALPHA = 0.2
+# Background work (chat summaries) has no user and shares one lane
+ANONYMOUS = ""
+
+
+class Bulkhead:
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, max_queue: int = DEFAULT_MAX_QUEUE,
+                 max_queue_per_user: int = DEFAULT_MAX_QUEUE_PER_USER,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiting = 0
+        # user -> waiters; order of keys is the round-robin order
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._hold_seconds = DEFAULT_HOLD_SECONDS
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_user = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["Bulkhead"]:
+        max_concurrent = getattr(settings, 'AI_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT)
+        if max_concurrent <= 0:
+            return None
+        return cls(
+            max_concurrent=max_concurrent,
+            max_queue=getattr(settings, 'AI_MAX_QUEUE', DEFAULT_MAX_QUEUE),
+            max_queue_per_user=getattr(settings, 'AI_MAX_QUEUE_PER_USER', DEFAULT_MAX_QUEUE_PER_USER),
+            queue_timeout=getattr(settings, 'AI_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT),
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a newcomer"""
+        ahead = self._waiting + 1
+        return max(1, math.ceil(self._hold_seconds * ahead / self.max_concurrent))
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None) -> AsyncIterator[None]:
+        await self.acquire(user_id)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            yield
+        finally:
+            held = loop.time() - started
+            self._hold_seconds += HOLD_EWMA_ALPHA * (held - self._hold_seconds)
+            self.release()
+
+    async def acquire(self, user_id: Optional[str] = None) -> None:
+        user = user_id or ANONYMOUS
+        if self.active < self.max_concurrent and not self._waiting:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if self._waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise AIOverloadedError(retry_after=self.retry_after())
+        queue = self._queues.get(user)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self.rejected_user += 1
+            raise AIRateLimitError(
+                "Zbyt wiele oczekujących żądań AI. Spróbuj ponownie później",
+                retry_after=self.retry_after(),
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user] = deque()
+        queue.append(waiter)
+        self._waiting += 1
+        self.queued += 1
+        try:
+            # asyncio.wait (unlike wait_for) never swallows a cancellation racing the timeout
+            await asyncio.wait([waiter], timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done():
+                # Slot handed over just as the caller went away
+                self.release()
+            else:
+                waiter.cancel()
+                self._forget(user, waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self._forget(user, waiter)
+            self.timeouts += 1
+            logger.warning(f"Przekroczono czas oczekiwania na slot AI ({self.queue_timeout}s)")
+            raise AIOverloadedError(retry_after=self.retry_after())
+        self.admitted += 1
+
+    def _forget(self, user: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(user)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        self._waiting -= 1
+        if not queue:
+            del self._queues[user]
+
+    def release(self) -> None:
+        # The slot passes straight to the next user in round-robin order
+        while self._queues:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "waiting": self._waiting,
+            "users_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_full": self.rejected_full,
+            "rejected_user": self.rejected_user,
+            "timeouts": self.timeouts,
+            "retry_after": self.retry_after(),
+        }
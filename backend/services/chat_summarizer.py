@@ -0,0 +1,156 @@
+"""
+Rolling summarization of long chats.
+
+Once a session has CHAT_SUMMARY_THRESHOLD messages not covered by its summary,
+a background task folds all but the newest CHAT_SUMMARY_KEEP_RECENT of them
+(together with the previous summary) into a new summary via the AI. The prompt
+then carries the summary instead of those messages, so its size per question
+stays roughly constant however long the chat gets. The messages themselves
+are kept for /chat/{id}/history.
+
+The task runs after the response is sent, on its own database session, and
+does not hold a connection during the AI call. A failed summarization changes
+nothing; the next question retries it.
+"""
+
+import logging
+from typing import List, Optional
+
+from database import chat_repository
+from models.chat import ChatMessage, MessageRole
+from services.g4f_service import get_g4f_service
+from services.prompt_builder import TRUNCATION_MARKER
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 16
+DEFAULT_KEEP_RECENT = 6
+DEFAULT_MAX_BATCH = 40
+
+SUMMARY_TIMEOUT = 30.0
+MAX_SUMMARY_CHARS = 2000
+# g4f rejects messages over 10000 characters
+MAX_TRANSCRIPT_CHARS = 9000
+
+SUMMARY_PROMPT = """Streszczasz rozmowę ucznia z asystentem AI w aplikacji FocusFlow.
+Napisz zwięzłe podsumowanie (maksymalnie 150 słów) zawierające:
+- o co pytał uczeń i jakie pojęcia zostały wyjaśnione,
+- co nadal sprawia mu trudność.
+Uwzględnij wcześniejsze podsumowanie, jeśli zostało podane. Odpowiadaj po polsku."""
+
+ROLE_LABELS = {
+    MessageRole.USER: "Uczeń",
+    MessageRole.ASSISTANT: "Asystent",
+}
+
+# Sessions being summarized by this process
+_in_progress: set = set()
+
+
+def _settings():
+    from config import settings
+    return (
+        getattr(settings, 'CHAT_SUMMARY_THRESHOLD', DEFAULT_THRESHOLD),
+        getattr(settings, 'CHAT_SUMMARY_KEEP_RECENT', DEFAULT_KEEP_RECENT),
+        getattr(settings, 'CHAT_SUMMARY_MAX_BATCH', DEFAULT_MAX_BATCH),
+    )
+
+
+def needs_summary(unsummarized_messages: int) -> bool:
+    """Whether a session with this many messages outside its summary should be compacted"""
+    threshold, _, _ = _settings()
+    return unsummarized_messages >= threshold
+
+
+def split_for_summary(messages: List[ChatMessage], keep_recent: int) -> List[ChatMessage]:
+    """
+    Messages to fold into the summary: all but the newest keep_recent.
+
+    Messages sharing a timestamp with the first kept one stay unsummarized too,
+    since the summary boundary is a timestamp.
+    """
+    if len(messages) <= keep_recent:
+        return []
+    cut = len(messages) - keep_recent
+    boundary = messages[cut].timestamp
+    while cut > 0 and messages[cut - 1].timestamp >= boundary:
+        cut -= 1
+    return messages[:cut]
+
+
+def build_summary_messages(previous_summary: Optional[str], messages: List[ChatMessage]) -> List[dict]:
+    """Prompt asking the AI to fold messages into the previous summary"""
+    parts = []
+    if previous_summary:
+        parts.append(f"Wcześniejsze podsumowanie:\n{previous_summary[:MAX_SUMMARY_CHARS]}")
+
+    budget = MAX_TRANSCRIPT_CHARS - sum(len(part) for part in parts)
+    per_message = max(budget // len(messages), 1)
+    lines = []
+    for msg in messages:
+        content = msg.content
+        if len(content) > per_message:
+            content = content[:per_message - 1] + TRUNCATION_MARKER
+        lines.append(f"{ROLE_LABELS[msg.role]}: {content}")
+    parts.append("Rozmowa:\n" + "\n".join(lines))
+
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)[:MAX_TRANSCRIPT_CHARS]},
+    ]
+
+
+async def summarize_chat(session_id: str, session_maker=None, g4f_service=None) -> bool:
+    """Fold older messages of a session into its rolling summary. Returns True if stored."""
+    if session_id in _in_progress:
+        return False
+    _in_progress.add(session_id)
+    try:
+        return await _summarize(session_id, session_maker, g4f_service or get_g4f_service())
+    except Exception as e:
+        logger.warning(f"Nie udało się podsumować czatu sesji {session_id}: {e}")
+        return False
+    finally:
+        _in_progress.discard(session_id)
+
+
+async def _summarize(session_id: str, session_maker, g4f_service) -> bool:
+    if session_maker is None:
+        from database.user_db import async_session_maker
+        session_maker = async_session_maker
+    _, keep_recent, max_batch = _settings()
+
+    async with session_maker() as session:
+        summary = await chat_repository.get_chat_summary(session, session_id)
+        previous_content = summary.content if summary else None
+        previous_until = summary.covered_until if summary else None
+
+        messages = await chat_repository.get_unsummarized_messages(
+            session, session_id, previous_until, limit=max_batch + keep_recent
+        )
+        to_summarize = split_for_summary(messages, keep_recent)
+        if not to_summarize:
+            return False
+        # Nie trzymaj połączenia z bazą w trakcie wywołania AI
+        await session.commit()
+
+        content = await g4f_service.generate_chat(
+            messages=build_summary_messages(previous_content, to_summarize),
+            stream=False,
+            timeout=SUMMARY_TIMEOUT,
+        )
+        if not content or not content.strip():
+            return False
+
+        stored = await chat_repository.save_chat_summary(
+            session,
+            session_id,
+            content.strip()[:MAX_SUMMARY_CHARS],
+            covered_until=to_summarize[-1].timestamp,
+            messages_count=len(to_summarize),
+            previous_until=previous_until,
+        )
+
+    if stored:
+        logger.info(f"Podsumowano {len(to_summarize)} wiadomości czatu sesji {session_id}")
+    return stored
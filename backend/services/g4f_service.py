@@ -3,15 +3,19 @@ Serwis g4f - asynchroniczny wrapper dla integracji GPT4Free.
 
 Zapewnia produkcyjny interfejs do g4f z:
 - Obsługą timeoutów
-- Retry z exponential backoff
+- Retry z exponential backoff (z jitterem) w ramach łącznego deadline
 - Walidacją i sanitizacją wejścia
 - Wsparciem dla streamingu i non-streaming
 """
 
 import asyncio
+import contextlib
+import hashlib
 import logging
+import random
 import re
-from typing import List, Dict, Optional, AsyncIterator, Any
+from collections import OrderedDict
+from typing import List, Dict, Optional, AsyncIterator, Any, Awaitable, Callable
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +47,9 @@ except Exception as e:
     Provider = None
     logger.error(f"Błąd importu g4f (Exception): {str(e)}", exc_info=True)
 
+from services.bulkhead import Bulkhead
+from services.model_health import CircuitBreaker, HedgePolicy, LatencyTracker, ModelRouter
+from services.response_cache import ResponseCache, make_cache_key
 from exceptions import (
     AIUnavailableError,
     AITimeoutError,
@@ -52,6 +59,8 @@ from exceptions import (
 
 DEFAULT_MODEL = "gpt-3.5-turbo"
 DEFAULT_TIMEOUT = 60.0
+# Poniżej proxy_read_timeout (60s) w nginx.conf, żeby klient dostał 504 zamiast zerwanego połączenia
+DEFAULT_DEADLINE = 55.0
 DEFAULT_MAX_RETRIES = 3
 DEFAULT_BACKOFF_BASE = 2.0
 DEFAULT_MAX_BACKOFF = 30.0
@@ -67,6 +76,23 @@ PROMPT_INJECTION_PATTERNS = [
     r'<\|system\|>',
     r'<\|assistant\|>',
 ]
+# Wszystkie wzorce w jednym przebiegu; grupa p<i> mówi, który wzorzec trafił
+_INJECTION_RE = re.compile(
+    "|".join(f"(?P<p{i}>{pattern})" for i, pattern in enumerate(PROMPT_INJECTION_PATTERNS)),
+    re.IGNORECASE,
+)
+_WHITESPACE_RE = re.compile(r'\s+')
+MAX_MESSAGE_LENGTH = 10000
+# Historia czatu wraca w każdym żądaniu - zwalidowane treści są pamiętane po hashu
+VALIDATION_MEMO_SIZE = 4096
+
+
+class _Flight:
+    """Wspólne wywołanie upstream i liczba oczekujących na nie"""
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
 
 
 class G4FService:
@@ -91,6 +117,13 @@ class G4FService:
         max_backoff: float = DEFAULT_MAX_BACKOFF,
         fallback_models: Optional[List[str]] = None,
         blocked_providers: Optional[List[str]] = None,
+        cache: Optional[ResponseCache] = None,
+        single_flight: bool = True,
+        hedging: Optional[HedgePolicy] = None,
+        deadline_budget: float = DEFAULT_DEADLINE,
+        breaker: Optional[CircuitBreaker] = None,
+        router: Optional[ModelRouter] = None,
+        bulkhead: Optional[Bulkhead] = None,
     ):
         """
         Inicjalizuje serwis G4F.
@@ -104,7 +137,28 @@ class G4FService:
             max_backoff: Maksymalne opóźnienie backoff w sekundach
             fallback_models: Lista modeli zapasowych do wypróbowania jeśli główny model nie działa
             blocked_providers: Lista nazw providerów do zablokowania (np. ["AirForce"])
+            cache: Cache odpowiedzi (None = bez cache)
+            single_flight: Czy łączyć identyczne równoczesne żądania w jedno wywołanie upstream
+            hedging: Polityka hedgingu modeli zapasowych (None = modele strictly po kolei)
+            deadline_budget: Łączny limit czasu żądania (retry i modele zapasowe) w sekundach
+            breaker: Circuit breaker per model (None = bez breakera)
+            router: Router modeli wg oczekiwanej latencji (None = stała kolejność i G4F_TIMEOUT)
+            bulkhead: Limit równoczesnych wywołań upstream z kolejką per użytkownik (None = bez limitu)
         """
+        self.bulkhead = bulkhead
+        self.breaker = breaker
+        self.router = router
+        self.deadline_budget = deadline_budget
+        self.cache = cache
+        self.hedging = hedging
+        # Router liczy timeouty z tych samych pomiarów, które widzi hedging
+        self.latencies = router.latencies if router is not None else LatencyTracker()
+        self.single_flight = single_flight
+        self._flights: Dict[str, _Flight] = {}
+        self.flight_stats = {"leaders": 0, "joined": 0, "cancelled": 0}
+        self._validated: "OrderedDict[bytes, str]" = OrderedDict()
+        self.validation_memo_hits = 0
+        self.validation_memo_misses = 0
         if not G4F_AVAILABLE:
             logger.warning("g4f niedostępny. Zainstaluj: pip install g4f==6.6.6")
             self.enabled = False
@@ -183,65 +237,102 @@ class G4FService:
             if not content or not isinstance(content, str):
                 raise AIValidationError("Treść wiadomości musi być niepustym stringiem")
             
-            content_lower = content.lower()
-            for pattern in PROMPT_INJECTION_PATTERNS:
-                if re.search(pattern, content_lower, re.IGNORECASE):
-                    logger.warning(f"Wykryto potencjalny prompt injection: {pattern}")
-                    raise AIValidationError("Wykryto nieprawidłowe wejście. Proszę przeformułować wiadomość.")
-            
-            if len(content) > 10000:
-                raise AIValidationError("Wiadomość zbyt długa (maksymalnie 10000 znaków)")
-            
-            content = re.sub(r'\s+', ' ', content.strip())
-            
             sanitized.append({
                 'role': role,
-                'content': content
+                'content': self._sanitize_content(content)
             })
         
         return sanitized
     
+    def _sanitize_content(self, content: str) -> str:
+        """Sprawdza i normalizuje jedną treść; wynik dla już widzianej treści bierze z pamięci"""
+        key = hashlib.blake2b(content.encode(), digest_size=16).digest()
+        cached = self._validated.get(key)
+        if cached is not None:
+            self._validated.move_to_end(key)
+            self.validation_memo_hits += 1
+            return cached
+        
+        match = _INJECTION_RE.search(content)
+        if match:
+            pattern = PROMPT_INJECTION_PATTERNS[int(match.lastgroup[1:])]
+            logger.warning(f"Wykryto potencjalny prompt injection: {pattern}")
+            raise AIValidationError("Wykryto nieprawidłowe wejście. Proszę przeformułować wiadomość.")
+        
+        if len(content) > MAX_MESSAGE_LENGTH:
+            raise AIValidationError(f"Wiadomość zbyt długa (maksymalnie {MAX_MESSAGE_LENGTH} znaków)")
+        
+        sanitized = _WHITESPACE_RE.sub(' ', content.strip())
+        self.validation_memo_misses += 1
+        self._validated[key] = sanitized
+        if len(self._validated) > VALIDATION_MEMO_SIZE:
+            self._validated.popitem(last=False)
+        return sanitized
+    
     async def _execute_with_retry(
         self,
-        coro,
+        factory: Callable[[], Awaitable[Any]],
         timeout: float,
-        operation_name: str = "Żądanie AI"
+        operation_name: str = "Żądanie AI",
+        deadline: Optional[float] = None,
+        model: Optional[str] = None,
     ) -> Any:
         """
-        Wykonuje asynchroniczną operację z retry i exponential backoff.
+        Wykonuje asynchroniczną operację z retry i backoff z jitterem.
+        
+        Każda próba tworzy nową korutynę przez factory. Próba trwa najwyżej timeout
+        i nigdy dłużej niż do deadline (czas pętli zdarzeń); backoff, który skończyłby
+        się po deadline, oznacza koniec prób.
         
         Args:
-            coro: Koro do wykonania
-            timeout: Timeout w sekundach
+            factory: Funkcja zwracająca nową korutynę do wykonania
+            timeout: Timeout pojedynczej próby w sekundach
             operation_name: Nazwa dla logowania
+            deadline: Końcowy termin całego żądania (loop.time()), None = bez limitu
+            model: Model, którego wyniki trafiają do circuit breakera (None = bez breakera)
             
         Returns:
-            Wynik koro
+            Wynik korutyny
             
         Raises:
-            AITimeoutError: Jeśli operacja przekroczy limit czasu
+            AITimeoutError: Jeśli operacja przekroczy limit czasu lub deadline
             AIUnavailableError: Jeśli wszystkie próby nie powiodły się
         """
+        loop = asyncio.get_running_loop()
         last_error = None
         
         for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                if model and self.breaker and self.breaker.is_open(model):
+                    raise AIUnavailableError(f"Model {model} wyłączony przez circuit breaker")
+                delay = random.uniform(0, min(self.backoff_base ** attempt, self.max_backoff))
+                if deadline is not None and loop.time() + delay >= deadline:
+                    logger.warning(f"{operation_name} - Brak czasu na kolejną próbę przed deadline")
+                    break
+                logger.info(f"{operation_name} - Ponowna próba {attempt}/{self.max_retries} po {delay:.1f}s")
+                await asyncio.sleep(delay)
+            
+            attempt_timeout = timeout
+            if deadline is not None:
+                attempt_timeout = min(timeout, deadline - loop.time())
+                if attempt_timeout <= 0:
+                    break
+            
             try:
-                if attempt > 0:
-                    delay = min(
-                        self.backoff_base ** attempt,
-                        self.max_backoff
-                    )
-                    logger.info(f"{operation_name} - Ponowna próba {attempt}/{self.max_retries} po {delay:.1f}s")
-                    await asyncio.sleep(delay)
-                
-                result = await asyncio.wait_for(coro, timeout=timeout)
+                result = await asyncio.wait_for(factory(), timeout=attempt_timeout)
+                self._record_outcome(model, True)
                 return result
                 
             except asyncio.TimeoutError:
-                last_error = AITimeoutError(f"{operation_name} przekroczyło limit czasu po {timeout}s")
+                self._record_outcome(model, False)
+                if attempt_timeout >= timeout:
+                    self._record_timeout(model, attempt_timeout)
+                last_error = AITimeoutError(f"{operation_name} przekroczyło limit czasu po {attempt_timeout:.1f}s")
                 logger.warning(f"{operation_name} - Timeout przy próbie {attempt + 1}")
                 
             except Exception as e:
+                if not isinstance(e, AIValidationError):
+                    self._record_outcome(model, False)
                 last_error = e
                 error_msg = str(e).lower()
                 
@@ -265,7 +356,58 @@ class G4FService:
                 else:
                     raise AIUnavailableError(f"{operation_name} nie powiodło się po {self.max_retries + 1} próbach: {str(e)}")
         
-        raise last_error or AIUnavailableError(f"{operation_name} nie powiodło się")
+        # Tu trafiamy tylko po timeoutach albo po wyczerpaniu czasu do deadline
+        if isinstance(last_error, AITimeoutError):
+            raise last_error
+        raise AITimeoutError(f"{operation_name} - przekroczono łączny limit czasu żądania")
+    
+    def _record_outcome(self, model: Optional[str], ok: bool) -> None:
+        if not model:
+            return
+        if self.router is not None:
+            self.router.record_outcome(model, ok)
+        if self.breaker is not None:
+            if ok:
+                self.breaker.record_success(model)
+            else:
+                self.breaker.record_failure(model)
+    
+    def _record_timeout(self, model: Optional[str], seconds: float) -> None:
+        """
+        Timeout próby jako próbka cenzurowana: odpowiedź trwałaby co najmniej `seconds`.
+        Bez tego p95 znałby tylko udane (szybkie) wywołania i timeout z routera nie
+        urósłby po wzroście opóźnień modelu; tak rośnie o timeout_factor aż do żądanego.
+        """
+        if model:
+            self.latencies.record(model, seconds)
+    
+    def _slot(self, user_id: Optional[str]):
+        """Slot bulkheadu na wywołanie upstream (bez bulkheadu - bez limitu)"""
+        if self.bulkhead is None:
+            return contextlib.nullcontext()
+        return self.bulkhead.slot(user_id)
+    
+    def _model_timeout(self, model: str, timeout: float) -> float:
+        """Timeout próby dla modelu: z p95 modelu (router), ale nie dłuższy niż żądany"""
+        if self.router is None:
+            return timeout
+        return self.router.timeout_for(model, timeout)
+    
+    async def _timed_stream(self, model: str, response: Any, started: float) -> AsyncIterator[Any]:
+        """Przekazuje chunki streamu, mierząc czas do pierwszego chunka (TTFT) dla routera"""
+        first = True
+        async for chunk in response:
+            if first:
+                first = False
+                if self.router is not None:
+                    self.router.record_ttft(model, asyncio.get_running_loop().time() - started)
+            yield chunk
+    
+    def _model_allowed(self, model: str) -> bool:
+        if self.breaker is None or self.breaker.allow(model):
+            return True
+        logger.info(f"Model {model} pominięty: circuit breaker otwarty")
+        return False
     
     async def generate_chat(
         self,
@@ -274,6 +416,9 @@ class G4FService:
         *,
         stream: bool = False,
         timeout: Optional[float] = None,
+        bypass_cache: bool = False,
+        user_id: Optional[str] = None,
+        deadline_budget: Optional[float] = None,
     ) -> Any:
         """
         Generuje odpowiedź czatu używając g4f z automatycznym fallback do innych modeli.
@@ -285,6 +430,11 @@ class G4FService:
             model: Nazwa modelu (domyślnie skonfigurowany)
             stream: Czy streamować odpowiedzi
             timeout: Timeout żądania w sekundach (domyślnie skonfigurowany)
+            bypass_cache: Pomiń cache odpowiedzi (odpowiedź i tak zostanie w nim zapisana)
+            user_id: Użytkownik, w którego kolejce czeka żądanie w bulkheadzie (stream=True
+                nie zajmuje slotu - robi to stream_chat na cały czas streamingu)
+            deadline_budget: Łączny limit czasu tego żądania (domyślnie G4F_DEADLINE);
+                zadania w tle nie są ograniczone timeoutem proxy
             
         Returns:
             Jeśli stream=False: Tekst odpowiedzi
@@ -306,20 +456,105 @@ class G4FService:
         
         primary_model = model or self.default_model
         timeout = timeout or self.default_timeout
+        deadline = asyncio.get_running_loop().time() + (deadline_budget or self.deadline_budget)
+        
+        if stream:
+            return await self._complete(sanitized_messages, primary_model, True, timeout, deadline, route=model is None)
+        
+        key = make_cache_key(primary_model, sanitized_messages)
+        if self.cache is not None and not bypass_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Odpowiedź z cache dla modelu: {primary_model}")
+                return cached
         
+        async def _complete_and_cache() -> str:
+            async with self._slot(user_id):
+                result = await self._complete(sanitized_messages, primary_model, False, timeout, deadline, route=model is None)
+            if self.cache is not None and result:
+                await self.cache.set(key, result)
+            return result
+        
+        if not self.single_flight:
+            return await _complete_and_cache()
+        return await self._single_flight(key, _complete_and_cache)
+    
+    async def _single_flight(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Identyczne równoczesne żądania czekają na jedno wywołanie upstream.
+        
+        Każdy wywołujący czeka na wspólne zadanie przez shield; anulowanie jednego
+        nie przerywa pozostałych, a zadanie jest anulowane dopiero gdy zrezygnują wszyscy.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._end_flight(key, flight))
+            self.flight_stats["leaders"] += 1
+        else:
+            self.flight_stats["joined"] += 1
+        
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nikt już nie czeka: nowi wywołujący nie mogą dołączyć do anulowanego zadania
+                self._end_flight(key, flight)
+                flight.task.cancel()
+                self.flight_stats["cancelled"] += 1
+    
+    def _end_flight(self, key: str, flight: "_Flight") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+    
+    def flight_metrics(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), **self.flight_stats}
+    
+    async def _complete(
+        self,
+        sanitized_messages: List[Dict[str, str]],
+        primary_model: str,
+        stream: bool,
+        timeout: float,
+        deadline: float,
+        route: bool = False,
+    ) -> Any:
+        """
+        Wywołanie upstream: model główny, potem modele zapasowe, wszystko przed deadline.
+        
+        Przy route=True (model nie został wskazany wprost) kolejność modeli ustala router.
+        """
         models_to_try = [primary_model]
         for fallback_model in self.fallback_models:
             if fallback_model not in models_to_try:
                 models_to_try.append(fallback_model)
+        if route and self.router is not None:
+            models_to_try = self.router.route(models_to_try, timeout, stream)
         
         logger.info(f"Generowanie odpowiedzi czatu: modele={models_to_try}, wiadomości={len(sanitized_messages)}, stream={stream}")
         
+        if not stream and self.hedging is not None and len(models_to_try) > 1:
+            return await self._complete_hedged(sanitized_messages, models_to_try, timeout, deadline)
+        
+        loop = asyncio.get_running_loop()
         last_error = None
         for model_to_try in models_to_try:
+            if loop.time() >= deadline:
+                logger.warning(f"Przekroczono łączny limit czasu żądania, pominięto modele od {model_to_try}")
+                raise AITimeoutError("Żądanie AI przekroczyło łączny limit czasu")
+            if not self._model_allowed(model_to_try):
+                last_error = AIUnavailableError(f"Model {model_to_try} wyłączony przez circuit breaker")
+                continue
             try:
                 logger.info(f"Próba użycia modelu: {model_to_try}")
                 
                 if stream:
+                    started = loop.time()
+                    model_timeout = self._model_timeout(model_to_try, timeout)
+                    attempt_timeout = min(model_timeout, deadline - started)
                     try:
                         response = await asyncio.wait_for(
                             self.client.chat.completions.create(
@@ -328,13 +563,18 @@ class G4FService:
                                 stream=True,
                                 web_search=False,
                             ),
-                            timeout=timeout
+                            timeout=attempt_timeout
                         )
                         logger.info(f"Pomyślnie użyto modelu: {model_to_try} (streaming)")
-                        return response
+                        self._record_outcome(model_to_try, True)
+                        return self._timed_stream(model_to_try, response, started)
                     except asyncio.TimeoutError:
+                        self._record_outcome(model_to_try, False)
+                        if attempt_timeout >= model_timeout:
+                            self._record_timeout(model_to_try, attempt_timeout)
                         raise AITimeoutError(f"Żądanie streamingu przekroczyło limit czasu po {timeout}s")
                     except Exception as e:
+                        self._record_outcome(model_to_try, False)
                         error_msg = str(e).lower()
                         if 'airforce' in error_msg or 'discord.gg' in error_msg or 'model does not exist' in error_msg:
                             logger.warning(f"Zablokowano spam providera AirForce: {str(e)}")
@@ -345,44 +585,7 @@ class G4FService:
                             raise AIUnavailableError(f"Provider AI niedostępny: {str(e)}")
                         raise AIUnavailableError(f"Żądanie streamingu nie powiodło się: {str(e)}")
                 else:
-                    async def _generate():
-                        try:
-                            response = await self.client.chat.completions.create(
-                                model=model_to_try,
-                                messages=sanitized_messages,
-                                web_search=False,
-                            )
-                            content = None
-                            if hasattr(response, 'choices') and response.choices:
-                                if hasattr(response.choices[0], 'message'):
-                                    content = response.choices[0].message.content
-                            if not content and hasattr(response, 'content'):
-                                content = response.content
-                            if not content:
-                                content = str(response) if response else ""
-                            
-                            if content:
-                                content_lower = content.lower()
-                                if 'discord.gg' in content_lower or 'airforce' in content_lower or 'model does not exist' in content_lower:
-                                    logger.warning(f"Zablokowano spam AirForce w treści odpowiedzi dla modelu {model_to_try}")
-                                    raise AIUnavailableError("Provider zablokowany: wykryto spam AirForce w odpowiedzi")
-                            
-                            return content if content else ""
-                        except Exception as e:
-                            if isinstance(e, (AIUnavailableError, AITimeoutError, AIRateLimitError, AIValidationError)):
-                                raise
-                            error_msg = str(e).lower()
-                            if 'airforce' in error_msg or 'discord.gg' in error_msg or 'model does not exist' in error_msg:
-                                logger.warning(f"Zablokowano spam providera AirForce dla modelu {model_to_try}: {str(e)}")
-                                raise AIUnavailableError(f"Provider zablokowany: {str(e)}")
-                            logger.error(f"Żądanie G4F nie powiodło się dla modelu {model_to_try}: {error_msg}", exc_info=True)
-                            raise AIUnavailableError(f"Żądanie G4F nie powiodło się: {error_msg}")
-                    
-                    result = await self._execute_with_retry(
-                        _generate(),
-                        timeout=timeout,
-                        operation_name=f"Uzupełnienie czatu (model: {model_to_try})"
-                    )
+                    result = await self._complete_with_model(model_to_try, sanitized_messages, timeout, deadline)
                     logger.info(f"Pomyślnie użyto modelu: {model_to_try}")
                     return result
                     
@@ -406,19 +609,165 @@ class G4FService:
             raise last_error
         raise AIUnavailableError(f"Wszystkie modele niedostępne: {', '.join(models_to_try)}")
     
+    async def _complete_with_model(
+        self,
+        model: str,
+        sanitized_messages: List[Dict[str, str]],
+        timeout: float,
+        deadline: float,
+    ) -> str:
+        """Odpowiedź jednego modelu (z retry); czas udanych wywołań trafia do self.latencies"""
+        loop = asyncio.get_running_loop()
+        
+        async def _generate():
+            try:
+                started = loop.time()
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=sanitized_messages,
+                    web_search=False,
+                )
+                elapsed = loop.time() - started
+                content = None
+                if hasattr(response, 'choices') and response.choices:
+                    if hasattr(response.choices[0], 'message'):
+                        content = response.choices[0].message.content
+                if not content and hasattr(response, 'content'):
+                    content = response.content
+                if not content:
+                    content = str(response) if response else ""
+
+                if content:
+                    content_lower = content.lower()
+                    if 'discord.gg' in content_lower or 'airforce' in content_lower or 'model does not exist' in content_lower:
+                        logger.warning(f"Zablokowano spam AirForce w treści odpowiedzi dla modelu {model}")
+                        raise AIUnavailableError("Provider zablokowany: wykryto spam AirForce w odpowiedzi")
+
+                self.latencies.record(model, elapsed)
+                if self.router is not None:
+                    self.router.record_latency(model, elapsed)
+                return content if content else ""
+            except Exception as e:
+                if isinstance(e, (AIUnavailableError, AITimeoutError, AIRateLimitError, AIValidationError, asyncio.TimeoutError)):
+                    raise
+                error_msg = str(e).lower()
+                if 'airforce' in error_msg or 'discord.gg' in error_msg or 'model does not exist' in error_msg:
+                    logger.warning(f"Zablokowano spam providera AirForce dla modelu {model}: {str(e)}")
+                    raise AIUnavailableError(f"Provider zablokowany: {str(e)}")
+                logger.error(f"Żądanie G4F nie powiodło się dla modelu {model}: {error_msg}", exc_info=True)
+                raise AIUnavailableError(f"Żądanie G4F nie powiodło się: {error_msg}")
+
+        return await self._execute_with_retry(
+            _generate,
+            timeout=self._model_timeout(model, timeout),
+            operation_name=f"Uzupełnienie czatu (model: {model})",
+            deadline=deadline,
+            model=model,
+        )
+    
+    async def _complete_hedged(
+        self,
+        sanitized_messages: List[Dict[str, str]],
+        models_to_try: List[str],
+        timeout: float,
+        deadline: float,
+    ) -> str:
+        """
+        Modele po kolei, ale z hedgingiem: jeśli model nie odpowie w czasie hedge_delay,
+        następny startuje równolegle. Wygrywa pierwsza niepusta odpowiedź, reszta jest anulowana.
+        
+        Nieudany model od razu zastępuje następny (zwykły fallback, bez zużycia budżetu).
+        Modele z otwartym circuit breakerem są pomijane.
+        """
+        policy = self.hedging
+        policy.start_request()
+        loop = asyncio.get_running_loop()
+        remaining = list(models_to_try)
+        running: Dict[asyncio.Task, str] = {}
+        hedge_models = set()
+        can_hedge = True
+        last_error = None
+        empty_result = None
+        
+        def launch() -> Optional[str]:
+            while remaining:
+                model = remaining.pop(0)
+                if self._model_allowed(model):
+                    task = asyncio.create_task(self._complete_with_model(model, sanitized_messages, timeout, deadline))
+                    running[task] = model
+                    return model
+            return None
+        
+        model = launch()
+        hedge_at = loop.time() + policy.hedge_delay(model, self.latencies) if model else 0.0
+        try:
+            while running:
+                wait_timeout = None
+                if can_hedge and remaining and len(hedge_models) < policy.max_extra:
+                    wait_timeout = max(hedge_at - loop.time(), 0)
+                done, _ = await asyncio.wait(running, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    if policy.try_hedge():
+                        model = launch()
+                        if model:
+                            hedge_models.add(model)
+                            logger.info(f"Hedging: brak odpowiedzi w czasie, równolegle model {model}")
+                            hedge_at = loop.time() + policy.hedge_delay(model, self.latencies)
+                    else:
+                        logger.info("Hedging: budżet wyczerpany, czekanie na uruchomione modele")
+                        can_hedge = False
+                    continue
+                
+                failed = 0
+                for task in done:
+                    model = running.pop(task)
+                    try:
+                        result = task.result()
+                    except AIValidationError:
+                        raise
+                    except Exception as e:
+                        last_error = e
+                        failed += 1
+                        logger.warning(f"Model {model} nie powiódł się: {str(e)}")
+                        continue
+                    if result:
+                        if model in hedge_models:
+                            policy.hedge_wins += 1
+                        logger.info(f"Pomyślnie użyto modelu: {model}")
+                        return result
+                    empty_result = result
+                
+                for _ in range(failed):
+                    model = launch()
+                    if model:
+                        hedge_at = loop.time() + policy.hedge_delay(model, self.latencies)
+        finally:
+            for task in running:
+                task.cancel()
+        
+        if empty_result is not None:
+            return empty_result
+        logger.error(f"Wszystkie modele nie powiodły się: {models_to_try}")
+        raise last_error or AIUnavailableError(f"Wszystkie modele niedostępne lub wyłączone przez circuit breaker: {', '.join(models_to_try)}")
+    
     async def stream_chat(
         self,
         messages: List[Dict[str, str]],
         model: Optional[str] = None,
         timeout: Optional[float] = None,
+        user_id: Optional[str] = None,
     ) -> AsyncIterator[str]:
         """
         Streamuje chunki odpowiedzi czatu.
         
+        Slot bulkheadu jest zajęty przez cały czas streamingu.
+        
         Args:
             messages: Lista słowników wiadomości
             model: Nazwa modelu
             timeout: Timeout żądania
+            user_id: Użytkownik (kolejka w bulkheadzie)
             
         Yields:
             Chunki tekstu odpowiedzi
@@ -429,37 +778,39 @@ class G4FService:
             AITimeoutError: Jeśli żądanie przekroczy limit czasu
             AIRateLimitError: Jeśli przekroczono limit żądań
         """
-        response = await self.generate_chat(
-            messages=messages,
-            model=model,
-            stream=True,
-            timeout=timeout,
-        )
+        async with self._slot(user_id):
+            response = await self.generate_chat(
+                messages=messages,
+                model=model,
+                stream=True,
+                timeout=timeout,
+                user_id=user_id,
+            )
         
-        try:
-            buffer = ""
-            async for chunk in response:
-                chunk_content = None
-                if hasattr(chunk, 'choices') and chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'content') and delta.content:
-                        chunk_content = delta.content
-                elif hasattr(chunk, 'content') and chunk.content:
-                    chunk_content = chunk.content
+            try:
+                buffer = ""
+                async for chunk in response:
+                    chunk_content = None
+                    if hasattr(chunk, 'choices') and chunk.choices:
+                        delta = chunk.choices[0].delta
+                        if hasattr(delta, 'content') and delta.content:
+                            chunk_content = delta.content
+                    elif hasattr(chunk, 'content') and chunk.content:
+                        chunk_content = chunk.content
                 
-                if chunk_content:
-                    buffer += chunk_content
-                    check_buffer = buffer[-200:].lower()
-                    if 'discord.gg' in check_buffer or ('airforce' in check_buffer and 'model does not exist' in check_buffer):
-                        logger.warning("Wykryto spam AirForce w odpowiedzi streamingu")
-                        raise AIUnavailableError("Provider zablokowany: wykryto spam AirForce w odpowiedzi")
+                    if chunk_content:
+                        buffer += chunk_content
+                        check_buffer = buffer[-200:].lower()
+                        if 'discord.gg' in check_buffer or ('airforce' in check_buffer and 'model does not exist' in check_buffer):
+                            logger.warning("Wykryto spam AirForce w odpowiedzi streamingu")
+                            raise AIUnavailableError("Provider zablokowany: wykryto spam AirForce w odpowiedzi")
                     
-                    yield chunk_content
-        except Exception as e:
-            if isinstance(e, (AIUnavailableError, AITimeoutError, AIRateLimitError, AIValidationError)):
-                raise
-            logger.error(f"Streaming nie powiódł się: {str(e)}", exc_info=True)
-            raise AIUnavailableError(f"Streaming nie powiódł się: {str(e)}")
+                        yield chunk_content
+            except Exception as e:
+                if isinstance(e, (AIUnavailableError, AITimeoutError, AIRateLimitError, AIValidationError)):
+                    raise
+                logger.error(f"Streaming nie powiódł się: {str(e)}", exc_info=True)
+                raise AIUnavailableError(f"Streaming nie powiódł się: {str(e)}")
 
 
 _service_instance: Optional[G4FService] = None
@@ -481,6 +832,23 @@ def get_g4f_service() -> G4FService:
             default_timeout=getattr(settings, 'G4F_TIMEOUT', DEFAULT_TIMEOUT),
             fallback_models=getattr(settings, 'G4F_FALLBACK_MODELS', []),
             blocked_providers=getattr(settings, 'G4F_BLOCKED_PROVIDERS', []),
+            cache=_cache_from_settings(settings),
+            single_flight=getattr(settings, 'AI_SINGLE_FLIGHT', True),
+            hedging=HedgePolicy.from_settings(settings),
+            deadline_budget=getattr(settings, 'G4F_DEADLINE', DEFAULT_DEADLINE),
+            breaker=CircuitBreaker.from_settings(settings),
+            router=ModelRouter.from_settings(settings),
+            bulkhead=Bulkhead.from_settings(settings),
         )
     return _service_instance
 
+
+def _cache_from_settings(settings) -> Optional[ResponseCache]:
+    if not getattr(settings, 'AI_CACHE_ENABLED', True):
+        return None
+    return ResponseCache(
+        max_entries=getattr(settings, 'AI_CACHE_MAX_ENTRIES', 1000),
+        ttl=getattr(settings, 'AI_CACHE_TTL', 3600.0),
+        disk_path=getattr(settings, 'AI_CACHE_DB_PATH', None) or None,
+    )
+
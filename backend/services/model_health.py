@@ -0,0 +1,384 @@
+"""
+Per-model health of the AI upstream, as seen from this process.
+
+LatencyTracker keeps the latencies of recent successful calls per model and
+answers percentile queries (p95 drives the adaptive hedge delay).
+HedgePolicy decides when G4FService fires a fallback model in parallel with a
+slow one, and caps how many extra upstream calls hedging may add: each request
+earns `budget_ratio` of a hedge token, each hedge spends one, so hedges stay
+below that fraction of traffic (plus a small burst).
+CircuitBreaker stops calling a model whose recent calls mostly fail or time
+out, and lets a single probe through after a cool-down.
+ModelRouter orders the models of each call by expected latency and derives
+per-model timeouts from their p95.
+"""
+
+import math
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+DEFAULT_WINDOW = 100
+DEFAULT_MIN_SAMPLES = 20
+
+DEFAULT_HEDGE_DELAY = 10.0
+DEFAULT_HEDGE_MIN_DELAY = 1.0
+DEFAULT_HEDGE_MAX_EXTRA = 1
+DEFAULT_HEDGE_BUDGET_RATIO = 0.1
+DEFAULT_HEDGE_BURST = 5.0
+
+
+class LatencyTracker:
+    def __init__(self, window: int = DEFAULT_WINDOW, min_samples: int = DEFAULT_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        """q-th percentile (0-100) of recent latencies; None until min_samples are known"""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def metrics(self) -> Dict[str, Dict[str, object]]:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": self.percentile(model, 50),
+                "p95": self.percentile(model, 95),
+            }
+            for model, samples in self._samples.items()
+        }
+
+
+class HedgePolicy:
+    def __init__(self, delay: float = DEFAULT_HEDGE_DELAY, adaptive: bool = True,
+                 min_delay: float = DEFAULT_HEDGE_MIN_DELAY, max_extra: int = DEFAULT_HEDGE_MAX_EXTRA,
+                 budget_ratio: float = DEFAULT_HEDGE_BUDGET_RATIO, burst: float = DEFAULT_HEDGE_BURST):
+        self.delay = delay
+        self.adaptive = adaptive
+        self.min_delay = min_delay
+        self.max_extra = max_extra
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self._tokens = burst
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["HedgePolicy"]:
+        if not getattr(settings, 'G4F_HEDGE_ENABLED', False):
+            return None
+        return cls(
+            delay=getattr(settings, 'G4F_HEDGE_DELAY', DEFAULT_HEDGE_DELAY),
+            adaptive=getattr(settings, 'G4F_HEDGE_ADAPTIVE', True),
+            min_delay=getattr(settings, 'G4F_HEDGE_MIN_DELAY', DEFAULT_HEDGE_MIN_DELAY),
+            max_extra=getattr(settings, 'G4F_HEDGE_MAX_EXTRA', DEFAULT_HEDGE_MAX_EXTRA),
+            budget_ratio=getattr(settings, 'G4F_HEDGE_BUDGET_RATIO', DEFAULT_HEDGE_BUDGET_RATIO),
+        )
+
+    def hedge_delay(self, model: str, latencies: LatencyTracker) -> float:
+        """Seconds to wait for `model` before hedging: its p95 if adaptive and known, else the static delay"""
+        if self.adaptive:
+            p95 = latencies.percentile(model, 95)
+            if p95 is not None:
+                return max(p95, self.min_delay)
+        return self.delay
+
+    def start_request(self) -> None:
+        self.requests += 1
+        self._tokens = min(self.burst, self._tokens + self.budget_ratio)
+
+    def try_hedge(self) -> bool:
+        """Spend one hedge token; False when the budget is exhausted"""
+        if self._tokens < 1:
+            self.denied += 1
+            return False
+        self._tokens -= 1
+        self.hedges += 1
+        return True
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "delay": self.delay,
+            "adaptive": self.adaptive,
+            "max_extra": self.max_extra,
+            "budget_ratio": self.budget_ratio,
+            "budget_tokens": round(self._tokens, 2),
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "denied": self.denied,
+        }
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_BREAKER_WINDOW = 60.0
+DEFAULT_BREAKER_MIN_CALLS = 5
+DEFAULT_BREAKER_ERROR_RATE = 0.5
+DEFAULT_BREAKER_OPEN_SECONDS = 30.0
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes: Deque[Tuple[float, bool]] = deque()
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        self.opens = 0
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    Closed: calls go through; outcomes (timeouts count as failures) are kept for
+    `window` seconds and once at least `min_calls` are known with an error rate of
+    `error_rate` or more the circuit opens. Open: the model is skipped without a
+    call for `open_seconds`. Half-open: one probe call is let through; success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, window: float = DEFAULT_BREAKER_WINDOW, min_calls: int = DEFAULT_BREAKER_MIN_CALLS,
+                 error_rate: float = DEFAULT_BREAKER_ERROR_RATE, open_seconds: float = DEFAULT_BREAKER_OPEN_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._circuits: Dict[str, _Circuit] = {}
+        self.skipped = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["CircuitBreaker"]:
+        if not getattr(settings, 'G4F_BREAKER_ENABLED', True):
+            return None
+        return cls(
+            window=getattr(settings, 'G4F_BREAKER_WINDOW', DEFAULT_BREAKER_WINDOW),
+            min_calls=getattr(settings, 'G4F_BREAKER_MIN_CALLS', DEFAULT_BREAKER_MIN_CALLS),
+            error_rate=getattr(settings, 'G4F_BREAKER_ERROR_RATE', DEFAULT_BREAKER_ERROR_RATE),
+            open_seconds=getattr(settings, 'G4F_BREAKER_OPEN_SECONDS', DEFAULT_BREAKER_OPEN_SECONDS),
+        )
+
+    def _circuit(self, model: str) -> _Circuit:
+        circuit = self._circuits.get(model)
+        if circuit is None:
+            circuit = self._circuits[model] = _Circuit()
+        return circuit
+
+    def state(self, model: str) -> str:
+        circuit = self._circuits.get(model)
+        if circuit is None:
+            return CLOSED
+        if circuit.state == OPEN and self._clock() - circuit.opened_at >= self.open_seconds:
+            return HALF_OPEN
+        return circuit.state
+
+    def is_open(self, model: str) -> bool:
+        """True while calls to the model are refused (does not take the half-open probe)"""
+        return self.state(model) == OPEN
+
+    def allow(self, model: str) -> bool:
+        """Whether a new call to the model may start; in half-open takes the single probe slot"""
+        circuit = self._circuits.get(model)
+        if circuit is None or circuit.state == CLOSED:
+            return True
+        now = self._clock()
+        if circuit.state == OPEN:
+            if now - circuit.opened_at < self.open_seconds:
+                self.skipped += 1
+                return False
+            circuit.state = HALF_OPEN
+            circuit.probe_started = None
+        # A probe that never reported back (cancelled) frees its slot after open_seconds
+        if circuit.probe_started is not None and now - circuit.probe_started < self.open_seconds:
+            self.skipped += 1
+            return False
+        circuit.probe_started = now
+        return True
+
+    def record_success(self, model: str) -> None:
+        circuit = self._circuit(model)
+        if circuit.state != CLOSED:
+            circuit.state = CLOSED
+            circuit.outcomes.clear()
+            circuit.probe_started = None
+        self._add(circuit, True)
+
+    def record_failure(self, model: str) -> None:
+        circuit = self._circuit(model)
+        now = self._clock()
+        if circuit.state == HALF_OPEN:
+            self._open(circuit, now)
+            return
+        self._add(circuit, False)
+        failures, calls = self._counts(circuit)
+        if circuit.state == CLOSED and calls >= self.min_calls and failures / calls >= self.error_rate:
+            self._open(circuit, now)
+
+    def _open(self, circuit: _Circuit, now: float) -> None:
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.probe_started = None
+        circuit.opens += 1
+
+    def _add(self, circuit: _Circuit, ok: bool) -> None:
+        now = self._clock()
+        circuit.outcomes.append((now, ok))
+        while circuit.outcomes and circuit.outcomes[0][0] <= now - self.window:
+            circuit.outcomes.popleft()
+
+    def _counts(self, circuit: _Circuit) -> Tuple[int, int]:
+        cutoff = self._clock() - self.window
+        recent = [ok for at, ok in circuit.outcomes if at > cutoff]
+        return recent.count(False), len(recent)
+
+    def metrics(self) -> Dict[str, object]:
+        models = {}
+        for model, circuit in self._circuits.items():
+            failures, calls = self._counts(circuit)
+            error_rate = failures / calls if calls else 0.0
+            state = self.state(model)
+            models[model] = {
+                "state": state,
+                "calls": calls,
+                "error_rate": round(error_rate, 3),
+                # 1.0 = healthy, 0.0 = open
+                "score": 0.0 if state == OPEN else round(1.0 - error_rate, 3),
+                "opens": circuit.opens,
+                "retry_in": round(max(0.0, circuit.opened_at + self.open_seconds - self._clock()), 1)
+                if state == OPEN else None,
+            }
+        return {"skipped": self.skipped, "models": models}
+
+
+DEFAULT_ROUTER_ALPHA = 0.2
+DEFAULT_ROUTER_PRIOR_LATENCY = 5.0
+DEFAULT_ROUTER_TIMEOUT_FACTOR = 1.5
+DEFAULT_ROUTER_MIN_TIMEOUT = 5.0
+# Success-rate floor so a failing model gets a large but finite expected latency
+MIN_SUCCESS_RATE = 0.05
+ROUTER_DECISIONS_KEPT = 50
+
+
+class _ModelStats:
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.success = 1.0
+        self.calls = 0
+
+
+class ModelRouter:
+    """
+    Orders candidate models by expected latency and sizes their timeouts.
+
+    Per model it keeps EWMAs (weight `alpha` for the newest sample) of the latency
+    of successful calls, of the time to the first streamed chunk and of the
+    success rate. Expected latency is latency / success rate, i.e. the time to get
+    an answer counting failed tries; models without data are assumed to answer
+    in `prior_latency` seconds. A model's timeout is `timeout_factor` x its p95
+    (from the LatencyTracker), at least `min_timeout` and never above the timeout
+    the caller asked for. Timed-out calls are recorded in the LatencyTracker at
+    their timeout (G4FService._record_timeout), so a model that got slower pushes
+    its p95 up and gets longer timeouts again instead of timing out for good.
+    """
+
+    def __init__(self, latencies: Optional[LatencyTracker] = None, alpha: float = DEFAULT_ROUTER_ALPHA,
+                 prior_latency: float = DEFAULT_ROUTER_PRIOR_LATENCY,
+                 timeout_factor: float = DEFAULT_ROUTER_TIMEOUT_FACTOR,
+                 min_timeout: float = DEFAULT_ROUTER_MIN_TIMEOUT):
+        self.latencies = latencies or LatencyTracker()
+        self.alpha = alpha
+        self.prior_latency = prior_latency
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self._stats: Dict[str, _ModelStats] = {}
+        self.decisions: Deque[Dict[str, object]] = deque(maxlen=ROUTER_DECISIONS_KEPT)
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["ModelRouter"]:
+        if not getattr(settings, 'G4F_ROUTER_ENABLED', True):
+            return None
+        return cls(
+            alpha=getattr(settings, 'G4F_ROUTER_ALPHA', DEFAULT_ROUTER_ALPHA),
+            prior_latency=getattr(settings, 'G4F_ROUTER_PRIOR_LATENCY', DEFAULT_ROUTER_PRIOR_LATENCY),
+            timeout_factor=getattr(settings, 'G4F_ROUTER_TIMEOUT_FACTOR', DEFAULT_ROUTER_TIMEOUT_FACTOR),
+            min_timeout=getattr(settings, 'G4F_ROUTER_MIN_TIMEOUT', DEFAULT_ROUTER_MIN_TIMEOUT),
+        )
+
+    def _model(self, model: str) -> _ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = _ModelStats()
+        return stats
+
+    def _ewma(self, current: Optional[float], sample: float) -> float:
+        return sample if current is None else current + self.alpha * (sample - current)
+
+    def record_latency(self, model: str, seconds: float) -> None:
+        stats = self._model(model)
+        stats.latency = self._ewma(stats.latency, seconds)
+
+    def record_ttft(self, model: str, seconds: float) -> None:
+        stats = self._model(model)
+        stats.ttft = self._ewma(stats.ttft, seconds)
+
+    def record_outcome(self, model: str, ok: bool) -> None:
+        stats = self._model(model)
+        stats.calls += 1
+        stats.success = self._ewma(stats.success, 1.0 if ok else 0.0)
+
+    def expected_latency(self, model: str, stream: bool = False) -> float:
+        stats = self._stats.get(model)
+        if stats is None:
+            return self.prior_latency
+        latency = (stats.ttft if stream else None) or stats.latency or self.prior_latency
+        return latency / max(stats.success, MIN_SUCCESS_RATE)
+
+    def timeout_for(self, model: str, timeout: float) -> float:
+        p95 = self.latencies.percentile(model, 95)
+        if p95 is None:
+            return timeout
+        return min(timeout, max(self.min_timeout, p95 * self.timeout_factor))
+
+    def route(self, models: List[str], timeout: float, stream: bool = False) -> List[str]:
+        """Models sorted by expected latency (ties keep the configured order); the decision is kept for debugging"""
+        expected = {model: self.expected_latency(model, stream) for model in models}
+        ordered = sorted(models, key=lambda model: expected[model])
+        self.decisions.append({
+            "at": time.time(),
+            "stream": stream,
+            "configured": list(models),
+            "routed": ordered,
+            "expected_latency": {model: round(value, 3) for model, value in expected.items()},
+            "timeouts": {model: round(self.timeout_for(model, timeout), 3) for model in ordered},
+        })
+        return ordered
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            model: {
+                "calls": stats.calls,
+                "ewma_latency": round(stats.latency, 3) if stats.latency is not None else None,
+                "ewma_ttft": round(stats.ttft, 3) if stats.ttft is not None else None,
+                "ewma_success": round(stats.success, 3),
+                "expected_latency": round(self.expected_latency(model), 3),
+                "p95": self.latencies.percentile(model, 95),
+            }
+            for model, stats in self._stats.items()
+        }
@@ -0,0 +1,108 @@
+"""
+Time-driven priority refresh.
+
+priority_score depends on days-to-deadline, which changes as time passes even
+when nobody touches a project. Every PRIORITY_REFRESH_INTERVAL seconds this
+job finds projects whose days-to-deadline bucket differs from the one stored
+in projects.priority_days (so each project is refreshed at most once per day)
+and recomputes their topics with set-based UPDATEs, PRIORITY_REFRESH_CHUNK_SIZE
+projects per transaction.
+
+With several uvicorn workers only the one holding the advisory lock does the
+work; the others skip the round.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.user_db import engine as default_engine
+from database.locks import advisory_lock
+from database.models import Project as ProjectModel, Topic as TopicModel
+from database.project_repository import topic_priorities_update
+from services.priority_service import days_to_deadline_expression
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_REFRESH_LOCK_NAME = "focusflow_priority_refresh"
+DEFAULT_REFRESH_INTERVAL = 600.0
+DEFAULT_CHUNK_SIZE = 200
+
+
+async def refresh_stale_priorities(engine: Optional[AsyncEngine] = None, now: Optional[datetime] = None,
+                                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Recompute topics of projects whose days-to-deadline changed. Returns the number of projects refreshed."""
+    engine = engine or default_engine
+    now = now or datetime.now().replace(microsecond=0)
+    days = days_to_deadline_expression(ProjectModel.deadline, now)
+    refreshed = 0
+
+    async with engine.connect() as conn:
+        async with advisory_lock(conn, PRIORITY_REFRESH_LOCK_NAME) as acquired:
+            if not acquired:
+                return 0
+
+            while True:
+                result = await conn.execute(
+                    select(ProjectModel.id)
+                    .where(or_(ProjectModel.priority_days.is_(None), ProjectModel.priority_days != days))
+                    .limit(chunk_size)
+                )
+                project_ids = list(result.scalars().all())
+                if not project_ids:
+                    break
+
+                await conn.execute(topic_priorities_update(now, TopicModel.project_id.in_(project_ids)))
+                await conn.execute(
+                    update(ProjectModel)
+                    .where(ProjectModel.id.in_(project_ids))
+                    .values(priority_days=days)
+                )
+                await conn.commit()
+                refreshed += len(project_ids)
+
+    if refreshed:
+        logger.info(f"Odświeżono priorytety tematów w {refreshed} projektach")
+    return refreshed
+
+
+class PriorityScheduler:
+    def __init__(self, engine: Optional[AsyncEngine] = None, interval: float = DEFAULT_REFRESH_INTERVAL,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._engine = engine
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await refresh_stale_priorities(self._engine, chunk_size=self.chunk_size)
+            except Exception as e:
+                logger.error(f"Odświeżanie priorytetów nie powiodło się: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_priority_scheduler() -> PriorityScheduler:
+    from config import settings
+    return PriorityScheduler(
+        interval=getattr(settings, 'PRIORITY_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL),
+        chunk_size=getattr(settings, 'PRIORITY_REFRESH_CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+    )
@@ -1,4 +1,6 @@
 from datetime import datetime
+from sqlalchemy import case, literal, literal_column
+from database.expressions import days_between
 
 def calculate_priority(confidence_level: int, stuck_count: int, days_to_deadline: int) -> float:
     """Calculate topic priority based on confidence, stuck count, and deadline"""
@@ -12,4 +14,26 @@ def calculate_priority(confidence_level: int, stuck_count: int, days_to_deadline
 
 def calculate_days_to_deadline(deadline: datetime) -> int:
     """Calculate days remaining until deadline"""
-    return (deadline - datetime.now()).days
\ No newline at end of file
+    return (deadline - datetime.now()).days
+
+def days_to_deadline_at(deadline: datetime, now: datetime) -> int:
+    """days_to_deadline_expression in Python: whole days between whole-second timestamps, at least 1"""
+    seconds = (deadline.replace(microsecond=0) - now.replace(microsecond=0)).total_seconds()
+    return max(int(seconds // 86400), 1)
+
+
+# SQL counterparts, used by set-based UPDATEs. They mirror the functions above
+# operation by operation so both produce the same IEEE doubles: the constants are
+# written with an exponent because MySQL reads 1.0 / 0.2 as exact DECIMALs.
+
+def days_to_deadline_expression(deadline, now: datetime):
+    """SQL: whole days from `now` to the deadline column, clamped to at least 1"""
+    # Truncates toward zero where timedelta.days floors; they differ only below 1, which is clamped
+    days = days_between(literal(now), deadline)
+    return case((days <= 0, 1), else_=days)
+
+def priority_expression(confidence_level, stuck_count, days_to_deadline):
+    """SQL: calculate_priority over column expressions (days already clamped)"""
+    confidence_factor = 6 - confidence_level
+    stuck_multiplier = literal_column("1e0") + stuck_count * literal_column("2e-1")
+    return (literal_column("1e0") / days_to_deadline) * confidence_factor * stuck_multiplier
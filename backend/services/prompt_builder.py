@@ -0,0 +1,105 @@
+"""
+Token-budgeted prompt assembly for the study assistant.
+
+History arrives newest-last (as stored); turns are taken newest-first until
+the budget is spent, so the oldest turns are the ones dropped. The turn that
+crosses the budget is cut down to its most recent part instead of being
+dropped outright, provided a useful amount of it still fits.
+
+Token counts are estimates (no tokenizer dependency): roughly one token per
+four characters of a word, one per punctuation mark, plus a fixed per-message
+overhead. Chat history is resent on every question, so estimates are cached.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+from models.chat import ChatMessage
+
+DEFAULT_TOKEN_BUDGET = 3000
+DEFAULT_HISTORY_MESSAGES = 20
+
+# Role markers and separators added by chat formats around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# A truncated turn shorter than this is noise rather than context
+MIN_TRUNCATED_TOKENS = 32
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "…"
+SUMMARY_HEADER = "Podsumowanie wcześniejszej części rozmowy:"
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def _count_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        tokens += -(-len(piece) // CHARS_PER_TOKEN)
+    return tokens
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """Przybliżona liczba tokenów tekstu"""
+    return _count_tokens(text)
+
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the end of text so that it fits in about max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+
+    # Start from the character estimate and shrink until the estimate agrees
+    keep = max_tokens * CHARS_PER_TOKEN
+    while keep > 0:
+        tail = TRUNCATION_MARKER + text[-keep:].lstrip()
+        # Uncached: the candidate tails are throwaway strings
+        if _count_tokens(tail) <= max_tokens:
+            return tail
+        keep -= max(keep // 8, 1)
+    return ""
+
+
+def build_messages(
+    system_prompt: str,
+    chat_history: Sequence[ChatMessage],
+    user_message: str,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    summary: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """
+    Assemble system prompt, as much recent history as fits, and the question.
+
+    The system prompt (with the conversation summary appended, if any) and the
+    question are always sent; history fills what is left of token_budget,
+    newest turn first.
+    """
+    if summary:
+        system_prompt = f"{system_prompt}\n\n{SUMMARY_HEADER}\n{summary}"
+    remaining = token_budget - message_tokens(system_prompt) - message_tokens(user_message)
+
+    history: List[Dict[str, str]] = []
+    for msg in reversed(chat_history):
+        cost = message_tokens(msg.content)
+        if cost <= remaining:
+            history.append({"role": msg.role.value, "content": msg.content})
+            remaining -= cost
+            continue
+
+        available = remaining - MESSAGE_OVERHEAD_TOKENS
+        if available >= MIN_TRUNCATED_TOKENS:
+            history.append({"role": msg.role.value, "content": truncate_to_tokens(msg.content, available)})
+        break
+
+    history.reverse()
+    return [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": user_message},
+    ]
@@ -0,0 +1,294 @@
+"""
+Per-user token-bucket rate limits for the AI routes.
+
+Each route group has a policy: a bucket of `burst` tokens refilled at
+`per_minute` tokens a minute. A request takes one token from the bucket of
+(group, user); an empty bucket means 429 with Retry-After. Groups:
+- "ai":   /api/ai/generate, /api/ai/stream
+- "chat": /api/chat/message, /api/chat/message/stream
+
+Buckets live in process memory by default, so every worker has its own. With
+RATE_LIMIT_DB_PATH set they live in a SQLite file shared by all workers on the
+host; the read-refill-take-write of one bucket runs in one write transaction.
+Another shared store only has to provide `take()`.
+
+Responses carry RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset /
+RateLimit-Policy headers (IETF draft "RateLimit header fields for HTTP"). The
+route dependency (dependencies.rate_limit) leaves them in request.state and
+RateLimitHeadersMiddleware adds them to whatever response goes out - also SSE
+streams and errors raised after the check.
+"""
+
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from exceptions import AIRateLimitError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICIES = {
+    "ai": (10, 6.0),
+    "chat": (20, 12.0),
+}
+# Memory store: least recently used buckets beyond this are dropped (they would
+# mostly be full again anyway)
+DEFAULT_MAX_KEYS = 10_000
+# Idle buckets are pruned from the SQLite store every this many takes
+DISK_PRUNE_EVERY = 500
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    burst: int
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        """Tokens per second"""
+        return self.per_minute / 60.0
+
+    @property
+    def window(self) -> int:
+        """Seconds to refill an empty bucket"""
+        return max(1, math.ceil(self.burst / self.rate))
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    policy: RatePolicy
+    tokens: float
+    retry_after: float
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        reset = (self.policy.burst - self.tokens) / self.policy.rate
+        headers = {
+            "RateLimit-Limit": str(self.policy.burst),
+            "RateLimit-Remaining": str(max(0, math.floor(self.tokens))),
+            "RateLimit-Reset": str(max(0, math.ceil(reset))),
+            "RateLimit-Policy": f"{self.policy.burst};w={self.policy.window}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _refill(tokens: float, updated: float, policy: RatePolicy, now: float) -> float:
+    return min(float(policy.burst), tokens + max(0.0, now - updated) * policy.rate)
+
+
+def _take(tokens: float, policy: RatePolicy) -> Tuple[bool, float, float]:
+    """(allowed, tokens left, seconds until one token)"""
+    if tokens >= 1.0:
+        return True, tokens - 1.0, 0.0
+    return False, tokens, (1.0 - tokens) / policy.rate
+
+
+class MemoryBucketStore:
+    """Buckets of this worker only"""
+
+    shared = False
+
+    def __init__(self, max_keys: int = DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, policy: RatePolicy, now: float) -> Tuple[bool, float, float]:
+        bucket = self._buckets.get(key)
+        tokens = float(policy.burst) if bucket is None else _refill(bucket[0], bucket[1], policy, now)
+        allowed, tokens, retry_after = _take(tokens, policy)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens, retry_after
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def close(self) -> None:
+        self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """SQLite file shared by all workers; calls are blocking and run in a thread"""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._takes = 0
+        # timeout: how long a worker waits for another one's write transaction
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    async def take(self, key: str, policy: RatePolicy, now: float) -> Tuple[bool, float, float]:
+        return await asyncio.to_thread(self._take_sync, key, policy, now)
+
+    def _take_sync(self, key: str, policy: RatePolicy, now: float) -> Tuple[bool, float, float]:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers cannot
+            # both read the same token count
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = float(policy.burst) if row is None else _refill(row[0], row[1], policy, now)
+                allowed, tokens, retry_after = _take(tokens, policy)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._takes += 1
+                if self._takes % DISK_PRUNE_EVERY == 0:
+                    self._prune(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed, tokens, retry_after
+
+    def _prune(self, now: float) -> None:
+        # A bucket idle for a day is full under any sensible policy
+        self._conn.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - 86400,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    def __init__(self, policies: Optional[Dict[str, RatePolicy]] = None, store=None,
+                 clock: Callable[[], float] = time.time):
+        self.policies = policies if policies is not None else {
+            group: RatePolicy(burst, per_minute) for group, (burst, per_minute) in DEFAULT_POLICIES.items()
+        }
+        self.store = store if store is not None else MemoryBucketStore()
+        # Wall clock, not loop.time(): buckets in a shared store are read by other processes
+        self._clock = clock
+        self.allowed = 0
+        self.limited = 0
+        self.store_errors = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["RateLimiter"]:
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        policies = {
+            "ai": RatePolicy(
+                getattr(settings, 'RATE_LIMIT_AI_BURST', DEFAULT_POLICIES["ai"][0]),
+                getattr(settings, 'RATE_LIMIT_AI_PER_MINUTE', DEFAULT_POLICIES["ai"][1]),
+            ),
+            "chat": RatePolicy(
+                getattr(settings, 'RATE_LIMIT_CHAT_BURST', DEFAULT_POLICIES["chat"][0]),
+                getattr(settings, 'RATE_LIMIT_CHAT_PER_MINUTE', DEFAULT_POLICIES["chat"][1]),
+            ),
+        }
+        store = None
+        path = getattr(settings, 'RATE_LIMIT_DB_PATH', '')
+        if path:
+            try:
+                store = SQLiteBucketStore(path)
+            except sqlite3.Error as e:
+                logger.error(f"Nie udało się otworzyć współdzielonych limitów {path}, limity per worker: {e}")
+        return cls(policies, store)
+
+    async def check(self, group: str, user_id: str) -> RateLimitResult:
+        policy = self.policies[group]
+        try:
+            allowed, tokens, retry_after = await self.store.take(f"{group}:{user_id}", policy, self._clock())
+        except sqlite3.Error as e:
+            # A broken limiter must not take the AI routes down with it
+            self.store_errors += 1
+            logger.warning(f"Odczyt limitu żądań nie powiódł się, żądanie przepuszczone: {e}")
+            return RateLimitResult(True, policy, float(policy.burst), 0.0)
+        if allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+        return RateLimitResult(allowed, policy, tokens, retry_after)
+
+    async def hit(self, group: str, user_id: str) -> RateLimitResult:
+        """check(), raising AIRateLimitError (429 + RateLimit-* headers) when the bucket is empty"""
+        result = await self.check(group, user_id)
+        if not result.allowed:
+            logger.info(f"Limit żądań '{group}' wyczerpany dla użytkownika {user_id}")
+            error = AIRateLimitError(
+                "Zbyt wiele żądań AI. Spróbuj ponownie później",
+                retry_after=result.retry_after,
+            )
+            error.headers = result.headers
+            raise error
+        return result
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "shared": self.store.shared,
+            "policies": {
+                group: {"burst": policy.burst, "per_minute": policy.per_minute}
+                for group, policy in self.policies.items()
+            },
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "store_errors": self.store_errors,
+        }
+
+    def close(self) -> None:
+        self.store.close()
+
+
+# Key in request.state (scope["state"]) under which the checked limit's headers wait
+STATE_KEY = "rate_limit_headers"
+
+
+class RateLimitHeadersMiddleware:
+    """Pure ASGI, so streamed responses pass through unbuffered"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = scope.setdefault("state", {})
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start" and state.get(STATE_KEY):
+                headers = MutableHeaders(scope=message)
+                for name, value in state[STATE_KEY].items():
+                    if name not in headers:
+                        headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_loaded = False
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Pobiera lub tworzy globalny limiter żądań AI (None, gdy wyłączony)."""
+    global _rate_limiter, _rate_limiter_loaded
+    if not _rate_limiter_loaded:
+        from config import settings
+        _rate_limiter = RateLimiter.from_settings(settings)
+        _rate_limiter_loaded = True
+    return _rate_limiter
@@ -0,0 +1,167 @@
+"""
+Exact-match cache of AI responses.
+
+Keyed on a hash of the requested model and the sanitized messages, so the same
+prompt ("wyjaśnij X prosto") asked in different sessions is answered once per
+AI_CACHE_TTL. The memory tier is an LRU bounded to AI_CACHE_MAX_ENTRIES; an
+optional SQLite file (AI_CACHE_DB_PATH) keeps answers across restarts and is
+consulted on memory misses.
+
+Only successful, non-empty, non-streamed answers are stored.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL = 3600.0
+# Expired/overflow rows are pruned from the disk tier every this many writes
+DISK_PRUNE_EVERY = 100
+
+
+def make_cache_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """Hash of model + messages; whitespace and role case are already normalized by sanitization"""
+    payload = json.dumps([model, [[m["role"], m["content"]] for m in messages]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _DiskTier:
+    """SQLite file shared by all workers; calls are blocking and run in a thread"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ai_response_cache_expires_at ON ai_response_cache (expires_at)"
+        )
+
+    def get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM ai_response_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, response: str, expires_at: float, now: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, expires_at),
+            )
+            self._writes += 1
+            if self._writes % DISK_PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM ai_response_cache WHERE key NOT IN "
+            "(SELECT key FROM ai_response_cache ORDER BY expires_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL,
+                 disk_path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._disk: Optional[_DiskTier] = None
+        if disk_path:
+            try:
+                self._disk = _DiskTier(disk_path, max_entries * 10)
+            except sqlite3.Error as e:
+                logger.error(f"Nie udało się otworzyć dyskowego cache AI {disk_path}: {e}")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            self.expirations += 1
+
+        if self._disk is not None:
+            try:
+                stored = await asyncio.to_thread(self._disk.get, key, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Odczyt dyskowego cache AI nie powiódł się: {e}")
+                stored = None
+            if stored is not None:
+                self._remember(key, stored[0], stored[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return stored[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: str) -> None:
+        if not response:
+            return
+        now = self._clock()
+        expires_at = now + self.ttl
+        self._remember(key, response, expires_at)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, response, expires_at, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Zapis dyskowego cache AI nie powiódł się: {e}")
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def metrics(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
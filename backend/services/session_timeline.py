@@ -0,0 +1,94 @@
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.session import SessionEvent, SessionEventType, FocusSegment, SessionTimeline
+from database import session_repository
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPENS_SEGMENT = {SessionEventType.START, SessionEventType.RESUME}
+CLOSES_SEGMENT = {SessionEventType.PAUSE, SessionEventType.COMPLETE}
+
+
+def fold_events(events: Iterable[Tuple[SessionEventType, datetime]], now: datetime) -> dict:
+    """
+    Derive focus segments and timings from ordered (type, timestamp) events.
+
+    An active stretch runs from start/resume to pause/complete; one still open
+    is measured up to `now`. Out-of-order events (e.g. a second pause) are ignored.
+    """
+    segments: List[FocusSegment] = []
+    active_since: Optional[datetime] = None
+    paused_since: Optional[datetime] = None
+    paused_time = 0
+    stuck_moments = 0
+
+    for event_type, at in events:
+        if event_type == SessionEventType.STUCK:
+            stuck_moments += 1
+        elif event_type in OPENS_SEGMENT and active_since is None:
+            if paused_since is not None:
+                paused_time += int((at - paused_since).total_seconds())
+                paused_since = None
+            active_since = at
+        elif event_type in CLOSES_SEGMENT:
+            if active_since is not None:
+                segments.append(FocusSegment(
+                    start=active_since, end=at, duration=int((at - active_since).total_seconds())
+                ))
+                active_since = None
+            if event_type == SessionEventType.PAUSE:
+                paused_since = at
+            elif paused_since is not None:
+                paused_time += int((at - paused_since).total_seconds())
+                paused_since = None
+
+    if active_since is not None:
+        segments.append(FocusSegment(
+            start=active_since, end=now, duration=int((now - active_since).total_seconds())
+        ))
+    if paused_since is not None:
+        paused_time += int((now - paused_since).total_seconds())
+
+    return {
+        "segments": segments,
+        "active_time": sum(segment.duration for segment in segments),
+        "paused_time": paused_time,
+        "stuck_moments": stuck_moments,
+    }
+
+
+async def get_session_timeline(session: AsyncSession, session_id: str, user_id: str) -> Optional[SessionTimeline]:
+    """Get session's event history with focus segments derived from it"""
+    session_obj = await session_repository.get_session(session, session_id, user_id)
+    if not session_obj:
+        return None
+
+    event_models = await session_repository.get_session_events(session, session_id, user_id)
+    events = [
+        SessionEvent(type=SessionEventType(event.type), timestamp=event.created_at)
+        for event in event_models
+    ]
+
+    if not events:
+        # Sessions started before the event log have no history to fold
+        return SessionTimeline(
+            session_id=session_obj.id,
+            status=session_obj.status,
+            events=[],
+            segments=[],
+            active_time=session_obj.duration,
+            paused_time=0,
+            stuck_moments=session_obj.stuck_moments,
+        )
+
+    now = session_obj.end_time or datetime.now().replace(microsecond=0)
+    folded = fold_events(((event.type, event.timestamp) for event in events), now)
+
+    return SessionTimeline(
+        session_id=session_obj.id,
+        status=session_obj.status,
+        events=events,
+        **folded
+    )
@@ -0,0 +1,169 @@
+"""
+Server-Sent Events framing with adaptive chunk coalescing.
+
+Upstream models emit many tiny chunks (often a token each). Instead of one
+frame per chunk, text is buffered and sent as one `data: {"content": ...}`
+frame once SSE_FLUSH_BYTES have accumulated or SSE_FLUSH_INTERVAL seconds have
+passed since the first buffered chunk, whichever comes first. While upstream
+stalls with nothing buffered, a `: keepalive` comment goes out every
+SSE_KEEPALIVE_INTERVAL seconds so proxies do not drop the connection.
+
+Frame/byte counters are kept per stream and process-wide (see get_sse_metrics).
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+DEFAULT_FLUSH_BYTES = 512
+DEFAULT_FLUSH_INTERVAL = 0.03
+DEFAULT_KEEPALIVE_INTERVAL = 15.0
+
+KEEPALIVE_FRAME = ": keepalive\n\n"
+DONE_FRAME = "data: [DONE]\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+_END = object()
+
+
+class _UpstreamError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_metrics: Dict[str, int] = {
+    "streams": 0,
+    "frames": 0,
+    "bytes": 0,
+    "keepalives": 0,
+    "upstream_chunks": 0,
+}
+
+
+def get_sse_metrics() -> Dict[str, int]:
+    """Process-wide SSE counters since start"""
+    return dict(_metrics)
+
+
+class SSECoalescer:
+    def __init__(self, flush_bytes: int = DEFAULT_FLUSH_BYTES, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 keepalive_interval: float = DEFAULT_KEEPALIVE_INTERVAL):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.keepalive_interval = keepalive_interval
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.keepalives_sent = 0
+        self.upstream_chunks = 0
+        _metrics["streams"] += 1
+
+    @classmethod
+    def from_settings(cls) -> "SSECoalescer":
+        from config import settings
+        return cls(
+            flush_bytes=getattr(settings, 'SSE_FLUSH_BYTES', DEFAULT_FLUSH_BYTES),
+            flush_interval=getattr(settings, 'SSE_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+            keepalive_interval=getattr(settings, 'SSE_KEEPALIVE_INTERVAL', DEFAULT_KEEPALIVE_INTERVAL),
+        )
+
+    def event(self, payload: dict) -> str:
+        """Frame a JSON payload as one SSE event"""
+        return self._count(f"data: {json.dumps(payload)}\n\n")
+
+    def done(self) -> str:
+        return self._count(DONE_FRAME)
+
+    def keepalive(self) -> str:
+        self.keepalives_sent += 1
+        _metrics["keepalives"] += 1
+        return self._count(KEEPALIVE_FRAME)
+
+    def _count(self, frame: str) -> str:
+        size = len(frame.encode())
+        self.frames_sent += 1
+        self.bytes_sent += size
+        _metrics["frames"] += 1
+        _metrics["bytes"] += size
+        return frame
+
+    async def frames(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Coalesce upstream text chunks into content frames (plus keepalives).
+
+        Upstream errors are re-raised after whatever text preceded them has been
+        sent. Closing this iterator cancels the upstream read.
+        """
+        loop = asyncio.get_running_loop()
+        inbox: deque = deque()
+        waiter: Optional[asyncio.Future] = None
+
+        def wake() -> None:
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+        async def pump() -> None:
+            # Reads upstream independently so that a stall never blocks keepalives
+            try:
+                async for chunk in chunks:
+                    if chunk:
+                        self.upstream_chunks += 1
+                        _metrics["upstream_chunks"] += 1
+                        inbox.append(chunk)
+                        wake()
+                inbox.append(_END)
+            except Exception as e:
+                inbox.append(_UpstreamError(e))
+            wake()
+
+        reader = asyncio.create_task(pump())
+        buffer: List[str] = []
+        buffered_bytes = 0
+        deadline: Optional[float] = None
+        try:
+            while True:
+                if not inbox:
+                    timeout = deadline - loop.time() if buffer else self.keepalive_interval
+                    waiter = loop.create_future()
+                    # asyncio.wait (unlike wait_for) never swallows a cancellation racing the timeout
+                    await asyncio.wait([waiter], timeout=max(timeout, 0))
+                    waiter = None
+                    if not inbox:
+                        if buffer:
+                            yield self.event({"content": "".join(buffer)})
+                            buffer, buffered_bytes, deadline = [], 0, None
+                        else:
+                            yield self.keepalive()
+                        continue
+
+                # Everything that arrived meanwhile is taken without further awaits
+                while inbox:
+                    item = inbox.popleft()
+                    if item is _END or isinstance(item, _UpstreamError):
+                        if buffer:
+                            yield self.event({"content": "".join(buffer)})
+                        if item is _END:
+                            return
+                        raise item.error
+
+                    if not buffer:
+                        deadline = loop.time() + self.flush_interval
+                    buffer.append(item)
+                    buffered_bytes += len(item.encode())
+                    if buffered_bytes >= self.flush_bytes:
+                        yield self.event({"content": "".join(buffer)})
+                        buffer, buffered_bytes, deadline = [], 0, None
+
+                if buffer and loop.time() >= deadline:
+                    yield self.event({"content": "".join(buffer)})
+                    buffer, buffered_bytes, deadline = [], 0, None
+        finally:
+            if not reader.done():
+                reader.cancel()
+                # Waits without re-raising the reader's own cancellation
+                await asyncio.wait([reader])
@@ -1,159 +1,142 @@
-from typing import List
+from datetime import date, timedelta
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from models.stats import StatsOverview, ProjectStats, StuckTopic, StuckTopics
-from database.models import Session as SessionModel, Project as ProjectModel, Topic as TopicModel
-from database.connection import get_db
+from sqlalchemy import select
+from models.stats import StatsOverview, ProjectStats, StuckTopic, StuckTopics, DailyStudy, DailyStats, StudyStreak
+from database.models import Project as ProjectModel, Topic as TopicModel
+from database import stats_repository
+from exceptions import ValidationError
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def get_overview_stats(user_id: str) -> StatsOverview:
+DEFAULT_DAILY_RANGE_DAYS = 7
+MAX_DAILY_RANGE_DAYS = 366
+STREAK_WINDOW = 31  # study days read per query while walking the current streak
+
+async def get_overview_stats(session: AsyncSession, user_id: str) -> StatsOverview:
     """Get overall statistics for user"""
-    async for session in get_db():
-        # Total sessions
-        result = await session.execute(
-            select(func.count(SessionModel.id)).where(SessionModel.user_id == user_id)
-        )
-        total_sessions = result.scalar() or 0
-        
-        # Completed sessions
-        result = await session.execute(
-            select(func.count(SessionModel.id)).where(
-                SessionModel.user_id == user_id,
-                SessionModel.completed == True
-            )
-        )
-        completed_sessions = result.scalar() or 0
-        
-        # Total study time
-        result = await session.execute(
-            select(func.sum(SessionModel.duration)).where(SessionModel.user_id == user_id)
-        )
-        total_study_time = result.scalar() or 0
-        
-        # Total projects
-        result = await session.execute(
-            select(func.count(ProjectModel.id)).where(ProjectModel.user_id == user_id)
-        )
-        total_projects = result.scalar() or 0
-        
-        # Total topics
-        result = await session.execute(
-            select(func.count(TopicModel.id))
-            .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
-            .where(ProjectModel.user_id == user_id)
-        )
-        total_topics = result.scalar() or 0
-        
-        return StatsOverview(
-            total_sessions=total_sessions,
-            completed_sessions=completed_sessions,
-            total_study_time=total_study_time,
-            total_projects=total_projects,
-            total_topics=total_topics
-        )
+    stats_model = await stats_repository.get_user_stats(session, user_id)
+    
+    return StatsOverview(
+        total_sessions=stats_model.total_sessions,
+        completed_sessions=stats_model.completed_sessions,
+        total_study_time=stats_model.total_study_time,
+        total_projects=stats_model.total_projects,
+        total_topics=stats_model.total_topics
+    )
 
 
-async def get_project_stats(project_id: str, user_id: str) -> ProjectStats:
+async def get_project_stats(session: AsyncSession, project_id: str, user_id: str) -> ProjectStats:
     """Get statistics for specific project"""
-    async for session in get_db():
-        # Verify ownership
-        result = await session.execute(
-            select(ProjectModel.id).where(
-                ProjectModel.id == project_id,
-                ProjectModel.user_id == user_id
-            )
-        )
-        if not result.scalar_one_or_none():
-            return None
-        
-        # Total sessions for project topics
-        result = await session.execute(
-            select(func.count(SessionModel.id))
-            .join(TopicModel, SessionModel.topic_id == TopicModel.id)
-            .where(
-                TopicModel.project_id == project_id,
-                SessionModel.user_id == user_id
-            )
-        )
-        total_sessions = result.scalar() or 0
-        
-        # Completed sessions
-        result = await session.execute(
-            select(func.count(SessionModel.id))
-            .join(TopicModel, SessionModel.topic_id == TopicModel.id)
-            .where(
-                TopicModel.project_id == project_id,
-                SessionModel.user_id == user_id,
-                SessionModel.completed == True
-            )
-        )
-        completed_sessions = result.scalar() or 0
-        
-        # Total study time
-        result = await session.execute(
-            select(func.sum(SessionModel.duration))
-            .join(TopicModel, SessionModel.topic_id == TopicModel.id)
-            .where(
-                TopicModel.project_id == project_id,
-                SessionModel.user_id == user_id
-            )
-        )
-        total_study_time = result.scalar() or 0
-        
-        # Topics count
-        result = await session.execute(
-            select(func.count(TopicModel.id)).where(TopicModel.project_id == project_id)
+    stats_model = await stats_repository.get_project_stats(session, project_id, user_id)
+    if not stats_model:
+        return None
+    
+    topics_count = stats_model.topics_count
+    return ProjectStats(
+        project_id=project_id,
+        total_sessions=stats_model.total_sessions,
+        completed_sessions=stats_model.completed_sessions,
+        total_study_time=stats_model.total_study_time,
+        topics_count=topics_count,
+        average_confidence=stats_model.confidence_sum / topics_count if topics_count else 0.0
+    )
+
+
+async def get_stuck_topics(session: AsyncSession, user_id: str, limit: int = 10) -> StuckTopics:
+    """Get topics where user gets stuck most often"""
+    result = await session.execute(
+        select(
+            TopicModel.id,
+            TopicModel.name,
+            ProjectModel.name,
+            TopicModel.stuck_count,
+            TopicModel.confidence_level
         )
-        topics_count = result.scalar() or 0
-        
-        # Average confidence
-        result = await session.execute(
-            select(func.avg(TopicModel.confidence_level)).where(TopicModel.project_id == project_id)
+        .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
+        .where(
+            ProjectModel.user_id == user_id,
+            TopicModel.stuck_count > 0
         )
-        average_confidence = result.scalar() or 0.0
-        
-        return ProjectStats(
-            project_id=project_id,
-            total_sessions=total_sessions,
-            completed_sessions=completed_sessions,
-            total_study_time=total_study_time,
-            topics_count=topics_count,
-            average_confidence=float(average_confidence)
+        .order_by(TopicModel.stuck_count.desc())
+        .limit(limit)
+    )
+    rows = result.all()
+    
+    topics = []
+    for row in rows:
+        topic = StuckTopic(
+            topic_id=row[0],
+            topic_name=row[1],
+            project_name=row[2],
+            stuck_count=row[3],
+            confidence_level=row[4]
         )
+        topics.append(topic)
+    
+    return StuckTopics(topics=topics)
 
 
-async def get_stuck_topics(user_id: str, limit: int = 10) -> StuckTopics:
-    """Get topics where user gets stuck most often"""
-    async for session in get_db():
-        result = await session.execute(
-            select(
-                TopicModel.id,
-                TopicModel.name,
-                ProjectModel.name,
-                TopicModel.stuck_count,
-                TopicModel.confidence_level
-            )
-            .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
-            .where(
-                ProjectModel.user_id == user_id,
-                TopicModel.stuck_count > 0
-            )
-            .order_by(TopicModel.stuck_count.desc())
-            .limit(limit)
+async def get_daily_stats(session: AsyncSession, user_id: str, start: Optional[date] = None,
+                          end: Optional[date] = None, project_id: Optional[str] = None) -> DailyStats:
+    """Get study time per day in [start, end] (default: last 7 days)"""
+    end = end or date.today()
+    start = start or end - timedelta(days=DEFAULT_DAILY_RANGE_DAYS - 1)
+    if start > end:
+        raise ValidationError("Data początkowa musi być wcześniejsza niż końcowa")
+    if (end - start).days >= MAX_DAILY_RANGE_DAYS:
+        raise ValidationError(f"Zakres dat nie może przekraczać {MAX_DAILY_RANGE_DAYS} dni")
+    
+    rows = await stats_repository.get_daily_totals(session, user_id, start, end, project_id)
+    by_day = {row.day: row for row in rows}
+    
+    days = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day)
+        days.append(DailyStudy(
+            day=day,
+            study_time=int(row.study_time) if row else 0,
+            sessions_completed=int(row.sessions_completed) if row else 0
+        ))
+    
+    return DailyStats(
+        start=start,
+        end=end,
+        total_study_time=sum(d.study_time for d in days),
+        days=days
+    )
+
+
+def count_run(study_days: List[date], start: date) -> int:
+    """Consecutive days counted back from `start` at the head of descending, distinct study days"""
+    run = 0
+    for day in study_days:
+        if day != start - timedelta(days=run):
+            break
+        run += 1
+    return run
+
+
+async def get_study_streak(session: AsyncSession, user_id: str) -> StudyStreak:
+    """Get current and longest study streak"""
+    today = date.today()
+    study_days = await stats_repository.get_study_days(session, user_id, limit=STREAK_WINDOW)
+    last_study_day = study_days[0] if study_days else None
+    
+    # Today without study yet does not break the streak
+    start = today if last_study_day == today else today - timedelta(days=1)
+    current = 0
+    while study_days:
+        run = count_run(study_days, start - timedelta(days=current))
+        current += run
+        # Read the next window only while the whole window was one run
+        if run < STREAK_WINDOW:
+            break
+        study_days = await stats_repository.get_study_days(
+            session, user_id, limit=STREAK_WINDOW, before=study_days[-1]
         )
-        rows = result.all()
-        
-        topics = []
-        for row in rows:
-            topic = StuckTopic(
-                topic_id=row[0],
-                topic_name=row[1],
-                project_name=row[2],
-                stuck_count=row[3],
-                confidence_level=row[4]
-            )
-            topics.append(topic)
-        
-        return StuckTopics(topics=topics)
+    
+    longest = await stats_repository.get_longest_streak(session, user_id)
+    return StudyStreak(current_streak=current, longest_streak=longest, last_study_day=last_study_day)
@@ -0,0 +1,181 @@
+"""
+Buffered "Utknąłem" (I'm stuck) counters.
+
+A click only touches process memory; a background flusher writes the
+accumulated increments every STUCK_FLUSH_INTERVAL seconds (or sooner, once
+STUCK_FLUSH_MAX_PENDING clicks are waiting) in one transaction:
+batched `stuck = stuck + n` UPDATEs, the stuck events and the affected
+topics' priority. A burst of clicks becomes one write.
+
+Each worker process has its own buffer; increments are additive, so workers
+never overwrite each other. Clicks still buffered when a worker is killed
+without shutdown are lost, and so are clicks whose flush failed
+STUCK_FLUSH_MAX_ATTEMPTS times (logged and counted in `dropped`).
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import session_repository, topic_repository
+from models.session import SessionStatus, SessionStatusResponse
+from exceptions import ConflictError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_MAX_PENDING = 500
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+class StuckCounterBuffer:
+    def __init__(self, session_maker=None, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_pending: int = DEFAULT_MAX_PENDING, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self._session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        self._sessions: Counter = Counter()
+        self._events: list = []
+        self._in_flight: Counter = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._writes: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, session_id: str, user_id: str, at: datetime) -> None:
+        """Buffer one stuck click"""
+        self._sessions[session_id] += 1
+        self._events.append({"session_id": session_id, "user_id": user_id, "created_at": at, "attempts": 0})
+        if len(self._events) >= self.max_pending:
+            self._wakeup.set()
+
+    def pending_for(self, session_id: str) -> int:
+        """Clicks not yet committed for a session (buffered or being flushed)"""
+        return self._sessions[session_id] + self._in_flight[session_id]
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    async def flush(self) -> int:
+        """Write buffered increments in one transaction. Returns the number of clicks written."""
+        # Shielded: a flusher cancelled by stop() must not abandon a batch it already took out
+        # of the buffer; the write finishes (or requeues) and the final flush waits for it on the lock
+        write = asyncio.ensure_future(self._flush())
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+        return await asyncio.shield(write)
+
+    async def _flush(self) -> int:
+        async with self._flush_lock:
+            if not self._events:
+                return 0
+
+            sessions, events = self._sessions, self._events
+            self._sessions, self._events = Counter(), []
+            self._in_flight = sessions
+
+            try:
+                async with self._get_session_maker()() as session:
+                    topic_ids = await session_repository.apply_stuck_counts(session, sessions, events)
+                    await topic_repository.recompute_priorities(session, topic_ids)
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"Nie udało się zapisać kliknięć 'Utknąłem': {e}", exc_info=True)
+                self._requeue(events)
+                return 0
+            finally:
+                self._in_flight = Counter()
+
+            return len(events)
+
+    def _requeue(self, events: list) -> None:
+        """Keep failed clicks for the next flush, unless they failed max_attempts times"""
+        kept = []
+        for event in events:
+            event["attempts"] += 1
+            if event["attempts"] < self.max_attempts:
+                kept.append(event)
+        dropped = len(events) - len(kept)
+        if dropped:
+            self.dropped += dropped
+            logger.error(f"Odrzucono {dropped} kliknięć 'Utknąłem' po {self.max_attempts} nieudanych zapisach")
+        self._sessions.update(event["session_id"] for event in kept)
+        self._events[:0] = kept
+
+    async def run(self) -> None:
+        """Flush periodically, or early when max_pending clicks are waiting"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flusher and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # A batch the flusher was writing is committed or back in the buffer before the last flush
+        await asyncio.gather(*self._writes, return_exceptions=True)
+        await self.flush()
+
+    def _get_session_maker(self):
+        if self._session_maker is None:
+            from database.user_db import async_session_maker
+            self._session_maker = async_session_maker
+        return self._session_maker
+
+
+_buffer_instance: Optional[StuckCounterBuffer] = None
+
+
+def get_stuck_buffer() -> StuckCounterBuffer:
+    """Pobiera lub tworzy globalny bufor kliknięć 'Utknąłem'."""
+    global _buffer_instance
+    if _buffer_instance is None:
+        from config import settings
+        _buffer_instance = StuckCounterBuffer(
+            flush_interval=getattr(settings, 'STUCK_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+            max_pending=getattr(settings, 'STUCK_FLUSH_MAX_PENDING', DEFAULT_MAX_PENDING),
+            max_attempts=getattr(settings, 'STUCK_FLUSH_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        )
+    return _buffer_instance
+
+
+async def report_stuck(session: AsyncSession, session_id: str, user_id: str,
+                       buffer: Optional[StuckCounterBuffer] = None) -> Optional[SessionStatusResponse]:
+    """Record an "I'm stuck" moment for a running (active or paused) session"""
+    buffer = buffer or get_stuck_buffer()
+    session_obj = await session_repository.get_session(session, session_id, user_id)
+    if not session_obj:
+        return None
+
+    if session_obj.status == SessionStatus.COMPLETED:
+        raise ConflictError("Session is already completed")
+
+    buffer.record(session_id, user_id, datetime.now().replace(microsecond=0))
+
+    return SessionStatusResponse(
+        id=session_obj.id,
+        status=session_obj.status,
+        duration=session_obj.duration,
+        stuck_moments=session_obj.stuck_moments + buffer.pending_for(session_id),
+        completed=session_obj.completed
+    )
@@ -0,0 +1,104 @@
+"""
+Benchmark: prompt validation of a growing chat, previous
+_validate_and_sanitize_prompt (lowercase copy, one re.search per injection
+pattern and a re.sub for every message on every call) vs the single-pass scan
+with the memo of validated contents.
+
+Replays a conversation of --turns user/assistant exchanges; every call
+validates the whole history plus the new question, as /chat/message does.
+Reports total CPU time for the conversation and time per call.
+
+    python -m tests.bench_g4f_validation
+    python -m tests.bench_g4f_validation --turns 50 --message-chars 2000 --repeat 10
+
+Not collected by pytest (file name does not match test_*.py).
+"""
+
+import argparse
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+logging.disable(logging.WARNING)
+
+from services.g4f_service import G4FService, PROMPT_INJECTION_PATTERNS
+
+WORDS = "fotosynteza zachodzi w chloroplastach liści dzięki energii światła słonecznego ".split()
+
+
+def legacy(messages):
+    """G4FService._validate_and_sanitize_prompt before the single-pass scan"""
+    sanitized = []
+    for msg in messages:
+        role = msg.get('role', '').lower()
+        content = msg.get('content', '')
+        content_lower = content.lower()
+        for pattern in PROMPT_INJECTION_PATTERNS:
+            if re.search(pattern, content_lower, re.IGNORECASE):
+                raise ValueError(pattern)
+        content = re.sub(r'\s+', ' ', content.strip())
+        sanitized.append({'role': role, 'content': content})
+    return sanitized
+
+
+def make_text(chars: int, seed: int) -> str:
+    text = ""
+    i = seed
+    while len(text) < chars:
+        text += WORDS[i % len(WORDS)] + ("\n\n" if i % 17 == 0 else " ")
+        i += 1
+    return text[:chars]
+
+
+def conversation(turns: int, chars: int):
+    """Message lists sent on each call: whole history + new question"""
+    history, calls = [], []
+    for turn in range(turns):
+        question = {"role": "user", "content": make_text(chars // 4, turn)}
+        calls.append(history + [question])
+        history = history + [question, {"role": "assistant", "content": make_text(chars, turn * 7)}]
+    return calls
+
+
+def measure(validate, calls, repeat: int, fresh):
+    cpu = []
+    for _ in range(repeat):
+        fresh()
+        started = time.process_time()
+        for messages in calls:
+            validate(messages)
+        cpu.append((time.process_time() - started) * 1000)
+    return statistics.median(cpu)
+
+
+def main(args):
+    calls = conversation(args.turns, args.message_chars)
+    service = G4FService(enabled=False)
+
+    def reset_memo():
+        service._validated.clear()
+
+    total_messages = sum(len(messages) for messages in calls)
+    print(f"{args.turns} calls, {total_messages} messages validated in total "
+          f"(answers {args.message_chars} chars), repeat {args.repeat}")
+    print(f"{'validator':<12}{'cpu ms (median)':>18}{'ms / call':>12}")
+    for name, validate, fresh in (
+        ("legacy", legacy, lambda: None),
+        ("memoized", service._validate_and_sanitize_prompt, reset_memo),
+    ):
+        cpu = measure(validate, calls, args.repeat, fresh)
+        print(f"{name:<12}{cpu:>18.2f}{cpu / len(calls):>12.3f}")
+    print(f"memo hits {service.validation_memo_hits}, misses {service.validation_memo_misses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20, help="questions in the conversation")
+    parser.add_argument("--message-chars", type=int, default=1500, help="characters per assistant answer")
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+"""
+Benchmark: SSE framing of a streamed answer, previous /ai/stream framing
+(one frame per 10 characters of every upstream chunk) vs services.sse coalescing.
+
+Streams a ~10 KB answer from a fake upstream in token-sized chunks and reports
+frames, bytes on the wire and CPU time per answer for both emitters.
+
+    python -m tests.bench_sse
+    python -m tests.bench_sse --answer-bytes 20000 --chunk-chars 4 --repeat 50
+    python -m tests.bench_sse --pace-ms 2     # upstream pauses every 20 chunks
+
+Not collected by pytest (file name does not match test_*.py).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.sse import SSECoalescer
+
+WORDS = "fotosynteza zachodzi w chloroplastach liści dzięki energii światła słonecznego ".split()
+
+
+def make_chunks(answer_bytes: int, chunk_chars: int):
+    text = ""
+    i = 0
+    while len(text.encode()) < answer_bytes:
+        text += WORDS[i % len(WORDS)] + " "
+        i += 1
+    return [text[j:j + chunk_chars] for j in range(0, len(text), chunk_chars)]
+
+
+async def upstream(chunks, pace: float):
+    for i, chunk in enumerate(chunks):
+        yield chunk
+        if pace and i % 20 == 19:
+            await asyncio.sleep(pace)
+
+
+async def legacy(chunks, pace: float):
+    """routers/ai.py before coalescing"""
+    async for chunk in upstream(chunks, pace):
+        for i in range(0, len(chunk), 10):
+            sub_chunk = chunk[i:i + 10]
+            if sub_chunk:
+                yield f"data: {json.dumps({'content': sub_chunk})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def coalesced(chunks, pace: float):
+    coalescer = SSECoalescer()
+    async for frame in coalescer.frames(upstream(chunks, pace)):
+        yield frame
+    yield coalescer.done()
+
+
+async def measure(emitter, chunks, pace: float, repeat: int):
+    cpu, frames, size = [], 0, 0
+    for _ in range(repeat):
+        frames = size = 0
+        started = time.process_time()
+        async for frame in emitter(chunks, pace):
+            frames += 1
+            size += len(frame.encode())
+        cpu.append((time.process_time() - started) * 1000)
+    return frames, size, statistics.median(cpu)
+
+
+async def main(args):
+    chunks = make_chunks(args.answer_bytes, args.chunk_chars)
+    pace = args.pace_ms / 1000
+    print(f"answer: {sum(len(c.encode()) for c in chunks)} B in {len(chunks)} upstream chunks "
+          f"of {args.chunk_chars} chars, pace {args.pace_ms} ms / 20 chunks, repeat {args.repeat}")
+    print(f"{'emitter':<12}{'frames':>10}{'bytes':>10}{'cpu ms (median)':>18}")
+    for name, emitter in (("legacy", legacy), ("coalesced", coalesced)):
+        frames, size, cpu = await measure(emitter, chunks, pace, args.repeat)
+        print(f"{name:<12}{frames:>10}{size:>10}{cpu:>18.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answer-bytes", type=int, default=10_000)
+    parser.add_argument("--chunk-chars", type=int, default=4, help="characters per upstream chunk")
+    parser.add_argument("--pace-ms", type=float, default=0.0, help="upstream pause every 20 chunks")
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
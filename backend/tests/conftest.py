@@ -2,4 +2,107 @@ import sys
 import os
 
 # Add backend directory to path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+
+@pytest.fixture
+async def db_engine(tmp_path):
+    """Migrated SQLite database (aiosqlite) for repository-level tests"""
+    from database.migrations import run_migrations
+    from database.user_db import enable_sqlite_foreign_keys
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'focusflow.db'}")
+    enable_sqlite_foreign_keys(engine)
+    await run_migrations(engine)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def db_session(db_engine):
+    session_maker = async_sessionmaker(db_engine, expire_on_commit=False)
+    async with session_maker() as session:
+        yield session
+
+
+@pytest.fixture
+def make_user(db_session):
+    """Factory: insert a user and return its id"""
+    from uuid import uuid4
+    from database.user_db import User
+
+    async def make() -> str:
+        user_id = str(uuid4())
+        db_session.add(User(id=user_id, email=f"{user_id}@example.com", hashed_password="x", name="Test"))
+        await db_session.commit()
+        return user_id
+
+    return make
+
+
+@pytest.fixture
+async def user_id(make_user):
+    return await make_user()
+
+
+@pytest.fixture
+async def study_session(db_session, user_id):
+    """Id of an active study session on a fresh project (Biologia / Fotosynteza)"""
+    from datetime import datetime, timedelta
+    from database import project_repository, session_repository
+    from models.project import ProjectCreate
+    from models.session import SessionStart
+
+    project = await project_repository.create_project(db_session, ProjectCreate(
+        name="Biologia", subject="Bio", deadline=datetime.now() + timedelta(days=7), topics=["Fotosynteza"],
+    ), user_id)
+    started = await session_repository.start_session(
+        db_session, SessionStart(topic_id=project.topics[0].id), user_id
+    )
+    return str(started.id)
+
+
+class FakeClock:
+    """Manually advanced clock for code that takes a clock callable"""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def g4f_service():
+    """Factory: G4FService whose client.chat.completions.create is the given fake
+
+    Defaults to gpt-5-mini with gpt-5-nano as the fallback, no retries and no
+    single-flight; keyword arguments override them.
+    """
+    from unittest.mock import AsyncMock, patch
+    from services.g4f_service import G4FService
+
+    def make(create, **kwargs):
+        options = {
+            "default_model": "gpt-5-mini",
+            "fallback_models": ["gpt-5-nano"],
+            "max_retries": 0,
+            "single_flight": False,
+            **kwargs,
+        }
+        with patch('services.g4f_service.G4F_AVAILABLE', True):
+            with patch('services.g4f_service.AsyncClient'):
+                service = G4FService(enabled=True, **options)
+        service.client = AsyncMock()
+        service.client.chat.completions.create = create
+        return service
+
+    return make
@@ -0,0 +1,111 @@
+"""
+Tests for the retry engine and the end-to-end deadline in G4FService
+
+Tests cover:
+- Every attempt gets a fresh coroutine
+- One deadline across retries and fallback models
+- Backoff that would end after the deadline is not slept
+"""
+
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from exceptions import AITimeoutError
+
+MESSAGES = [{"role": "user", "content": "Wyjaśnij fotosyntezę prosto"}]
+
+
+def _response(content):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    return response
+
+
+class TestRetryEngine:
+    """Test _execute_with_retry"""
+
+    @pytest.mark.asyncio
+    async def test_fresh_coroutine_per_attempt(self, g4f_service):
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise Exception("502 bad gateway")
+            return "ok"
+
+        service = g4f_service(AsyncMock(), max_retries=3, backoff_base=0.01)
+        assert await service._execute_with_retry(flaky, timeout=1.0) == "ok"
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_backoff_not_slept_past_deadline(self, g4f_service):
+        async def failing():
+            raise Exception("503 service unavailable")
+
+        service = g4f_service(AsyncMock(), max_retries=3, backoff_base=2.0)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        with patch('services.g4f_service.random.uniform', return_value=5.0):
+            with pytest.raises(AITimeoutError):
+                await service._execute_with_retry(failing, timeout=10.0, deadline=loop.time() + 1.0)
+        assert time.monotonic() - started < 0.5
+
+    @pytest.mark.asyncio
+    async def test_attempt_timeout_capped_by_deadline(self, g4f_service):
+        async def slow():
+            await asyncio.sleep(5)
+
+        service = g4f_service(AsyncMock(), max_retries=0)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        with pytest.raises(AITimeoutError):
+            await service._execute_with_retry(slow, timeout=10.0, deadline=loop.time() + 0.1)
+        assert time.monotonic() - started < 1.0
+
+
+class TestDeadline:
+    """Test the deadline across models in generate_chat"""
+
+    @pytest.mark.asyncio
+    async def test_deadline_spans_fallback_models(self, g4f_service):
+        started_models = []
+
+        async def create(model, messages, **kwargs):
+            started_models.append(model)
+            await asyncio.sleep(5)
+
+        service = g4f_service(
+            create,
+            default_timeout=10.0,
+            max_retries=2,
+            fallback_models=["gpt-5-nano", "gemini-2.5-flash"],
+            deadline_budget=0.2,
+        )
+        started = time.monotonic()
+        with pytest.raises(AITimeoutError) as exc_info:
+            await service.generate_chat(MESSAGES)
+
+        assert time.monotonic() - started < 1.0
+        assert exc_info.value.status_code == 504
+        # No time left for retries or fallbacks once the primary used the budget
+        assert started_models == ["gpt-5-mini"]
+
+    @pytest.mark.asyncio
+    async def test_fallback_used_within_deadline(self, g4f_service):
+        async def create(model, messages, **kwargs):
+            if model == "gpt-5-mini":
+                await asyncio.sleep(5)
+            return _response(f"Odpowiedź od {model}")
+
+        service = g4f_service(
+            create,
+            default_timeout=0.1,
+            max_retries=0,
+            fallback_models=["gpt-5-nano"],
+            deadline_budget=2.0,
+        )
+        assert await service.generate_chat(MESSAGES) == "Odpowiedź od gpt-5-nano"
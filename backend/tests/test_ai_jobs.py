@@ -0,0 +1,211 @@
+"""
+Tests for the AI job queue (database/ai_job_repository.py, services/ai_jobs.py, /api/ai/jobs)
+
+Tests cover:
+- Exactly one worker wins a claim
+- Jobs of a dead worker claimed again after the lease, failed after max attempts
+- Success, failure and requeue after an overload rejection
+- A stopping worker hands its job back
+- TTL cleanup of finished and abandoned jobs
+- Creating a job, polling it and following its events
+"""
+
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import ai_job_repository as db
+from models.ai_job import AIJobStatus
+from services.ai_jobs import AIJobWorker
+from exceptions import AIOverloadedError, AIValidationError
+
+NOW = datetime(2024, 3, 10, 12, 0, 0)
+REQUEST = {"messages": [{"role": "user", "content": "Wyjaśnij fotosyntezę"}], "model": None}
+
+
+@pytest.fixture
+def session_maker(db_engine):
+    return async_sessionmaker(db_engine, expire_on_commit=False)
+
+
+def _service(**kwargs):
+    service = MagicMock()
+    service.enabled = True
+    service.client = object()
+    service.generate_chat = AsyncMock(**kwargs)
+    return service
+
+
+class TestJobRepository:
+    """Test claiming and cleanup"""
+
+    @pytest.mark.asyncio
+    async def test_one_claim_wins(self, session_maker, user_id):
+        async with session_maker() as session:
+            job = await db.create_job(session, user_id, REQUEST, now=NOW)
+
+        async def claim(worker_id):
+            async with session_maker() as session:
+                return await db.claim_job(session, worker_id, NOW, NOW + timedelta(minutes=5), max_attempts=3, ttl=60)
+
+        claims = await asyncio.gather(*[claim(f"worker-{i}") for i in range(3)])
+        won = [c for c in claims if c is not None]
+        assert len(won) == 1
+        assert won[0].id == str(job.id)
+        assert won[0].request == REQUEST
+        assert won[0].attempts == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_claimed_again(self, db_session, user_id):
+        await db.create_job(db_session, user_id, REQUEST, now=NOW)
+        lease = NOW + timedelta(minutes=5)
+        assert await db.claim_job(db_session, "dead", NOW, lease, max_attempts=2, ttl=60) is not None
+        assert await db.claim_job(db_session, "alive", NOW + timedelta(minutes=1), lease, max_attempts=2, ttl=60) is None
+
+        later = lease + timedelta(seconds=1)
+        job = await db.claim_job(db_session, "alive", later, later + timedelta(minutes=5), max_attempts=2, ttl=60)
+        assert job.attempts == 2
+        # The dead worker's late result is discarded
+        assert not await db.finish_job(db_session, job.id, "dead", AIJobStatus.SUCCEEDED, later, 60, result="x")
+
+        # Lease expired max_attempts times: failed instead of claimed
+        much_later = later + timedelta(minutes=10)
+        assert await db.claim_job(db_session, "alive", much_later, much_later, max_attempts=2, ttl=60) is None
+        stored = await db.get_job(db_session, job.id, user_id)
+        assert stored.status == AIJobStatus.FAILED
+        assert stored.error_status == 500
+
+    @pytest.mark.asyncio
+    async def test_expired_jobs_deleted(self, db_session, user_id):
+        done = await db.create_job(db_session, user_id, REQUEST, now=NOW)
+        queued = await db.create_job(db_session, user_id, REQUEST, now=NOW)
+        claimed = await db.claim_job(db_session, "w", NOW, NOW + timedelta(minutes=5), max_attempts=3, ttl=60)
+        assert claimed.id == str(done.id)
+        await db.finish_job(db_session, claimed.id, "w", AIJobStatus.SUCCEEDED, NOW, 60, result="Odpowiedź")
+
+        assert await db.delete_expired_jobs(db_session, NOW + timedelta(seconds=30)) == 0
+        assert await db.delete_expired_jobs(db_session, NOW + timedelta(seconds=61)) == 1
+        assert await db.get_job(db_session, str(done.id), user_id) is None
+        assert await db.get_job(db_session, str(queued.id), user_id) is not None
+
+    @pytest.mark.asyncio
+    async def test_abandoned_job_deleted(self, db_session, user_id):
+        job = await db.create_job(db_session, user_id, REQUEST, now=NOW)
+        await db.claim_job(db_session, "dead", NOW, NOW, max_attempts=1, ttl=60)
+        # The only attempt's lease ran out: the job is failed and expires like a finished one
+        later = NOW + timedelta(seconds=1)
+        assert await db.claim_job(db_session, "alive", later, later, max_attempts=1, ttl=60) is None
+        stored = await db.get_job(db_session, str(job.id), user_id)
+        assert stored.status == AIJobStatus.FAILED
+        assert stored.expires_at == later + timedelta(seconds=60)
+
+        assert await db.delete_expired_jobs(db_session, later + timedelta(seconds=30)) == 0
+        assert await db.delete_expired_jobs(db_session, later + timedelta(seconds=61)) == 1
+        assert await db.get_job(db_session, str(job.id), user_id) is None
+
+    @pytest.mark.asyncio
+    async def test_other_users_job_hidden(self, db_session, user_id):
+        job = await db.create_job(db_session, user_id, REQUEST, now=NOW)
+        assert await db.get_job(db_session, str(job.id), str(uuid4())) is None
+
+
+class TestJobWorker:
+    """Test processing by AIJobWorker"""
+
+    @pytest.mark.asyncio
+    async def test_job_succeeds(self, session_maker, db_session, user_id):
+        service = _service(return_value="Fotosynteza to...")
+        worker = AIJobWorker(session_maker, service, deadline=120)
+        job = await db.create_job(db_session, user_id, REQUEST)
+
+        assert await worker.run_once() is True
+        assert await worker.run_once() is False
+
+        stored = await db.get_job(db_session, str(job.id), user_id)
+        assert stored.status == AIJobStatus.SUCCEEDED
+        assert stored.result == "Fotosynteza to..."
+        assert stored.expires_at is not None
+        kwargs = service.generate_chat.call_args.kwargs
+        assert kwargs["user_id"] == user_id
+        assert kwargs["deadline_budget"] == 120
+
+    @pytest.mark.asyncio
+    async def test_job_fails_with_status(self, session_maker, db_session, user_id):
+        worker = AIJobWorker(session_maker, _service(side_effect=AIValidationError("Wiadomość zbyt długa")))
+        job = await db.create_job(db_session, user_id, REQUEST)
+        await worker.run_once()
+
+        stored = await db.get_job(db_session, str(job.id), user_id)
+        assert stored.status == AIJobStatus.FAILED
+        assert (stored.error, stored.error_status) == ("Wiadomość zbyt długa", 400)
+
+    @pytest.mark.asyncio
+    async def test_overload_requeues(self, session_maker, db_session, user_id):
+        worker = AIJobWorker(session_maker, _service(side_effect=AIOverloadedError(retry_after=30)), max_attempts=2, ttl=60)
+        job = await db.create_job(db_session, user_id, REQUEST)
+
+        await worker.run_once()
+        stored = await db.get_job(db_session, str(job.id), user_id)
+        assert stored.status == AIJobStatus.QUEUED
+        assert worker.stats["requeued"] == 1
+        # Not due before Retry-After
+        assert await worker.run_once() is False
+
+    @pytest.mark.asyncio
+    async def test_stop_hands_job_back(self, session_maker, db_session, user_id):
+        started = asyncio.Event()
+
+        async def generate(*args, **kwargs):
+            started.set()
+            await asyncio.sleep(10)
+
+        worker = AIJobWorker(session_maker, _service(side_effect=generate), workers=1, poll_interval=0.01)
+        job = await db.create_job(db_session, user_id, REQUEST)
+        worker.start()
+        await asyncio.wait_for(started.wait(), timeout=2.0)
+        await worker.stop()
+
+        stored = await db.get_job(db_session, str(job.id), user_id)
+        assert stored.status == AIJobStatus.QUEUED
+        assert stored.attempts == 0
+
+
+class TestJobEndpoints:
+    """Test /api/ai/jobs"""
+
+    @pytest.mark.asyncio
+    async def test_create_poll_and_follow(self, session_maker, db_session, user_id):
+        from routers.ai import GenerateRequest, create_ai_job, get_ai_job, ai_job_events
+
+        service = _service(return_value="Fotosynteza to...")
+        worker = AIJobWorker(session_maker, service, workers=1, poll_interval=0.01)
+        user = {"id": user_id}
+        request = GenerateRequest(messages=[{"role": "user", "content": "Wyjaśnij fotosyntezę"}])
+
+        job = await create_ai_job(request, user, db_session, service, worker)
+        assert job.status == AIJobStatus.QUEUED
+        assert (await get_ai_job(str(job.id), user, db_session)).status == AIJobStatus.QUEUED
+
+        response = await ai_job_events(str(job.id), user, db_session, worker)
+        worker.start()
+        try:
+            frames = [frame async for frame in response.body_iterator]
+        finally:
+            await worker.stop()
+
+        assert '"status": "succeeded"' in frames[-2]
+        assert '"result": "Fotosynteza to..."' in frames[-2]
+        assert frames[-1] == "data: [DONE]\n\n"
+        assert (await get_ai_job(str(job.id), user, db_session)).result == "Fotosynteza to..."
+
+    @pytest.mark.asyncio
+    async def test_unknown_job_404(self, session_maker, db_session, user_id):
+        from fastapi import HTTPException
+        from routers.ai import get_ai_job
+
+        with pytest.raises(HTTPException) as exc_info:
+            await get_ai_job(str(uuid4()), {"id": user_id}, db_session)
+        assert exc_info.value.status_code == 404
@@ -0,0 +1,135 @@
+"""
+Tests for ai_service.py and prompt_builder.py
+
+Tests cover:
+- Token estimation
+- Oldest history turns dropped or truncated first
+- System prompt and question always sent
+- Budget applied to the prompt sent upstream
+- Bulkhead rejections propagated, other AI errors answered with the fallback
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+from models.chat import ChatMessage, MessageRole
+from services import ai_service
+from exceptions import AIOverloadedError, AIRateLimitError, AIUnavailableError
+from services.prompt_builder import (
+    build_messages,
+    estimate_tokens,
+    message_tokens,
+    truncate_to_tokens,
+    TRUNCATION_MARKER,
+)
+
+
+def _history(*contents):
+    session_id = uuid4()
+    base = datetime(2026, 1, 1, 10, 0, 0)
+    return [
+        ChatMessage(
+            id=uuid4(),
+            session_id=session_id,
+            role=MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT,
+            content=content,
+            timestamp=base + timedelta(minutes=i),
+        )
+        for i, content in enumerate(contents)
+    ]
+
+
+class TestEstimateTokens:
+    """Test the length estimator"""
+
+    def test_words_and_punctuation(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("Co to jest?") == 4
+        # 12-character word counts as three tokens
+        assert estimate_tokens("fotosynteza!") == 4
+
+    def test_truncate_keeps_the_end(self):
+        text = " ".join(f"słowo{i}" for i in range(200))
+        cut = truncate_to_tokens(text, 50)
+        assert cut.startswith(TRUNCATION_MARKER)
+        assert cut.endswith("słowo199")
+        assert estimate_tokens(cut) <= 50
+        assert truncate_to_tokens("krótki tekst", 50) == "krótki tekst"
+
+
+class TestBuildMessages:
+    """Test token-budgeted prompt assembly"""
+
+    def test_everything_fits(self):
+        history = _history("pierwsze", "drugie", "trzecie")
+        messages = build_messages("system", history, "pytanie", token_budget=1000)
+        assert [m["content"] for m in messages] == ["system", "pierwsze", "drugie", "trzecie", "pytanie"]
+        assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "user"]
+
+    def test_oldest_turns_dropped_first(self):
+        long_turn = "słowo " * 400
+        history = _history(long_turn, long_turn, "ostatnie")
+        messages = build_messages("system", history, "pytanie", token_budget=500)
+
+        contents = [m["content"] for m in messages]
+        assert contents[0] == "system"
+        assert contents[-2:] == ["ostatnie", "pytanie"]
+        # The turn crossing the budget is cut, the older one is gone
+        assert len(messages) == 4
+        assert contents[1].startswith(TRUNCATION_MARKER)
+        assert sum(message_tokens(c) for c in contents) <= 500
+
+    def test_tiny_remainder_not_truncated(self):
+        history = _history("słowo " * 400, "ostatnie")
+        budget = message_tokens("system") + message_tokens("pytanie") + message_tokens("ostatnie") + 10
+        messages = build_messages("system", history, "pytanie", token_budget=budget)
+        assert [m["content"] for m in messages] == ["system", "ostatnie", "pytanie"]
+
+    def test_question_sent_even_over_budget(self):
+        messages = build_messages("system", _history("stare"), "pytanie " * 100, token_budget=10)
+        assert [m["role"] for m in messages] == ["system", "user"]
+
+
+class TestGenerateAIResponse:
+    """Test prompt sent upstream and error handling"""
+
+    @pytest.mark.asyncio
+    async def test_budget_applied(self, monkeypatch):
+        monkeypatch.setattr(ai_service.settings, "AI_PROMPT_TOKEN_BUDGET", 600)
+        service = MagicMock()
+        service.generate_chat = AsyncMock(return_value="Odpowiedź")
+
+        history = _history(*(["x" * 10000] * 10))
+        with patch("services.ai_service.get_g4f_service", return_value=service):
+            response = await ai_service.generate_ai_response("Co to?", "Optyka", "Fizyka", history)
+
+        assert response == "Odpowiedź"
+        messages = service.generate_chat.call_args.kwargs["messages"]
+        assert messages[-1] == {"role": "user", "content": "Co to?"}
+        assert sum(message_tokens(m["content"]) for m in messages) <= 600
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", [
+        AIOverloadedError(retry_after=7),
+        AIRateLimitError("Za dużo żądań w kolejce", retry_after=7),
+    ])
+    async def test_rejection_propagated(self, error):
+        service = MagicMock()
+        service.generate_chat = AsyncMock(side_effect=error)
+
+        with patch("services.ai_service.get_g4f_service", return_value=service):
+            with pytest.raises(type(error)) as exc_info:
+                await ai_service.generate_ai_response("Co to?", "Optyka", "Fizyka", [])
+        assert exc_info.value.headers == {"Retry-After": "7"}
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", [AIUnavailableError("niedostępny"), AIRateLimitError("limit providera")])
+    async def test_upstream_error_falls_back(self, error):
+        service = MagicMock()
+        service.generate_chat = AsyncMock(side_effect=error)
+
+        with patch("services.ai_service.get_g4f_service", return_value=service):
+            response = await ai_service.generate_ai_response("Co to?", "Optyka", "Fizyka", [])
+        assert response == ai_service.fallback_response("Optyka")
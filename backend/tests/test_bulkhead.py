@@ -0,0 +1,246 @@
+"""
+Tests for services/bulkhead.py and its use in G4FService
+
+Tests cover:
+- Concurrency limit
+- Round-robin hand-over between users
+- Fast 503/429 with Retry-After when the queue is full, per user or in time
+- Cancelled waiters leave the queue; a slot handed to a cancelled waiter is not lost
+- /api/ai/generate and /api/ai/stream passing Retry-After through
+"""
+
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.bulkhead import Bulkhead
+from services.g4f_service import G4FService
+from exceptions import AIOverloadedError, AIRateLimitError
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestBulkhead:
+    """Test admission and queueing"""
+
+    @pytest.mark.asyncio
+    async def test_limits_concurrency(self):
+        bulkhead = Bulkhead(max_concurrent=2)
+        running, peak = 0, 0
+        release = asyncio.Event()
+
+        async def call(user):
+            nonlocal running, peak
+            async with bulkhead.slot(user):
+                running += 1
+                peak = max(peak, running)
+                await release.wait()
+                running -= 1
+
+        tasks = [asyncio.create_task(call(f"user-{i}")) for i in range(5)]
+        await _settle()
+        assert (bulkhead.active, bulkhead.metrics()["waiting"]) == (2, 3)
+        release.set()
+        await asyncio.gather(*tasks)
+        assert peak == 2
+        assert (bulkhead.active, bulkhead.metrics()["waiting"]) == (0, 0)
+
+    @pytest.mark.asyncio
+    async def test_round_robin_between_users(self):
+        bulkhead = Bulkhead(max_concurrent=1, max_queue_per_user=10)
+        order = []
+        await bulkhead.acquire("holder")
+
+        async def call(user):
+            async with bulkhead.slot(user):
+                order.append(user)
+
+        # The spammer queues first, but the other users are served in between
+        tasks = [asyncio.create_task(call("spammer")) for _ in range(3)]
+        await _settle()
+        tasks += [asyncio.create_task(call(user)) for user in ("alice", "bob")]
+        await _settle()
+        bulkhead.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["spammer", "alice", "bob", "spammer", "spammer"]
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejected_fast(self):
+        bulkhead = Bulkhead(max_concurrent=1, max_queue=1)
+        await bulkhead.acquire("a")
+        waiter = asyncio.create_task(bulkhead.acquire("b"))
+        await _settle()
+
+        with pytest.raises(AIOverloadedError) as exc_info:
+            await bulkhead.acquire("c")
+        assert exc_info.value.status_code == 503
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_per_user_queue_limit(self):
+        bulkhead = Bulkhead(max_concurrent=1, max_queue_per_user=1)
+        await bulkhead.acquire("a")
+        waiter = asyncio.create_task(bulkhead.acquire("b"))
+        await _settle()
+
+        with pytest.raises(AIRateLimitError) as exc_info:
+            await bulkhead.acquire("b")
+        assert exc_info.value.status_code == 429
+        assert "Retry-After" in exc_info.value.headers
+        # Another user still gets a place in the queue
+        other = asyncio.create_task(bulkhead.acquire("c"))
+        await _settle()
+        assert bulkhead.metrics()["waiting"] == 2
+
+        for task in (waiter, other):
+            task.cancel()
+        await asyncio.gather(waiter, other, return_exceptions=True)
+        assert bulkhead.metrics()["waiting"] == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        bulkhead = Bulkhead(max_concurrent=1, queue_timeout=0.05)
+        await bulkhead.acquire("a")
+        with pytest.raises(AIOverloadedError):
+            await bulkhead.acquire("b")
+        assert bulkhead.timeouts == 1
+        assert bulkhead.metrics()["waiting"] == 0
+
+    @pytest.mark.asyncio
+    async def test_slot_handed_to_cancelled_waiter_is_released(self):
+        bulkhead = Bulkhead(max_concurrent=1)
+        await bulkhead.acquire("a")
+        waiter = asyncio.create_task(bulkhead.acquire("b"))
+        await _settle()
+
+        bulkhead.release()  # hands the slot to b
+        waiter.cancel()     # ...which goes away before running
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert bulkhead.active == 0
+        await asyncio.wait_for(bulkhead.acquire("c"), timeout=1.0)
+
+
+class TestServiceBulkhead:
+    """Test the bulkhead in G4FService"""
+
+    @pytest.mark.asyncio
+    async def test_upstream_calls_bounded(self):
+        running, peak = 0, 0
+
+        async def create(model, messages, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = "Odpowiedź"
+            return response
+
+        with patch('services.g4f_service.G4F_AVAILABLE', True):
+            with patch('services.g4f_service.AsyncClient'):
+                service = G4FService(enabled=True, max_retries=0, bulkhead=Bulkhead(max_concurrent=2))
+        service.client = AsyncMock()
+        service.client.chat.completions.create = create
+
+        await asyncio.gather(*[
+            service.generate_chat([{"role": "user", "content": f"Pytanie {i}"}], user_id=f"user-{i % 3}")
+            for i in range(8)
+        ])
+        assert peak == 2
+
+
+class TestGenerateEndpoint:
+    """Test Retry-After on /api/ai/generate and /api/ai/stream"""
+
+    @pytest.mark.asyncio
+    async def test_overload_returns_503_with_retry_after(self):
+        from fastapi import HTTPException
+        from routers.ai import GenerateRequest, generate_ai
+
+        service = MagicMock()
+        service.enabled = True
+        service.client = object()
+        service.generate_chat = AsyncMock(side_effect=AIOverloadedError(retry_after=7))
+        request = GenerateRequest(messages=[{"role": "user", "content": "Wyjaśnij fotosyntezę"}])
+
+        with pytest.raises(HTTPException) as exc_info:
+            await generate_ai(request, {"id": "user-1"}, service)
+
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "7"}
+        assert service.generate_chat.call_args.kwargs["user_id"] == "user-1"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error, status_code", [
+        (AIOverloadedError(retry_after=7), 503),
+        (AIRateLimitError("Za dużo żądań w kolejce", retry_after=7), 429),
+    ])
+    async def test_stream_rejected_before_response(self, error, status_code):
+        from fastapi import HTTPException
+        from routers.ai import GenerateRequest, stream_ai
+
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            raise error
+            yield
+
+        service = MagicMock()
+        service.stream_chat = stream_chat
+        request = GenerateRequest(messages=[{"role": "user", "content": "Wyjaśnij fotosyntezę"}])
+
+        # Rejected before the 200 and the first SSE frame are sent
+        with pytest.raises(HTTPException) as exc_info:
+            await stream_ai(request, {"id": "user-1"}, service)
+
+        assert exc_info.value.status_code == status_code
+        assert exc_info.value.headers == {"Retry-After": "7"}
+
+    @pytest.mark.asyncio
+    async def test_stream_keeps_primed_chunk(self):
+        from routers.ai import GenerateRequest, stream_ai
+
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            yield "Fotosynteza "
+            yield "to proces."
+
+        service = MagicMock()
+        service.stream_chat = stream_chat
+        request = GenerateRequest(messages=[{"role": "user", "content": "Wyjaśnij fotosyntezę"}])
+
+        response = await stream_ai(request, {"id": "user-1"}, service)
+        frames = [frame async for frame in response.body_iterator]
+        content = "".join(json.loads(f[len("data: "):])["content"] for f in frames[:-1])
+        assert content == "Fotosynteza to proces."
+        assert frames[-1] == "data: [DONE]\n\n"
+
+    @pytest.mark.asyncio
+    async def test_stream_closed_when_response_fails(self):
+        from routers.ai import GenerateRequest, stream_ai
+
+        closed = asyncio.Event()
+
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            try:
+                yield "Fotosynteza "
+            finally:
+                closed.set()
+
+        service = MagicMock()
+        service.stream_chat = stream_chat
+        request = GenerateRequest(messages=[{"role": "user", "content": "Wyjaśnij fotosyntezę"}])
+
+        with patch("routers.ai.StreamingResponse", side_effect=RuntimeError("błąd")):
+            with pytest.raises(Exception):
+                await stream_ai(request, {"id": "user-1"}, service)
+        # The primed stream (and its bulkhead slot) is released at once
+        assert closed.is_set()
@@ -0,0 +1,94 @@
+"""
+Tests for database/chat_repository.py
+
+Tests cover:
+- Chat context (topic, project, last N messages) loaded in one query
+- Ownership check folded into the context query
+- Question and answer stored in one transaction
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import event, select, func
+
+from database.models import ChatMessage as ChatMessageModel
+from database import chat_repository
+from models.chat import MessageRole
+
+
+async def _exchange(db_session, session_id, count):
+    base = datetime(2026, 1, 1, 10, 0, 0)
+    for i in range(count):
+        await chat_repository.create_exchange(
+            db_session, session_id, f"pytanie {i}", f"odpowiedź {i}",
+            base + timedelta(minutes=i), base + timedelta(minutes=i, seconds=30)
+        )
+
+
+class TestChatContext:
+    """Test get_chat_context"""
+
+    @pytest.mark.asyncio
+    async def test_names_without_messages(self, db_session, user_id, study_session):
+        context = await chat_repository.get_chat_context(db_session, study_session, user_id)
+        assert context.topic_name == "Fotosynteza"
+        assert context.project_name == "Biologia"
+        assert context.history == []
+
+    @pytest.mark.asyncio
+    async def test_last_messages_oldest_first(self, db_session, user_id, study_session):
+        await _exchange(db_session, study_session, 4)
+
+        context = await chat_repository.get_chat_context(db_session, study_session, user_id, limit=3)
+        assert [m.content for m in context.history] == ["odpowiedź 2", "pytanie 3", "odpowiedź 3"]
+        assert [m.role for m in context.history] == [MessageRole.ASSISTANT, MessageRole.USER, MessageRole.ASSISTANT]
+
+    @pytest.mark.asyncio
+    async def test_other_users_session_returns_none(self, db_session, study_session):
+        assert await chat_repository.get_chat_context(db_session, study_session, str(uuid4())) is None
+        assert await chat_repository.get_chat_context(db_session, str(uuid4()), str(uuid4())) is None
+
+    @pytest.mark.asyncio
+    async def test_one_select(self, db_engine, db_session, user_id, study_session):
+        await _exchange(db_session, study_session, 2)
+        db_session.expunge_all()
+        statements = []
+
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split()[0].upper())
+
+        event.listen(db_engine.sync_engine, "before_cursor_execute", _capture)
+        try:
+            await chat_repository.get_chat_context(db_session, study_session, user_id)
+        finally:
+            event.remove(db_engine.sync_engine, "before_cursor_execute", _capture)
+
+        assert statements == ["SELECT"]
+
+
+class TestCreateExchange:
+    """Test create_exchange"""
+
+    @pytest.mark.asyncio
+    async def test_both_messages_in_one_commit(self, db_engine, db_session, user_id, study_session):
+        commits = []
+
+        def _capture(conn):
+            commits.append(conn)
+
+        event.listen(db_engine.sync_engine, "commit", _capture)
+        try:
+            asked_at = datetime.now()
+            answer = await chat_repository.create_exchange(db_session, study_session, "Co to?", "To jest...", asked_at)
+        finally:
+            event.remove(db_engine.sync_engine, "commit", _capture)
+
+        assert len(commits) == 1
+        assert answer.role == MessageRole.ASSISTANT
+        assert answer.timestamp >= asked_at
+
+        count = (await db_session.execute(
+            select(func.count()).select_from(ChatMessageModel).where(ChatMessageModel.session_id == study_session)
+        )).scalar()
+        assert count == 2
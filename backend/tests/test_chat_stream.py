@@ -0,0 +1,204 @@
+"""
+Tests for POST /chat/message/stream (routers/ai_chat.py)
+
+Tests cover:
+- Chunks forwarded as (coalesced) SSE frames
+- Question stored before streaming, answer once at the end
+- Partial answer stored when the client disconnects
+- The stream ends without waiting for the chat summary
+- Fallback answer when the AI is unavailable
+- Bulkhead rejection is an error response, nothing stored
+- Primed upstream stream closed when storing the question fails
+"""
+
+import asyncio
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import chat_repository
+from models.chat import ChatMessageCreate, MessageRole
+from routers import ai_chat
+from exceptions import AIOverloadedError, AIUnavailableError, AIValidationError
+
+
+@pytest.fixture(autouse=True)
+def session_maker(db_engine, monkeypatch):
+    maker = async_sessionmaker(db_engine, expire_on_commit=False)
+    monkeypatch.setattr(ai_chat, "async_session_maker", maker)
+    return maker
+
+
+def _upstream(stream_chat):
+    service = MagicMock()
+    service.stream_chat = stream_chat
+    return patch("services.ai_service.get_g4f_service", return_value=service)
+
+
+async def _start(db_session, user_id, study_session, content="Co to jest fotosynteza?"):
+    return await ai_chat.stream_message(
+        ChatMessageCreate(session_id=study_session, content=content), {"id": user_id}, db_session
+    )
+
+
+async def _history(session_maker, session_id, user_id):
+    async with session_maker() as session:
+        history = await chat_repository.get_chat_history(session, session_id, user_id)
+    return [(m.role, m.content) for m in history.messages]
+
+
+def _frames(body):
+    return [frame[len("data: "):] for frame in body.split("\n\n") if frame]
+
+
+class TestStreamMessage:
+    """Test the streaming chat endpoint"""
+
+    @pytest.mark.asyncio
+    async def test_chunks_streamed_and_stored(self, db_session, session_maker, user_id, study_session):
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            for chunk in ["Fotosynteza ", "to proces ", "w chloroplastach."]:
+                yield chunk
+
+        with _upstream(stream_chat):
+            response = await _start(db_session, user_id, study_session)
+            # The question is stored before anything is streamed
+            assert await _history(session_maker, study_session, user_id) == [
+                (MessageRole.USER, "Co to jest fotosynteza?")
+            ]
+            body = "".join([frame async for frame in response.body_iterator])
+
+        frames = _frames(body)
+        # Chunks arriving together are coalesced into one frame
+        assert [json.loads(f)["content"] for f in frames[:-1]] == ["Fotosynteza to proces w chloroplastach."]
+        assert frames[-1] == "[DONE]"
+        assert await _history(session_maker, study_session, user_id) == [
+            (MessageRole.USER, "Co to jest fotosynteza?"),
+            (MessageRole.ASSISTANT, "Fotosynteza to proces w chloroplastach."),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_stores_partial_answer(self, db_session, session_maker, user_id, study_session):
+        stalled = asyncio.Event()
+
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            yield "Fotosynteza "
+            yield "to proces "
+            stalled.set()
+            await asyncio.Event().wait()
+            yield "nigdy"
+
+        with _upstream(stream_chat):
+            response = await _start(db_session, user_id, study_session)
+
+            async def client():
+                async for _ in response.body_iterator:
+                    pass
+
+            task = asyncio.create_task(client())
+            await stalled.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            await asyncio.gather(*ai_chat._pending_writes)
+
+        assert await _history(session_maker, study_session, user_id) == [
+            (MessageRole.USER, "Co to jest fotosynteza?"),
+            (MessageRole.ASSISTANT, "Fotosynteza to proces "),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_summary_does_not_hold_stream(self, db_session, session_maker, user_id, study_session):
+        summarizing = asyncio.Event()
+        release = asyncio.Event()
+
+        async def summarize_chat(session_id):
+            summarizing.set()
+            await release.wait()
+
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            yield "Fotosynteza to proces."
+
+        with _upstream(stream_chat), \
+                patch.object(ai_chat.chat_summarizer, "needs_summary", return_value=True), \
+                patch.object(ai_chat.chat_summarizer, "summarize_chat", summarize_chat):
+            response = await _start(db_session, user_id, study_session)
+            frames = [frame async for frame in response.body_iterator]
+            assert frames[-1] == "data: [DONE]\n\n"
+            # The response finished while the summary still runs in the background
+            await asyncio.wait_for(summarizing.wait(), timeout=2.0)
+            assert any(not task.done() for task in ai_chat._pending_writes)
+            release.set()
+            await asyncio.gather(*ai_chat._pending_writes)
+
+        assert (await _history(session_maker, study_session, user_id))[-1] == (
+            MessageRole.ASSISTANT, "Fotosynteza to proces."
+        )
+
+    @pytest.mark.asyncio
+    async def test_unavailable_ai_streams_fallback(self, db_session, session_maker, user_id, study_session):
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            raise AIUnavailableError("niedostępny")
+            yield
+
+        with _upstream(stream_chat):
+            response = await _start(db_session, user_id, study_session)
+            body = "".join([frame async for frame in response.body_iterator])
+
+        content = json.loads(_frames(body)[0])["content"]
+        assert "Fotosynteza" in content
+        assert (await _history(session_maker, study_session, user_id))[-1] == (MessageRole.ASSISTANT, content)
+
+    @pytest.mark.asyncio
+    async def test_overload_not_stored(self, db_session, session_maker, user_id, study_session):
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            raise AIOverloadedError(retry_after=7)
+            yield
+
+        with _upstream(stream_chat):
+            with pytest.raises(AIOverloadedError) as exc_info:
+                await _start(db_session, user_id, study_session)
+
+        assert exc_info.value.headers == {"Retry-After": "7"}
+        assert await _history(session_maker, study_session, user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_store_failure_closes_stream(self, db_session, user_id, study_session):
+        closed = asyncio.Event()
+
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            try:
+                yield "Fotosynteza "
+                yield "to proces."
+            finally:
+                closed.set()
+
+        async def store_message(*args, **kwargs):
+            raise RuntimeError("baza niedostępna")
+
+        with _upstream(stream_chat), patch.object(ai_chat.db, "store_message", store_message):
+            with pytest.raises(RuntimeError):
+                await _start(db_session, user_id, study_session)
+
+        # Closed at once, not at garbage collection: the bulkhead slot is free again
+        assert closed.is_set()
+
+    @pytest.mark.asyncio
+    async def test_rejected_question_not_stored(self, db_session, session_maker, user_id, study_session):
+        async def stream_chat(messages, model=None, timeout=None, user_id=None):
+            raise AIValidationError("Wykryto nieprawidłowe wejście.")
+            yield
+
+        with _upstream(stream_chat):
+            with pytest.raises(AIValidationError):
+                await _start(db_session, user_id, study_session)
+
+        assert await _history(session_maker, study_session, user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_other_users_session_is_404(self, db_session, study_session):
+        with pytest.raises(Exception) as exc_info:
+            await _start(db_session, str(uuid4()), study_session)
+        assert exc_info.value.status_code == 404
@@ -0,0 +1,138 @@
+"""
+Tests for services/chat_summarizer.py
+
+Tests cover:
+- Which messages get folded into the summary
+- Summary replacing older messages in the chat context
+- Original messages kept for the history endpoint
+- Failed or concurrent summarizations leaving the summary untouched
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config import settings
+from database import chat_repository
+from models.chat import ChatMessage, MessageRole
+from services import chat_summarizer
+from services.prompt_builder import build_messages, SUMMARY_HEADER
+from exceptions import AIUnavailableError
+
+
+@pytest.fixture
+def session_maker(db_engine):
+    return async_sessionmaker(db_engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def ai():
+    service = MagicMock()
+    service.generate_chat = AsyncMock(return_value="Uczeń pytał o fazę jasną.")
+    return service
+
+
+BASE = datetime(2026, 1, 1, 10, 0, 0)
+
+
+async def _exchange(db_session, session_id, start, count):
+    for i in range(start, start + count):
+        await chat_repository.create_exchange(
+            db_session, session_id, f"pytanie {i}", f"odpowiedź {i}",
+            BASE + timedelta(minutes=i), BASE + timedelta(minutes=i, seconds=30)
+        )
+
+
+def _message(minute, role=MessageRole.USER):
+    return ChatMessage(
+        id=uuid4(), session_id=uuid4(), role=role, content="x", timestamp=BASE + timedelta(minutes=minute)
+    )
+
+
+class TestSplitForSummary:
+    """Test split_for_summary"""
+
+    def test_keeps_newest(self):
+        messages = [_message(i) for i in range(10)]
+        assert chat_summarizer.split_for_summary(messages, 4) == messages[:6]
+        assert chat_summarizer.split_for_summary(messages[:4], 4) == []
+
+    def test_timestamp_tie_stays_unsummarized(self):
+        messages = [_message(0), _message(1), _message(1), _message(2)]
+        assert chat_summarizer.split_for_summary(messages, 2) == messages[:1]
+
+
+class TestSummarizeChat:
+    """Test summarize_chat"""
+
+    @pytest.mark.asyncio
+    async def test_summary_replaces_older_messages(self, db_session, session_maker, ai, user_id, study_session, monkeypatch):
+        monkeypatch.setattr(settings, "CHAT_SUMMARY_KEEP_RECENT", 4)
+        await _exchange(db_session, study_session, 0, 8)
+
+        assert await chat_summarizer.summarize_chat(study_session, session_maker, ai) is True
+
+        context = await chat_repository.get_chat_context(db_session, study_session, user_id, limit=20)
+        assert context.summary == "Uczeń pytał o fazę jasną."
+        assert [m.content for m in context.history] == ["pytanie 6", "odpowiedź 6", "pytanie 7", "odpowiedź 7"]
+
+        history = await chat_repository.get_chat_history(db_session, study_session, user_id)
+        assert len(history.messages) == 16
+
+        prompt = ai.generate_chat.call_args.kwargs["messages"][-1]["content"]
+        assert "pytanie 0" in prompt and "odpowiedź 5" in prompt
+        assert "pytanie 6" not in prompt
+
+    @pytest.mark.asyncio
+    async def test_next_round_extends_summary(self, db_session, session_maker, ai, user_id, study_session, monkeypatch):
+        monkeypatch.setattr(settings, "CHAT_SUMMARY_KEEP_RECENT", 2)
+        await _exchange(db_session, study_session, 0, 3)
+        await chat_summarizer.summarize_chat(study_session, session_maker, ai)
+
+        await _exchange(db_session, study_session, 3, 2)
+        ai.generate_chat.return_value = "Nowe podsumowanie."
+        assert await chat_summarizer.summarize_chat(study_session, session_maker, ai) is True
+
+        prompt = ai.generate_chat.call_args.kwargs["messages"][-1]["content"]
+        assert "Uczeń pytał o fazę jasną." in prompt
+        assert "pytanie 1" not in prompt and "pytanie 2" in prompt
+
+        summary = await chat_repository.get_chat_summary(db_session, study_session)
+        assert summary.content == "Nowe podsumowanie."
+        assert summary.messages_count == 8
+
+    @pytest.mark.asyncio
+    async def test_ai_failure_stores_nothing(self, db_session, session_maker, ai, user_id, study_session):
+        await _exchange(db_session, study_session, 0, 10)
+        ai.generate_chat.side_effect = AIUnavailableError("niedostępny")
+
+        assert await chat_summarizer.summarize_chat(study_session, session_maker, ai) is False
+        assert await chat_repository.get_chat_summary(db_session, study_session) is None
+
+    @pytest.mark.asyncio
+    async def test_nothing_to_summarize(self, db_session, session_maker, ai, study_session):
+        await _exchange(db_session, study_session, 0, 1)
+        assert await chat_summarizer.summarize_chat(study_session, session_maker, ai) is False
+        ai.generate_chat.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stale_summary_not_overwritten(self, db_session, study_session):
+        first = BASE + timedelta(minutes=1)
+        assert await chat_repository.save_chat_summary(db_session, study_session, "A", first, 2, None) is True
+        # Built from no summary / an older one: another writer got there first
+        assert await chat_repository.save_chat_summary(db_session, study_session, "B", first, 2, None) is False
+        assert await chat_repository.save_chat_summary(db_session, study_session, "C", first, 2, BASE) is False
+
+        summary = await chat_repository.get_chat_summary(db_session, study_session)
+        assert summary.content == "A"
+
+
+class TestSummaryInPrompt:
+    """Test summary passed to the prompt builder"""
+
+    def test_summary_appended_to_system_prompt(self):
+        messages = build_messages("system", [], "pytanie", summary="Streszczenie")
+        assert messages[0]["content"] == f"system\n\n{SUMMARY_HEADER}\nStreszczenie"
+        assert len(messages) == 2
@@ -0,0 +1,116 @@
+"""
+Tests for the per-model circuit breaker (services/model_health.py) and its use in G4FService
+
+Tests cover:
+- Opening on error rate, not before min_calls
+- Half-open probe after the cool-down, closing and re-opening
+- Old outcomes leaving the window
+- Open models skipped by generate_chat without a call
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+from services.model_health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from exceptions import AIUnavailableError
+
+MESSAGES = [{"role": "user", "content": "Wyjaśnij fotosyntezę prosto"}]
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(window=60, min_calls=4, error_rate=0.5, open_seconds=30, clock=clock)
+
+
+class TestCircuitBreaker:
+    """Test state transitions"""
+
+    def test_opens_on_error_rate(self, breaker):
+        breaker.record_success("gpt-5-mini")
+        breaker.record_failure("gpt-5-mini")
+        breaker.record_failure("gpt-5-mini")
+        assert breaker.state("gpt-5-mini") == CLOSED  # only 3 calls so far
+        breaker.record_failure("gpt-5-mini")
+        assert breaker.state("gpt-5-mini") == OPEN
+        assert breaker.allow("gpt-5-mini") is False
+        assert breaker.metrics()["models"]["gpt-5-mini"]["score"] == 0.0
+
+    def test_healthy_model_stays_closed(self, breaker):
+        for _ in range(10):
+            breaker.record_success("gpt-5-mini")
+        breaker.record_failure("gpt-5-mini")
+        assert breaker.state("gpt-5-mini") == CLOSED
+        assert breaker.allow("gpt-5-mini") is True
+
+    def test_half_open_probe_closes(self, breaker, clock):
+        for _ in range(4):
+            breaker.record_failure("gpt-5-mini")
+        clock.now += 31
+        assert breaker.state("gpt-5-mini") == HALF_OPEN
+        assert breaker.allow("gpt-5-mini") is True
+        # Only one probe at a time
+        assert breaker.allow("gpt-5-mini") is False
+        breaker.record_success("gpt-5-mini")
+        assert breaker.state("gpt-5-mini") == CLOSED
+        assert breaker.allow("gpt-5-mini") is True
+
+    def test_half_open_probe_failure_reopens(self, breaker, clock):
+        for _ in range(4):
+            breaker.record_failure("gpt-5-mini")
+        clock.now += 31
+        assert breaker.allow("gpt-5-mini") is True
+        breaker.record_failure("gpt-5-mini")
+        assert breaker.state("gpt-5-mini") == OPEN
+        assert breaker.metrics()["models"]["gpt-5-mini"]["opens"] == 2
+
+    def test_old_failures_leave_window(self, breaker, clock):
+        for _ in range(3):
+            breaker.record_failure("gpt-5-mini")
+        clock.now += 61
+        breaker.record_failure("gpt-5-mini")
+        assert breaker.state("gpt-5-mini") == CLOSED
+
+
+class TestServiceBreaker:
+    """Test generate_chat with a circuit breaker"""
+
+    @pytest.mark.asyncio
+    async def test_open_model_skipped_without_call(self, breaker, g4f_service):
+        calls = []
+
+        async def create(model, messages, **kwargs):
+            calls.append(model)
+            if model == "gpt-5-mini":
+                raise Exception("Provider unavailable")
+            response = MagicMock()
+            response.choices = [MagicMock()]
+            response.choices[0].message.content = f"Odpowiedź od {model}"
+            return response
+
+        service = g4f_service(create, breaker=breaker, max_retries=1, backoff_base=0.001)
+
+        # Two requests, two failed attempts each, open the primary's circuit
+        for _ in range(2):
+            assert await service.generate_chat(MESSAGES) == "Odpowiedź od gpt-5-nano"
+        assert breaker.state("gpt-5-mini") == OPEN
+
+        calls.clear()
+        assert await service.generate_chat(MESSAGES) == "Odpowiedź od gpt-5-nano"
+        assert calls == ["gpt-5-nano"]
+        assert breaker.skipped == 1
+
+    @pytest.mark.asyncio
+    async def test_retries_stop_once_open(self, clock, g4f_service):
+        calls = []
+
+        async def create(model, messages, **kwargs):
+            calls.append(model)
+            raise Exception("Provider unavailable")
+
+        breaker = CircuitBreaker(min_calls=2, error_rate=0.5, clock=clock)
+        service = g4f_service(create, breaker=breaker, max_retries=5, backoff_base=0.001)
+        with pytest.raises(AIUnavailableError):
+            await service.generate_chat(MESSAGES)
+
+        # The breaker opens after two failures of each model instead of six attempts each
+        assert calls == ["gpt-5-mini", "gpt-5-mini", "gpt-5-nano", "gpt-5-nano"]
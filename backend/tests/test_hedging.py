@@ -0,0 +1,163 @@
+"""
+Tests for hedged requests (services/model_health.py and G4FService._complete_hedged)
+
+Tests cover:
+- Latency percentiles and the adaptive hedge delay
+- Hedge budget
+- Slow primary: fallback started after the delay, first answer wins, loser cancelled
+- Fast primary: no hedge
+- Failed primary: next model started without waiting for the delay
+"""
+
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from services.model_health import HedgePolicy, LatencyTracker
+from exceptions import AIUnavailableError
+
+MESSAGES = [{"role": "user", "content": "Wyjaśnij fotosyntezę prosto"}]
+FALLBACK_MODELS = ["gpt-5-nano", "gemini-2.5-flash"]
+
+
+class TestLatencyTracker:
+    """Test percentiles"""
+
+    def test_none_until_min_samples(self):
+        tracker = LatencyTracker(min_samples=3)
+        tracker.record("gpt-5-mini", 1.0)
+        tracker.record("gpt-5-mini", 2.0)
+        assert tracker.percentile("gpt-5-mini", 95) is None
+        tracker.record("gpt-5-mini", 3.0)
+        assert tracker.percentile("gpt-5-mini", 95) == 3.0
+
+    def test_p95_over_window(self):
+        tracker = LatencyTracker(window=100, min_samples=1)
+        for i in range(1, 201):
+            tracker.record("gpt-5-mini", float(i))
+        # Only the newest 100 samples (101..200) count
+        assert tracker.percentile("gpt-5-mini", 95) == 195.0
+        assert tracker.percentile("gpt-5-mini", 50) == 150.0
+
+
+class TestHedgePolicy:
+    """Test the delay and the budget"""
+
+    def test_adaptive_delay(self):
+        tracker = LatencyTracker(min_samples=1)
+        policy = HedgePolicy(delay=10.0, min_delay=1.0)
+        assert policy.hedge_delay("gpt-5-mini", tracker) == 10.0
+        tracker.record("gpt-5-mini", 3.0)
+        assert policy.hedge_delay("gpt-5-mini", tracker) == 3.0
+        tracker.record("gpt-5-nano", 0.2)
+        assert policy.hedge_delay("gpt-5-nano", tracker) == 1.0
+        assert HedgePolicy(delay=10.0, adaptive=False).hedge_delay("gpt-5-mini", tracker) == 10.0
+
+    def test_budget(self):
+        policy = HedgePolicy(budget_ratio=0.5, burst=1.0)
+        policy.start_request()
+        assert policy.try_hedge() is True
+        policy.start_request()
+        assert policy.try_hedge() is False
+        policy.start_request()
+        assert policy.try_hedge() is True
+        assert (policy.hedges, policy.denied) == (2, 1)
+
+
+class Upstream:
+    """Fake chat.completions.create with per-model delays or errors"""
+
+    def __init__(self, delays, errors=()):
+        self.delays = delays
+        self.errors = set(errors)
+        self.started = []
+        self.cancelled = []
+
+    async def __call__(self, model, messages, **kwargs):
+        self.started.append(model)
+        if model in self.errors:
+            raise RuntimeError(f"{model} failed")
+        try:
+            await asyncio.sleep(self.delays[model])
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = f"Odpowiedź od {model}"
+        return response
+
+
+class TestHedgedGeneration:
+    """Test generate_chat with hedging enabled"""
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_hedged_and_cancelled(self, g4f_service):
+        upstream = Upstream({"gpt-5-mini": 5.0, "gpt-5-nano": 0.01, "gemini-2.5-flash": 0.01})
+        policy = HedgePolicy(delay=0.05, adaptive=False)
+        service = g4f_service(upstream, fallback_models=FALLBACK_MODELS, hedging=policy)
+
+        result = await service.generate_chat(MESSAGES)
+        # The loser is cancelled, not awaited
+        await asyncio.sleep(0.01)
+
+        assert result == "Odpowiedź od gpt-5-nano"
+        assert upstream.started == ["gpt-5-mini", "gpt-5-nano"]
+        assert upstream.cancelled == ["gpt-5-mini"]
+        assert (policy.hedges, policy.hedge_wins) == (1, 1)
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_not_hedged(self, g4f_service):
+        upstream = Upstream({"gpt-5-mini": 0.01, "gpt-5-nano": 0.01, "gemini-2.5-flash": 0.01})
+        policy = HedgePolicy(delay=1.0, adaptive=False)
+        service = g4f_service(upstream, fallback_models=FALLBACK_MODELS, hedging=policy)
+
+        assert await service.generate_chat(MESSAGES) == "Odpowiedź od gpt-5-mini"
+        assert upstream.started == ["gpt-5-mini"]
+        assert policy.hedges == 0
+        assert service.latencies.metrics()["gpt-5-mini"]["samples"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_extra_capped(self, g4f_service):
+        upstream = Upstream({"gpt-5-mini": 5.0, "gpt-5-nano": 5.0, "gemini-2.5-flash": 0.01})
+        policy = HedgePolicy(delay=0.02, adaptive=False, max_extra=1)
+        service = g4f_service(upstream, fallback_models=FALLBACK_MODELS, hedging=policy)
+
+        task = asyncio.create_task(service.generate_chat(MESSAGES))
+        await asyncio.sleep(0.2)
+        # Only one extra model runs next to the primary
+        assert upstream.started == ["gpt-5-mini", "gpt-5-nano"]
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+        assert sorted(upstream.cancelled) == ["gpt-5-mini", "gpt-5-nano"]
+
+    @pytest.mark.asyncio
+    async def test_budget_exhausted_waits_for_primary(self, g4f_service):
+        upstream = Upstream({"gpt-5-mini": 0.1, "gpt-5-nano": 0.01, "gemini-2.5-flash": 0.01})
+        policy = HedgePolicy(delay=0.01, adaptive=False, budget_ratio=0.0, burst=0.0)
+        service = g4f_service(upstream, fallback_models=FALLBACK_MODELS, hedging=policy)
+
+        assert await service.generate_chat(MESSAGES) == "Odpowiedź od gpt-5-mini"
+        assert upstream.started == ["gpt-5-mini"]
+        assert policy.denied == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_falls_back_immediately(self, g4f_service):
+        upstream = Upstream({"gpt-5-nano": 0.01, "gemini-2.5-flash": 0.01}, errors={"gpt-5-mini"})
+        policy = HedgePolicy(delay=10.0, adaptive=False)
+        service = g4f_service(upstream, fallback_models=FALLBACK_MODELS, hedging=policy)
+
+        result = await asyncio.wait_for(service.generate_chat(MESSAGES), timeout=1.0)
+        assert result == "Odpowiedź od gpt-5-nano"
+        assert policy.hedges == 0
+
+    @pytest.mark.asyncio
+    async def test_all_models_fail(self, g4f_service):
+        upstream = Upstream({}, errors={"gpt-5-mini", "gpt-5-nano", "gemini-2.5-flash"})
+        service = g4f_service(upstream, fallback_models=FALLBACK_MODELS, hedging=HedgePolicy(delay=10.0, adaptive=False))
+
+        with pytest.raises(AIUnavailableError):
+            await service.generate_chat(MESSAGES)
+        assert upstream.started == ["gpt-5-mini", "gpt-5-nano", "gemini-2.5-flash"]
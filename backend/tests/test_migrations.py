@@ -0,0 +1,195 @@
+"""
+Tests for database/migrations.py
+
+Tests cover:
+- Versioned, idempotent migration runs
+- Index backfill on databases created before the index migration
+- EXPLAIN QUERY PLAN proof that repository hot-path queries use the indexes
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import event, text, inspect, delete, select, func
+
+from database.migrations import run_migrations, MIGRATIONS
+from database.user_db import User
+from database.models import (
+    Project as ProjectModel,
+    Topic as TopicModel,
+    Session as SessionModel,
+    ChatMessage as ChatMessageModel,
+    DailyStudyStats as DailyStudyStatsModel,
+    SchemaMigration,
+)
+from database import project_repository, topic_repository, chat_repository, stats_repository
+
+HOT_PATH_INDEXES = {
+    "sessions": {"ix_sessions_user_id_completed", "ix_sessions_topic_id"},
+    "topics": {"ix_topics_project_id_priority_score"},
+    "chat_messages": {"ix_chat_messages_session_id_timestamp"},
+    "projects": {"ix_projects_user_id_created_at"},
+}
+
+USER_ID = str(uuid4())
+
+
+async def _index_names(engine) -> dict:
+    async with engine.connect() as conn:
+        return await conn.run_sync(
+            lambda sync_conn: {
+                table: {ix["name"] for ix in inspect(sync_conn).get_indexes(table)}
+                for table in HOT_PATH_INDEXES
+            }
+        )
+
+
+@pytest.fixture
+async def seeded(db_session):
+    """One project with topics, sessions and chat messages"""
+    now = datetime.now()
+    project_id = str(uuid4())
+    db_session.add(User(id=USER_ID, email=f"{USER_ID}@example.com", hashed_password="x", name="Test"))
+    await db_session.flush()
+    db_session.add(ProjectModel(
+        id=project_id, user_id=USER_ID, name="Biologia", subject="Bio",
+        deadline=now + timedelta(days=10), created_at=now,
+    ))
+    session_id = None
+    for i in range(3):
+        topic_id = str(uuid4())
+        db_session.add(TopicModel(id=topic_id, project_id=project_id, name=f"Temat {i}", created_at=now))
+        for j in range(2):
+            session_id = str(uuid4())
+            db_session.add(SessionModel(
+                id=session_id, topic_id=topic_id, user_id=USER_ID, status="completed",
+                start_time=now, duration=60, completed=j == 0,
+            ))
+    db_session.add(ChatMessageModel(
+        id=str(uuid4()), session_id=session_id, role="user", content="Pomocy", timestamp=now,
+    ))
+    await db_session.commit()
+    return {"project_id": project_id, "session_id": session_id}
+
+
+class TestMigrationRunner:
+    """Test versioned migration bookkeeping"""
+
+    @pytest.mark.asyncio
+    async def test_all_migrations_recorded(self, db_engine, db_session):
+        """Every migration should be recorded exactly once"""
+        result = await db_session.execute(SchemaMigration.__table__.select())
+        versions = [row.version for row in result]
+        assert versions == [m.version for m in MIGRATIONS]
+
+    @pytest.mark.asyncio
+    async def test_second_run_is_noop(self, db_engine):
+        """Re-running migrations should apply nothing"""
+        assert await run_migrations(db_engine) == []
+
+    @pytest.mark.asyncio
+    async def test_indexes_created(self, db_engine):
+        """Hot-path composite indexes should exist after migrating"""
+        names = await _index_names(db_engine)
+        for table, expected in HOT_PATH_INDEXES.items():
+            assert expected <= names[table]
+
+    @pytest.mark.asyncio
+    async def test_index_migration_backfills_existing_database(self, db_engine):
+        """Index migration should add indexes to a database created without them"""
+        async with db_engine.begin() as conn:
+            for indexes in HOT_PATH_INDEXES.values():
+                for name in indexes:
+                    await conn.execute(text(f"DROP INDEX {name}"))
+            await conn.execute(delete(SchemaMigration).where(SchemaMigration.version == 2))
+
+        assert await run_migrations(db_engine) == [2]
+        names = await _index_names(db_engine)
+        for table, expected in HOT_PATH_INDEXES.items():
+            assert expected <= names[table]
+
+
+    @pytest.mark.asyncio
+    async def test_daily_stats_backfilled_from_completed_sessions(self, db_engine, db_session, seeded):
+        """Daily rollup migration should bucket existing completed sessions per topic and day"""
+        async with db_engine.begin() as conn:
+            await conn.execute(delete(SchemaMigration).where(SchemaMigration.version == 4))
+
+        assert await run_migrations(db_engine) == [4]
+        result = await db_session.execute(
+            select(func.count(), func.sum(DailyStudyStatsModel.sessions_completed))
+            .where(DailyStudyStatsModel.user_id == USER_ID)
+        )
+        assert tuple(result.one()) == (3, 3)
+
+
+class TestQueryPlans:
+    """Prove that repository queries are served by the hot-path indexes"""
+
+    async def _plans_for(self, db_engine, call) -> str:
+        """Run a repository call and return EXPLAIN QUERY PLAN output of its SELECTs (and INSERT ... SELECTs)"""
+        captured = []
+
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "INSERT")):
+                captured.append((statement, parameters))
+
+        event.listen(db_engine.sync_engine, "before_cursor_execute", _capture)
+        try:
+            await call()
+        finally:
+            event.remove(db_engine.sync_engine, "before_cursor_execute", _capture)
+
+        plans = []
+        async with db_engine.connect() as conn:
+            for statement, parameters in captured:
+                raw = await conn.get_raw_connection()
+                cursor = await raw.driver_connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                plans.extend(row[3] for row in await cursor.fetchall())
+        return "\n".join(plans)
+
+    @pytest.mark.asyncio
+    async def test_user_stats_rebuild_uses_sessions_user_index(self, db_engine, db_session, seeded):
+        plan = await self._plans_for(db_engine, lambda: stats_repository.rebuild_user_stats(db_session, USER_ID))
+        assert "ix_sessions_user_id_completed" in plan
+        assert "ix_projects_user_id_created_at" in plan
+
+    @pytest.mark.asyncio
+    async def test_project_stats_rebuild_uses_session_indexes(self, db_engine, db_session, seeded):
+        plan = await self._plans_for(
+            db_engine, lambda: stats_repository.rebuild_project_stats(db_session, seeded["project_id"])
+        )
+        assert "ix_sessions_" in plan
+        assert "ix_topics_project_id_priority_score" in plan
+
+    @pytest.mark.asyncio
+    async def test_project_topics_use_priority_index(self, db_engine, db_session, seeded):
+        plan = await self._plans_for(
+            db_engine, lambda: topic_repository.get_project_topics(db_session, seeded["project_id"], USER_ID)
+        )
+        assert "ix_topics_project_id_priority_score" in plan
+        assert "USE TEMP B-TREE FOR ORDER BY" not in plan
+
+    @pytest.mark.asyncio
+    async def test_chat_history_uses_timestamp_index(self, db_engine, db_session, seeded):
+        plan = await self._plans_for(
+            db_engine, lambda: chat_repository.get_chat_history(db_session, seeded["session_id"], USER_ID)
+        )
+        assert "ix_chat_messages_session_id_timestamp" in plan
+        assert "USE TEMP B-TREE FOR ORDER BY" not in plan
+
+    @pytest.mark.asyncio
+    async def test_project_list_uses_created_at_index(self, db_engine, db_session, seeded):
+        plan = await self._plans_for(
+            db_engine, lambda: project_repository.get_all_projects(db_session, USER_ID)
+        )
+        assert "ix_projects_user_id_created_at" in plan
+        assert "USE TEMP B-TREE FOR ORDER BY" not in plan
+
+    @pytest.mark.asyncio
+    async def test_daily_totals_use_user_day_index(self, db_engine, db_session, seeded):
+        today = datetime.now().date()
+        plan = await self._plans_for(
+            db_engine, lambda: stats_repository.get_daily_totals(db_session, USER_ID, today - timedelta(days=6), today)
+        )
+        assert "ix_daily_study_stats_user_id_day" in plan
@@ -0,0 +1,186 @@
+"""
+Tests for the latency-aware model router (services/model_health.py) and its use in G4FService
+
+Tests cover:
+- EWMA latency / success rate and the resulting order
+- Per-model timeouts from p95, growing again after timeouts
+- generate_chat trying the fastest model first, unless a model is named
+- Time to first token recorded for streams
+- Routing decisions kept for the debug endpoint
+"""
+
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from services.model_health import LatencyTracker, ModelRouter
+from exceptions import AITimeoutError
+
+MESSAGES = [{"role": "user", "content": "Wyjaśnij fotosyntezę prosto"}]
+MODELS = ["gpt-5-mini", "gpt-5-nano", "gemini-2.5-flash"]
+
+
+class TestModelRouter:
+    """Test ordering and timeouts"""
+
+    def test_unknown_models_keep_configured_order(self):
+        router = ModelRouter()
+        assert router.route(MODELS, timeout=60) == MODELS
+
+    def test_faster_model_first(self):
+        router = ModelRouter(prior_latency=5.0)
+        router.record_latency("gpt-5-mini", 8.0)
+        router.record_latency("gpt-5-nano", 1.0)
+        assert router.route(MODELS, timeout=60) == ["gpt-5-nano", "gemini-2.5-flash", "gpt-5-mini"]
+
+    def test_failing_model_pushed_back(self):
+        router = ModelRouter(alpha=0.5)
+        router.record_latency("gpt-5-mini", 1.0)
+        router.record_latency("gpt-5-nano", 2.0)
+        router.record_outcome("gpt-5-mini", False)
+        router.record_outcome("gpt-5-mini", False)
+        # 1.0 / 0.25 = 4s expected vs 2s
+        assert router.expected_latency("gpt-5-mini") == pytest.approx(4.0)
+        assert router.route(["gpt-5-mini", "gpt-5-nano"], timeout=60) == ["gpt-5-nano", "gpt-5-mini"]
+
+    def test_ewma(self):
+        router = ModelRouter(alpha=0.2)
+        router.record_latency("gpt-5-mini", 10.0)
+        router.record_latency("gpt-5-mini", 0.0)
+        assert router.metrics()["gpt-5-mini"]["ewma_latency"] == 8.0
+
+    def test_stream_uses_ttft(self):
+        router = ModelRouter()
+        router.record_latency("gpt-5-mini", 6.0)
+        router.record_ttft("gpt-5-mini", 0.5)
+        router.record_latency("gpt-5-nano", 2.0)
+        assert router.route(["gpt-5-mini", "gpt-5-nano"], timeout=60, stream=True)[0] == "gpt-5-mini"
+        assert router.route(["gpt-5-mini", "gpt-5-nano"], timeout=60)[0] == "gpt-5-nano"
+
+    def test_timeout_from_p95(self):
+        latencies = LatencyTracker(min_samples=10)
+        router = ModelRouter(latencies, timeout_factor=1.5, min_timeout=5.0)
+        assert router.timeout_for("gpt-5-mini", 60.0) == 60.0  # no data yet
+        for _ in range(10):
+            latencies.record("gpt-5-mini", 8.0)
+            latencies.record("gpt-5-nano", 0.5)
+            latencies.record("gemini-2.5-flash", 50.0)
+        assert router.timeout_for("gpt-5-mini", 60.0) == 12.0
+        assert router.timeout_for("gpt-5-nano", 60.0) == 5.0
+        assert router.timeout_for("gemini-2.5-flash", 60.0) == 60.0
+
+    def test_decisions_kept(self):
+        router = ModelRouter()
+        router.record_latency("gpt-5-nano", 1.0)
+        router.route(MODELS, timeout=30)
+        decision = router.decisions[-1]
+        assert decision["configured"] == MODELS
+        assert decision["routed"][0] == "gpt-5-nano"
+        assert decision["timeouts"]["gpt-5-mini"] == 30
+
+
+def _response(content):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = content
+    return response
+
+
+class TestServiceRouting:
+    """Test generate_chat with a router"""
+
+    @pytest.mark.asyncio
+    async def test_fastest_model_tried_first(self, g4f_service):
+        calls = []
+
+        async def create(model, messages, **kwargs):
+            calls.append(model)
+            return _response(f"Odpowiedź od {model}")
+
+        router = ModelRouter()
+        router.record_latency("gpt-5-mini", 20.0)
+        router.record_latency("gpt-5-nano", 1.0)
+        service = g4f_service(create, router=router)
+
+        assert await service.generate_chat(MESSAGES) == "Odpowiedź od gpt-5-nano"
+        # A model named in the request is honoured
+        assert await service.generate_chat(MESSAGES, model="gpt-5-mini") == "Odpowiedź od gpt-5-mini"
+        assert calls == ["gpt-5-nano", "gpt-5-mini"]
+        assert len(router.decisions) == 1
+        assert service.latencies is router.latencies
+
+    @pytest.mark.asyncio
+    async def test_failures_update_success_rate(self, g4f_service):
+        async def create(model, messages, **kwargs):
+            if model == "gpt-5-mini":
+                raise Exception("Provider unavailable")
+            return _response(f"Odpowiedź od {model}")
+
+        router = ModelRouter()
+        service = g4f_service(create, router=router)
+        await service.generate_chat(MESSAGES)
+
+        metrics = router.metrics()
+        assert metrics["gpt-5-mini"]["ewma_success"] < 1.0
+        assert metrics["gpt-5-nano"]["ewma_success"] == 1.0
+        assert metrics["gpt-5-nano"]["ewma_latency"] is not None
+
+    @pytest.mark.asyncio
+    async def test_attempt_timeout_from_p95(self, g4f_service):
+        latencies = LatencyTracker(min_samples=1)
+        latencies.record("gpt-5-mini", 0.01)
+        router = ModelRouter(latencies, timeout_factor=2.0, min_timeout=0.05)
+
+        async def create(model, messages, **kwargs):
+            if model == "gpt-5-mini":
+                await asyncio.sleep(5)
+            return _response(f"Odpowiedź od {model}")
+
+        service = g4f_service(create, router=router)
+        # Primary is cut off after 0.05s instead of the 60s default timeout
+        result = await asyncio.wait_for(service.generate_chat(MESSAGES), timeout=2.0)
+        assert result == "Odpowiedź od gpt-5-nano"
+
+    @pytest.mark.asyncio
+    async def test_timeout_recovers_after_slowdown(self, g4f_service):
+        latencies = LatencyTracker(window=4, min_samples=1)
+        latencies.record("gpt-5-mini", 0.02)
+        router = ModelRouter(latencies, timeout_factor=2.0, min_timeout=0.05)
+
+        async def create(model, messages, **kwargs):
+            # The model got slower than the timeout derived from its past latency
+            await asyncio.sleep(0.15)
+            return _response(f"Odpowiedź od {model}")
+
+        service = g4f_service(create, router=router)
+        service.fallback_models = []
+        timeouts = []
+        for _ in range(5):
+            timeouts.append(router.timeout_for("gpt-5-mini", 1.0))
+            try:
+                result = await service.generate_chat(MESSAGES, timeout=1.0)
+                break
+            except AITimeoutError:
+                continue
+        else:
+            pytest.fail(f"Timeout modelu nie urósł: {timeouts}")
+
+        # Each timeout is a sample at the attempt timeout, so p95 and the timeout double each time
+        assert result == "Odpowiedź od gpt-5-mini"
+        assert timeouts == [0.05, 0.1, 0.2]
+
+    @pytest.mark.asyncio
+    async def test_stream_records_ttft(self, g4f_service):
+        async def chunks():
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content="Foto"))])
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content="synteza"))])
+
+        async def create(model, messages, stream=False, **kwargs):
+            return chunks()
+
+        router = ModelRouter()
+        service = g4f_service(create, router=router)
+        parts = [chunk async for chunk in service.stream_chat(MESSAGES)]
+
+        assert parts == ["Foto", "synteza"]
+        assert router.metrics()["gpt-5-mini"]["ewma_ttft"] is not None
@@ -0,0 +1,83 @@
+"""
+Tests for services/priority_scheduler.py
+
+Tests cover:
+- Refreshing projects whose days-to-deadline bucket changed
+- At most one refresh per project per day
+- Chunked processing
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import select, insert
+
+from database.models import Project as ProjectModel, Topic as TopicModel
+from services.priority_scheduler import refresh_stale_priorities
+from services.priority_service import calculate_priority
+
+NOW = datetime(2024, 3, 10, 12, 0, 0)
+
+
+@pytest.fixture
+async def projects(db_session, user_id):
+    """Five projects with deadlines 1..20 days away plus one overdue, three topics each"""
+    deadlines = [NOW + timedelta(days=d, hours=3) for d in (1, 2, 7, 20)] + [NOW - timedelta(days=2)]
+    project_rows, topic_rows = [], []
+    for i, deadline in enumerate(deadlines):
+        project_id = str(uuid4())
+        project_rows.append({
+            "id": project_id, "user_id": user_id, "name": f"Projekt {i}", "subject": "Test",
+            "deadline": deadline, "created_at": NOW,
+        })
+        for confidence in (1, 3, 5):
+            topic_rows.append({
+                "id": str(uuid4()), "project_id": project_id, "name": f"Temat {confidence}",
+                "confidence_level": confidence, "stuck_count": i, "priority_score": 0.0, "created_at": NOW,
+            })
+    await db_session.execute(insert(ProjectModel), project_rows)
+    await db_session.execute(insert(TopicModel), topic_rows)
+    await db_session.commit()
+    return project_rows
+
+
+async def _scores(db_session):
+    result = await db_session.execute(
+        select(TopicModel.confidence_level, TopicModel.stuck_count, TopicModel.priority_score, ProjectModel.deadline)
+        .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
+        .execution_options(populate_existing=True)
+    )
+    return result.all()
+
+
+class TestPriorityRefresh:
+    """Test the scheduled recompute"""
+
+    @pytest.mark.asyncio
+    async def test_refresh_matches_calculate_priority(self, db_engine, db_session, projects):
+        assert await refresh_stale_priorities(db_engine, now=NOW) == len(projects)
+
+        for row in await _scores(db_session):
+            expected = calculate_priority(row.confidence_level, row.stuck_count, (row.deadline - NOW).days)
+            assert row.priority_score == expected
+
+    @pytest.mark.asyncio
+    async def test_at_most_once_per_day(self, db_engine, projects):
+        await refresh_stale_priorities(db_engine, now=NOW)
+        assert await refresh_stale_priorities(db_engine, now=NOW + timedelta(hours=2)) == 0
+
+    @pytest.mark.asyncio
+    async def test_next_day_refreshes_changed_buckets(self, db_engine, db_session, projects):
+        await refresh_stale_priorities(db_engine, now=NOW)
+        later = NOW + timedelta(days=1)
+
+        # Projects due within a day (and the overdue one) stay clamped at 1 day and need no refresh
+        assert await refresh_stale_priorities(db_engine, now=later) == 3
+        for row in await _scores(db_session):
+            expected = calculate_priority(row.confidence_level, row.stuck_count, (row.deadline - later).days)
+            assert row.priority_score == expected
+
+    @pytest.mark.asyncio
+    async def test_chunked(self, db_engine, projects):
+        assert await refresh_stale_priorities(db_engine, now=NOW, chunk_size=2) == len(projects)
+        assert await refresh_stale_priorities(db_engine, now=NOW, chunk_size=2) == 0
@@ -35,4 +35,119 @@ def test_calculate_days_to_deadline():
     """Test days calculation"""
     future = datetime.now() + timedelta(days=5)
     days = calculate_days_to_deadline(future)
-    assert 4 <= days <= 5  # Allow for timing differences
\ No newline at end of file
+    assert 4 <= days <= 5  # Allow for timing differences
+
+NOW = datetime(2024, 3, 10, 12, 0, 0)
+
+
+@pytest.fixture
+async def topic_grid(db_session, user_id):
+    """Every confidence/stuck combination under deadlines from overdue to two months away"""
+    from uuid import uuid4
+    from sqlalchemy import insert
+    from database.models import Project as ProjectModel, Topic as TopicModel
+
+    offsets = [timedelta(days=d, hours=h, seconds=s) for d in (-3, -1, 0, 1, 2, 6, 13, 59) for h, s in ((0, 0), (5, 1), (23, 59))]
+    projects, topics = [], []
+    for offset in offsets:
+        project_id = str(uuid4())
+        projects.append({
+            "id": project_id, "user_id": user_id, "name": "P", "subject": "S",
+            "deadline": NOW + offset, "created_at": NOW,
+        })
+        for confidence in range(1, 6):
+            for stuck in range(0, 13):
+                topics.append({
+                    "id": str(uuid4()), "project_id": project_id, "name": "T", "created_at": NOW,
+                    "confidence_level": confidence, "stuck_count": stuck, "priority_score": 0.0,
+                })
+    await db_session.execute(insert(ProjectModel), projects)
+    await db_session.execute(insert(TopicModel), topics)
+    await db_session.commit()
+    return user_id, [p["id"] for p in projects]
+
+
+async def _assert_scores_match_python(db_session):
+    from sqlalchemy import select
+    from database.models import Project as ProjectModel, Topic as TopicModel
+
+    result = await db_session.execute(
+        select(TopicModel.confidence_level, TopicModel.stuck_count, TopicModel.priority_score, ProjectModel.deadline)
+        .join(ProjectModel, TopicModel.project_id == ProjectModel.id)
+    )
+    rows = result.all()
+    assert rows
+    for row in rows:
+        expected = calculate_priority(row.confidence_level, row.stuck_count, (row.deadline - NOW).days)
+        assert row.priority_score == expected, row
+
+
+@pytest.mark.asyncio
+async def test_sql_priority_identical_per_project(db_session, topic_grid):
+    """UPDATE with the SQL expression matches calculate_priority exactly"""
+    from database import project_repository
+
+    _, project_ids = topic_grid
+    for project_id in project_ids:
+        await project_repository.update_priorities(db_session, project_id, now=NOW)
+    await _assert_scores_match_python(db_session)
+
+
+@pytest.mark.asyncio
+async def test_sql_priority_identical_per_user(db_session, topic_grid):
+    """One UPDATE for all of a user's projects matches calculate_priority exactly"""
+    from database import project_repository
+
+    user_id, _ = topic_grid
+    await project_repository.update_user_priorities(db_session, user_id, now=NOW)
+    await _assert_scores_match_python(db_session)
+
+
+@pytest.mark.asyncio
+async def test_create_project_scores_topics_at_insert(db_session, user_id):
+    """create_project stores computed priorities and returns them without re-reading"""
+    from sqlalchemy import select
+    from database.models import Topic as TopicModel
+    from database import project_repository
+    from models.project import ProjectCreate
+
+    project = await project_repository.create_project(db_session, ProjectCreate(
+        name="Geografia", subject="Geo", deadline=datetime.now() + timedelta(days=4, hours=1), topics=["Klimat", "Gleby"],
+    ), user_id)
+
+    assert [t.priority_score for t in project.topics] == [calculate_priority(1, 0, 4)] * 2
+    stored = (await db_session.execute(
+        select(TopicModel.priority_score).where(TopicModel.project_id == str(project.id))
+    )).scalars().all()
+    assert stored == [calculate_priority(1, 0, 4)] * 2
+
+
+@pytest.mark.asyncio
+async def test_create_project_matches_recompute_at_day_boundary(db_session, user_id, monkeypatch):
+    """The priority stored by create_project is what the SQL recompute gives for the same moment"""
+    from sqlalchemy import select
+    from database.models import Topic as TopicModel
+    from database import project_repository
+    from models.project import ProjectCreate
+
+    frozen = datetime(2026, 3, 10, 12, 0, 0, 700000)
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return frozen
+
+    monkeypatch.setattr(project_repository, "datetime", FrozenDatetime)
+
+    # 3 days 23:59:59.7 with microseconds, exactly 4 days in whole seconds
+    project = await project_repository.create_project(db_session, ProjectCreate(
+        name="Geografia", subject="Geo", deadline=frozen + timedelta(days=4, microseconds=-300000), topics=["Klimat"],
+    ), user_id)
+    created = project.topics[0].priority_score
+    assert created == calculate_priority(1, 0, 4)
+
+    await project_repository.update_priorities(db_session, str(project.id), now=frozen.replace(microsecond=0))
+    recomputed = (await db_session.execute(
+        select(TopicModel.priority_score).where(TopicModel.project_id == str(project.id))
+    )).scalar_one()
+    assert recomputed == created
@@ -0,0 +1,165 @@
+"""
+Tests for services/rate_limiter.py and the rate_limit dependency
+
+Tests cover:
+- Token bucket burst, refill and Retry-After
+- Separate buckets per user and per route group
+- SQLite store shared between two limiters (workers)
+- 429 with RateLimit-* headers and the headers on normal and streamed responses
+"""
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from unittest.mock import patch
+
+from dependencies import get_current_user, rate_limit
+from exceptions import AIRateLimitError, FocusFlowException, exception_handler
+from services.rate_limiter import (
+    MemoryBucketStore,
+    RateLimiter,
+    RateLimitHeadersMiddleware,
+    RatePolicy,
+    SQLiteBucketStore,
+)
+
+
+def _limiter(clock, store=None):
+    # 3 requests at once, then one every 10 seconds
+    return RateLimiter({"ai": RatePolicy(3, 6.0), "chat": RatePolicy(5, 60.0)}, store, clock=clock)
+
+
+class TestTokenBucket:
+    """Test the bucket arithmetic"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_limited(self, clock):
+        limiter = _limiter(clock)
+        results = [await limiter.check("ai", "user-1") for _ in range(4)]
+
+        assert [r.allowed for r in results] == [True, True, True, False]
+        assert results[0].headers["RateLimit-Remaining"] == "2"
+        assert results[3].headers["Retry-After"] == "10"
+        assert results[3].headers["RateLimit-Policy"] == "3;w=30"
+        assert limiter.metrics()["limited"] == 1
+
+    @pytest.mark.asyncio
+    async def test_refill(self, clock):
+        limiter = _limiter(clock)
+        for _ in range(3):
+            await limiter.check("ai", "user-1")
+        clock.now += 10
+        assert (await limiter.check("ai", "user-1")).allowed is True
+        assert (await limiter.check("ai", "user-1")).allowed is False
+        clock.now += 3600
+        # Never more than the burst
+        result = await limiter.check("ai", "user-1")
+        assert result.headers["RateLimit-Remaining"] == "2"
+
+    @pytest.mark.asyncio
+    async def test_buckets_per_user_and_group(self, clock):
+        limiter = _limiter(clock)
+        for _ in range(3):
+            await limiter.check("ai", "user-1")
+        assert (await limiter.check("ai", "user-2")).allowed is True
+        assert (await limiter.check("chat", "user-1")).allowed is True
+
+    @pytest.mark.asyncio
+    async def test_hit_raises_429(self, clock):
+        limiter = _limiter(clock)
+        for _ in range(3):
+            await limiter.hit("ai", "user-1")
+        with pytest.raises(AIRateLimitError) as exc_info:
+            await limiter.hit("ai", "user-1")
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.headers["Retry-After"] == "10"
+        assert exc_info.value.headers["RateLimit-Remaining"] == "0"
+
+    @pytest.mark.asyncio
+    async def test_memory_store_bounded(self, clock):
+        store = MemoryBucketStore(max_keys=2)
+        limiter = _limiter(clock, store)
+        for user in ("a", "b", "c"):
+            await limiter.check("ai", user)
+        assert len(store) == 2
+
+
+class TestSQLiteStore:
+    """Test the store shared between workers"""
+
+    @pytest.mark.asyncio
+    async def test_shared_between_limiters(self, clock, tmp_path):
+        path = str(tmp_path / "rate_limits.db")
+        worker_a = _limiter(clock, SQLiteBucketStore(path))
+        worker_b = _limiter(clock, SQLiteBucketStore(path))
+        try:
+            assert (await worker_a.check("ai", "user-1")).allowed
+            assert (await worker_b.check("ai", "user-1")).allowed
+            assert (await worker_a.check("ai", "user-1")).allowed
+            result = await worker_b.check("ai", "user-1")
+            assert result.allowed is False
+            assert worker_b.metrics()["shared"] is True
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+    @pytest.mark.asyncio
+    async def test_store_error_fails_open(self, clock, tmp_path):
+        store = SQLiteBucketStore(str(tmp_path / "rate_limits.db"))
+        limiter = _limiter(clock, store)
+        store.close()
+        assert (await limiter.check("ai", "user-1")).allowed is True
+        assert limiter.store_errors == 1
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(RateLimitHeadersMiddleware)
+    app.add_exception_handler(FocusFlowException, exception_handler)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "user-1"}
+
+    @app.post("/ai/generate", dependencies=[Depends(rate_limit("ai"))])
+    async def generate():
+        return {"content": "Odpowiedź"}
+
+    @app.post("/ai/stream", dependencies=[Depends(rate_limit("ai"))])
+    async def stream():
+        async def frames():
+            yield 'data: {"content": "Odpowiedź"}\n\n'
+        return StreamingResponse(frames(), media_type="text/event-stream")
+
+    return app
+
+
+class TestRateLimitDependency:
+    """Test the dependency and middleware on real routes"""
+
+    @pytest.mark.asyncio
+    async def test_headers_and_429(self, clock):
+        limiter = _limiter(clock)
+        transport = httpx.ASGITransport(app=_app())
+        with patch('dependencies.get_rate_limiter', return_value=limiter):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = await client.post("/ai/generate")
+                streamed = await client.post("/ai/stream")
+                await client.post("/ai/generate")
+                limited = await client.post("/ai/stream")
+
+        assert first.status_code == 200
+        assert first.headers["RateLimit-Limit"] == "3"
+        assert first.headers["RateLimit-Remaining"] == "2"
+        assert streamed.status_code == 200
+        assert streamed.headers["RateLimit-Remaining"] == "1"
+        assert limited.status_code == 429
+        assert limited.headers["Retry-After"] == "10"
+        assert limited.headers["RateLimit-Remaining"] == "0"
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        transport = httpx.ASGITransport(app=_app())
+        with patch('dependencies.get_rate_limiter', return_value=None):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = [await client.post("/ai/generate") for _ in range(5)]
+        assert all(r.status_code == 200 for r in responses)
+        assert "RateLimit-Limit" not in responses[0].headers
@@ -0,0 +1,127 @@
+"""
+Tests for services/response_cache.py and its use in G4FService
+
+Tests cover:
+- LRU eviction and TTL expiry
+- SQLite disk tier surviving a restart
+- Hit/miss metrics
+- generate_chat answering repeated prompts from the cache, and bypass
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.response_cache import ResponseCache, make_cache_key
+
+
+class TestMemoryTier:
+    """Test LRU + TTL"""
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self, clock):
+        cache = ResponseCache(max_entries=2, clock=clock)
+        await cache.set("a", "A")
+        await cache.set("b", "B")
+        assert await cache.get("a") == "A"  # a becomes most recently used
+        await cache.set("c", "C")
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "A"
+        assert await cache.get("c") == "C"
+        assert cache.metrics()["evictions"] == 1
+
+    @pytest.mark.asyncio
+    async def test_ttl_expiry(self, clock):
+        cache = ResponseCache(ttl=60, clock=clock)
+        await cache.set("a", "A")
+        clock.now += 59
+        assert await cache.get("a") == "A"
+        clock.now += 2
+        assert await cache.get("a") is None
+        assert cache.metrics()["expirations"] == 1
+
+    @pytest.mark.asyncio
+    async def test_metrics(self, clock):
+        cache = ResponseCache(clock=clock)
+        await cache.set("a", "A")
+        await cache.set("empty", "")
+        await cache.get("a")
+        await cache.get("empty")
+        metrics = cache.metrics()
+        assert (metrics["hits"], metrics["misses"], metrics["entries"]) == (1, 1, 1)
+        assert metrics["hit_ratio"] == 0.5
+
+    def test_key_depends_on_model_and_messages(self):
+        messages = [{"role": "user", "content": "Wyjaśnij fotosyntezę prosto"}]
+        assert make_cache_key("gpt-5-mini", messages) == make_cache_key("gpt-5-mini", [dict(messages[0])])
+        assert make_cache_key("gpt-5-mini", messages) != make_cache_key("gpt-5-nano", messages)
+        assert make_cache_key("gpt-5-mini", messages) != make_cache_key(
+            "gpt-5-mini", [{"role": "user", "content": "Wyjaśnij osmozę prosto"}]
+        )
+
+
+class TestDiskTier:
+    """Test the optional SQLite tier"""
+
+    @pytest.mark.asyncio
+    async def test_survives_restart(self, tmp_path, clock):
+        path = str(tmp_path / "ai_cache.db")
+        first = ResponseCache(disk_path=path, clock=clock)
+        await first.set("a", "A")
+        first.close()
+
+        second = ResponseCache(disk_path=path, clock=clock)
+        assert await second.get("a") == "A"
+        assert second.metrics()["disk_hits"] == 1
+        # Promoted to memory
+        assert await second.get("a") == "A"
+        assert second.metrics()["disk_hits"] == 1
+        second.close()
+
+    @pytest.mark.asyncio
+    async def test_expired_rows_ignored(self, tmp_path, clock):
+        path = str(tmp_path / "ai_cache.db")
+        first = ResponseCache(ttl=60, disk_path=path, clock=clock)
+        await first.set("a", "A")
+        first.close()
+
+        clock.now += 61
+        second = ResponseCache(ttl=60, disk_path=path, clock=clock)
+        assert await second.get("a") is None
+        second.close()
+
+
+@pytest.fixture
+def cached_service(clock, g4f_service):
+    response = MagicMock()
+    response.choices = [MagicMock()]
+    response.choices[0].message.content = "Fotosynteza to..."
+    return g4f_service(AsyncMock(return_value=response), cache=ResponseCache(clock=clock))
+
+
+class TestServiceCache:
+    """Test cache use in generate_chat"""
+
+    MESSAGES = [{"role": "user", "content": "Wyjaśnij  fotosyntezę prosto"}]
+
+    @pytest.mark.asyncio
+    async def test_repeated_prompt_served_from_cache(self, cached_service):
+        first = await cached_service.generate_chat(self.MESSAGES)
+        # Whitespace differences are normalized away by sanitization
+        second = await cached_service.generate_chat([{"role": "user", "content": "Wyjaśnij fotosyntezę prosto "}])
+
+        assert first == second == "Fotosynteza to..."
+        assert cached_service.client.chat.completions.create.call_count == 1
+        assert cached_service.cache.metrics()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_bypass_asks_upstream(self, cached_service):
+        await cached_service.generate_chat(self.MESSAGES)
+        await cached_service.generate_chat(self.MESSAGES, bypass_cache=True)
+        assert cached_service.client.chat.completions.create.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_other_model_not_shared(self, cached_service):
+        await cached_service.generate_chat(self.MESSAGES)
+        await cached_service.generate_chat(self.MESSAGES, model="gpt-5-nano")
+        assert cached_service.client.chat.completions.create.call_count == 2
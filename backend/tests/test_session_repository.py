@@ -0,0 +1,128 @@
+"""
+Tests for database/session_repository.py
+
+Tests cover:
+- Conditional single-statement state transitions
+- Duration computed in SQL
+- 404 (None) vs 409 (ConflictError) on failed transitions
+- Races between concurrent transitions
+"""
+
+import pytest
+from datetime import timedelta
+from uuid import uuid4
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import Session as SessionModel
+from database import session_repository
+from models.session import SessionStatus
+from services import stats
+from exceptions import ConflictError
+
+
+@pytest.fixture
+async def study_session(db_session, study_session):
+    """Active session started 90 seconds ago"""
+    session_model = await db_session.get(SessionModel, study_session)
+    await db_session.execute(
+        update(SessionModel)
+        .where(SessionModel.id == study_session)
+        .values(start_time=session_model.start_time - timedelta(seconds=90))
+    )
+    await db_session.commit()
+    return study_session
+
+
+class TestTransitions:
+    """Test pause/resume/complete"""
+
+    @pytest.mark.asyncio
+    async def test_pause_computes_duration_in_sql(self, db_session, user_id, study_session):
+        paused = await session_repository.pause_session(db_session, study_session, user_id)
+        assert paused.status == SessionStatus.PAUSED
+        assert 90 <= paused.duration <= 91
+        assert paused.pause_time is not None
+
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_study_time == paused.duration
+
+    @pytest.mark.asyncio
+    async def test_complete_from_paused_adds_no_time(self, db_session, user_id, study_session):
+        paused = await session_repository.pause_session(db_session, study_session, user_id)
+        completed = await session_repository.complete_session(db_session, study_session, user_id)
+        assert completed.status == SessionStatus.COMPLETED
+        assert completed.completed is True
+        assert completed.duration == paused.duration
+
+        daily = await stats.get_daily_stats(db_session, user_id)
+        assert daily.total_study_time == completed.duration
+
+    @pytest.mark.asyncio
+    async def test_complete_from_active(self, db_session, user_id, study_session):
+        completed = await session_repository.complete_session(db_session, study_session, user_id)
+        assert 90 <= completed.duration <= 91
+        assert completed.end_time is not None
+
+    @pytest.mark.asyncio
+    async def test_transition_is_one_update(self, db_engine, db_session, user_id, study_session):
+        statements = []
+
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split()[0].upper())
+
+        event.listen(db_engine.sync_engine, "before_cursor_execute", _capture)
+        try:
+            await session_repository.pause_session(db_session, study_session, user_id)
+        finally:
+            event.remove(db_engine.sync_engine, "before_cursor_execute", _capture)
+
+        # sessions UPDATE ... RETURNING, the pause event, then the user_stats and project_stats deltas
+        assert statements == ["UPDATE", "INSERT", "UPDATE", "UPDATE"]
+
+    @pytest.mark.asyncio
+    async def test_without_returning_reads_row_back(self, db_engine, db_session, user_id, study_session, monkeypatch):
+        """MySQL path: no UPDATE ... RETURNING support"""
+        monkeypatch.setattr(db_engine.dialect, "update_returning", False)
+        paused = await session_repository.pause_session(db_session, study_session, user_id)
+        assert paused.status == SessionStatus.PAUSED
+        assert 90 <= paused.duration <= 91
+
+
+class TestFailedTransitions:
+    """Test 404 vs 409 outcomes"""
+
+    @pytest.mark.asyncio
+    async def test_unknown_session_returns_none(self, db_session, user_id):
+        assert await session_repository.pause_session(db_session, str(uuid4()), user_id) is None
+
+    @pytest.mark.asyncio
+    async def test_other_users_session_returns_none(self, db_session, study_session):
+        assert await session_repository.complete_session(db_session, study_session, str(uuid4())) is None
+
+    @pytest.mark.asyncio
+    async def test_wrong_status_conflicts(self, db_session, user_id, study_session):
+        with pytest.raises(ConflictError):
+            await session_repository.resume_session(db_session, study_session, user_id)
+
+        await session_repository.complete_session(db_session, study_session, user_id)
+        for transition in (session_repository.pause_session, session_repository.complete_session):
+            with pytest.raises(ConflictError) as exc_info:
+                await transition(db_session, study_session, user_id)
+            assert exc_info.value.status_code == 409
+
+    @pytest.mark.asyncio
+    async def test_concurrent_transitions_one_wins(self, db_engine, user_id, study_session):
+        session_maker = async_sessionmaker(db_engine, expire_on_commit=False)
+        async with session_maker() as first, session_maker() as second:
+            await session_repository.pause_session(first, study_session, user_id)
+            with pytest.raises(ConflictError):
+                await session_repository.pause_session(second, study_session, user_id)
+
+            completed = await session_repository.complete_session(second, study_session, user_id)
+            assert completed.status == SessionStatus.COMPLETED
+
+        async with session_maker() as reader:
+            overview = await stats.get_overview_stats(reader, user_id)
+            assert overview.completed_sessions == 1
+            assert overview.total_study_time == completed.duration
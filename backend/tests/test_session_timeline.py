@@ -0,0 +1,146 @@
+"""
+Tests for services/session_timeline.py
+
+Tests cover:
+- Folding session events into focus segments
+- Event log written by session transitions
+- Duration after several pause/resume cycles
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from database import session_repository, project_repository
+from models.project import ProjectCreate
+from models.session import SessionStart, SessionEventType
+from services import session_timeline
+from services.session_timeline import fold_events
+from exceptions import ConflictError
+
+T0 = datetime(2024, 3, 10, 9, 0, 0)
+
+
+def at(seconds: int) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+class TestFoldEvents:
+    """Test the pure fold over events"""
+
+    def test_pause_resume_cycles(self):
+        folded = fold_events([
+            (SessionEventType.START, at(0)),
+            (SessionEventType.PAUSE, at(100)),
+            (SessionEventType.RESUME, at(160)),
+            (SessionEventType.STUCK, at(170)),
+            (SessionEventType.PAUSE, at(200)),
+            (SessionEventType.RESUME, at(300)),
+            (SessionEventType.COMPLETE, at(330)),
+        ], now=at(1000))
+        assert [s.duration for s in folded["segments"]] == [100, 40, 30]
+        assert folded["active_time"] == 170
+        assert folded["paused_time"] == 160
+        assert folded["stuck_moments"] == 1
+
+    def test_open_segment_measured_to_now(self):
+        folded = fold_events([(SessionEventType.START, at(0))], now=at(45))
+        assert folded["active_time"] == 45
+        assert folded["segments"][0].end == at(45)
+
+    def test_open_pause_measured_to_now(self):
+        folded = fold_events([
+            (SessionEventType.START, at(0)),
+            (SessionEventType.PAUSE, at(10)),
+        ], now=at(70))
+        assert folded["active_time"] == 10
+        assert folded["paused_time"] == 60
+
+    def test_complete_while_paused(self):
+        folded = fold_events([
+            (SessionEventType.START, at(0)),
+            (SessionEventType.PAUSE, at(10)),
+            (SessionEventType.COMPLETE, at(40)),
+        ], now=at(1000))
+        assert folded["active_time"] == 10
+        assert folded["paused_time"] == 30
+
+    def test_duplicate_events_ignored(self):
+        folded = fold_events([
+            (SessionEventType.START, at(0)),
+            (SessionEventType.RESUME, at(5)),
+            (SessionEventType.PAUSE, at(10)),
+            (SessionEventType.PAUSE, at(20)),
+        ], now=at(20))
+        assert folded["active_time"] == 10
+
+    def test_no_events(self):
+        folded = fold_events([], now=at(0))
+        assert folded["segments"] == []
+        assert folded["active_time"] == 0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable session_repository clock"""
+    current = {"now": T0}
+    monkeypatch.setattr(session_repository, "_now", lambda: current["now"])
+
+    def advance(seconds: int):
+        current["now"] += timedelta(seconds=seconds)
+
+    return advance
+
+
+@pytest.fixture
+async def topic_id(db_session, user_id):
+    project = await project_repository.create_project(db_session, ProjectCreate(
+        name="Historia", subject="Hist", deadline=datetime.now() + timedelta(days=7), topics=["Rzym"],
+    ), user_id)
+    return project.topics[0].id
+
+
+class TestSessionTimeline:
+    """Test event log and derived durations"""
+
+    @pytest.mark.asyncio
+    async def test_second_pause_does_not_double_count(self, db_session, user_id, topic_id, clock):
+        started = await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+        session_id = str(started.id)
+
+        clock(100)
+        await session_repository.pause_session(db_session, session_id, user_id)
+        clock(60)
+        await session_repository.resume_session(db_session, session_id, user_id)
+        clock(40)
+        paused = await session_repository.pause_session(db_session, session_id, user_id)
+        assert paused.duration == 140
+
+        clock(100)
+        await session_repository.resume_session(db_session, session_id, user_id)
+        clock(30)
+        completed = await session_repository.complete_session(db_session, session_id, user_id)
+        assert completed.duration == 170
+
+        timeline = await session_timeline.get_session_timeline(db_session, session_id, user_id)
+        assert [e.type for e in timeline.events] == [
+            SessionEventType.START, SessionEventType.PAUSE, SessionEventType.RESUME,
+            SessionEventType.PAUSE, SessionEventType.RESUME, SessionEventType.COMPLETE,
+        ]
+        assert timeline.active_time == completed.duration
+        assert timeline.paused_time == 160
+
+    @pytest.mark.asyncio
+    async def test_failed_transition_writes_no_event(self, db_session, user_id, topic_id, clock):
+        started = await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+        with pytest.raises(ConflictError):
+            await session_repository.resume_session(db_session, str(started.id), user_id)
+        await db_session.rollback()
+
+        events = await session_repository.get_session_events(db_session, str(started.id), user_id)
+        assert [e.type for e in events] == ["start"]
+
+    @pytest.mark.asyncio
+    async def test_other_users_timeline_is_hidden(self, db_session, user_id, topic_id):
+        started = await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+        assert await session_timeline.get_session_timeline(db_session, str(started.id), str(uuid4())) is None
@@ -0,0 +1,145 @@
+"""
+Tests for single-flight request coalescing in G4FService
+
+Tests cover:
+- Identical concurrent requests share one upstream call
+- Cancelling one caller keeps the shared call alive for the others
+- Cancelling every caller cancels the upstream call
+- Distinct prompts and errors
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.g4f_service import G4FService
+from exceptions import AIUnavailableError
+
+MESSAGES = [{"role": "user", "content": "Wyjaśnij fotosyntezę prosto"}]
+
+
+class SlowUpstream:
+    """Fake chat.completions.create that blocks until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def __call__(self, model, messages, **kwargs):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = f"Odpowiedź: {messages[-1]['content']}"
+        return response
+
+
+@pytest.fixture
+def upstream():
+    return SlowUpstream()
+
+
+@pytest.fixture
+def service(upstream):
+    with patch('services.g4f_service.G4F_AVAILABLE', True):
+        with patch('services.g4f_service.AsyncClient'):
+            service = G4FService(enabled=True, max_retries=0)
+            service.client = AsyncMock()
+            service.client.chat.completions.create = upstream
+            yield service
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent identical requests"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_one_call(self, service, upstream):
+        callers = [asyncio.create_task(service.generate_chat(MESSAGES)) for _ in range(10)]
+        await _settle()
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+
+        assert upstream.calls == 1
+        assert set(results) == {"Odpowiedź: Wyjaśnij fotosyntezę prosto"}
+        metrics = service.flight_metrics()
+        assert (metrics["leaders"], metrics["joined"], metrics["in_flight"]) == (1, 9, 0)
+
+    @pytest.mark.asyncio
+    async def test_distinct_prompts_not_coalesced(self, service, upstream):
+        callers = [
+            asyncio.create_task(service.generate_chat([{"role": "user", "content": f"Pytanie {i}"}]))
+            for i in range(3)
+        ]
+        await _settle()
+        upstream.release.set()
+        await asyncio.gather(*callers)
+        assert upstream.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_one_caller_cancelled_others_still_answered(self, service, upstream):
+        leaving = asyncio.create_task(service.generate_chat(MESSAGES))
+        staying = asyncio.create_task(service.generate_chat(MESSAGES))
+        await _settle()
+
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        upstream.release.set()
+
+        assert await staying == "Odpowiedź: Wyjaśnij fotosyntezę prosto"
+        assert (upstream.calls, upstream.cancelled) == (1, 0)
+
+    @pytest.mark.asyncio
+    async def test_all_callers_cancelled_cancels_upstream(self, service, upstream):
+        callers = [asyncio.create_task(service.generate_chat(MESSAGES)) for _ in range(3)]
+        await _settle()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await _settle()
+
+        assert upstream.cancelled == 1
+        assert service.flight_metrics()["cancelled"] == 1
+        assert service.flight_metrics()["in_flight"] == 0
+
+        # A later request starts a fresh call instead of joining the cancelled one
+        upstream.release.set()
+        assert await service.generate_chat(MESSAGES) == "Odpowiedź: Wyjaśnij fotosyntezę prosto"
+        assert upstream.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_error_shared_by_all_callers(self, service, upstream):
+        upstream.error = RuntimeError("provider unavailable")
+        callers = [asyncio.create_task(service.generate_chat(MESSAGES)) for _ in range(3)]
+        await _settle()
+        upstream.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+
+        assert all(isinstance(r, AIUnavailableError) for r in results)
+        assert upstream.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, upstream):
+        with patch('services.g4f_service.G4F_AVAILABLE', True):
+            with patch('services.g4f_service.AsyncClient'):
+                service = G4FService(enabled=True, max_retries=0, single_flight=False)
+        service.client = AsyncMock()
+        service.client.chat.completions.create = upstream
+        callers = [asyncio.create_task(service.generate_chat(MESSAGES)) for _ in range(3)]
+        await _settle()
+        upstream.release.set()
+        await asyncio.gather(*callers)
+        assert upstream.calls == 3
@@ -0,0 +1,119 @@
+"""
+Tests for services/sse.py
+
+Tests cover:
+- Coalescing by size and by time window
+- Keepalive comments during upstream stalls
+- Upstream errors after buffered text
+- Frame and byte counters
+"""
+
+import asyncio
+import json
+import pytest
+
+from services.sse import SSECoalescer, KEEPALIVE_FRAME, get_sse_metrics
+
+
+async def _collect(coalescer, chunks):
+    return [frame async for frame in coalescer.frames(chunks)]
+
+
+def _contents(frames):
+    return [json.loads(f[len("data: "):])["content"] for f in frames if f.startswith("data: ")]
+
+
+async def _burst(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestCoalescing:
+    """Test frame batching"""
+
+    @pytest.mark.asyncio
+    async def test_burst_split_by_size(self):
+        coalescer = SSECoalescer(flush_bytes=100, flush_interval=10.0)
+        frames = await _collect(coalescer, _burst(["x" * 10] * 25))
+
+        assert _contents(frames) == ["x" * 100, "x" * 100, "x" * 50]
+        assert coalescer.upstream_chunks == 25
+        assert coalescer.frames_sent == 3
+        assert coalescer.bytes_sent == sum(len(f.encode()) for f in frames)
+
+    @pytest.mark.asyncio
+    async def test_slow_chunks_flushed_by_time(self):
+        async def slow():
+            for chunk in ["Raz ", "dwa ", "trzy"]:
+                yield chunk
+                await asyncio.sleep(0.05)
+
+        coalescer = SSECoalescer(flush_bytes=512, flush_interval=0.01)
+        frames = await _collect(coalescer, slow())
+        assert _contents(frames) == ["Raz ", "dwa ", "trzy"]
+
+    @pytest.mark.asyncio
+    async def test_multibyte_text_counted_in_bytes(self):
+        coalescer = SSECoalescer(flush_bytes=8, flush_interval=10.0)
+        frames = await _collect(coalescer, _burst(["ąę", "śź", "x"]))
+        assert _contents(frames) == ["ąęśź", "x"]
+
+
+class TestStalls:
+    """Test keepalives and errors"""
+
+    @pytest.mark.asyncio
+    async def test_keepalive_while_upstream_stalls(self):
+        async def stalled():
+            yield "Początek"
+            await asyncio.sleep(0.12)
+            yield "koniec"
+
+        coalescer = SSECoalescer(flush_interval=0.01, keepalive_interval=0.05)
+        frames = await _collect(coalescer, stalled())
+
+        assert frames[0] != KEEPALIVE_FRAME
+        assert KEEPALIVE_FRAME in frames
+        assert coalescer.keepalives_sent == frames.count(KEEPALIVE_FRAME) >= 1
+        assert _contents(frames) == ["Początek", "koniec"]
+
+    @pytest.mark.asyncio
+    async def test_error_after_buffered_text(self):
+        async def failing():
+            yield "część"
+            raise RuntimeError("provider zerwał połączenie")
+
+        coalescer = SSECoalescer(flush_interval=10.0)
+        frames = []
+        with pytest.raises(RuntimeError):
+            async for frame in coalescer.frames(failing()):
+                frames.append(frame)
+        assert _contents(frames) == ["część"]
+
+    @pytest.mark.asyncio
+    async def test_close_cancels_upstream(self):
+        closed = asyncio.Event()
+
+        async def endless():
+            try:
+                while True:
+                    yield "x"
+                    await asyncio.sleep(0.01)
+            finally:
+                closed.set()
+
+        frames = SSECoalescer(flush_bytes=1).frames(endless())
+        assert _contents([await frames.__anext__()]) == ["x"]
+        await frames.aclose()
+        assert closed.is_set()
+
+
+def test_process_wide_metrics():
+    before = get_sse_metrics()
+    coalescer = SSECoalescer()
+    coalescer.event({"content": "abc"})
+    coalescer.done()
+    after = get_sse_metrics()
+    assert after["streams"] == before["streams"] + 1
+    assert after["frames"] == before["frames"] + 2
+    assert after["bytes"] - before["bytes"] == coalescer.bytes_sent
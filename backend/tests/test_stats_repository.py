@@ -0,0 +1,291 @@
+"""
+Tests for database/stats_repository.py
+
+Tests cover:
+- Incremental user_stats / project_stats maintenance by the repositories
+- Lazy materialization of missing rows
+- Equality of maintained rows with a full rebuild from source tables
+- Daily study buckets and streaks
+"""
+
+import pytest
+from datetime import date, datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import select
+
+from database.models import (
+    UserStats as UserStatsModel,
+    ProjectStats as ProjectStatsModel,
+    DailyStudyStats as DailyStudyStatsModel,
+)
+from database import stats_repository, project_repository, topic_repository, session_repository
+from models.project import ProjectCreate
+from models.topic import TopicCreate, TopicUpdate
+from models.session import SessionStart
+from services import stats
+from exceptions import ValidationError
+
+
+async def _snapshot(db_session):
+    """Current materialized rows, keyed by primary key"""
+    users = (await db_session.execute(
+        select(UserStatsModel).execution_options(populate_existing=True)
+    )).scalars().all()
+    projects = (await db_session.execute(
+        select(ProjectStatsModel).execution_options(populate_existing=True)
+    )).scalars().all()
+    return (
+        {u.user_id: [getattr(u, c) for c in stats_repository.USER_STATS_COLUMNS] for u in users},
+        {p.project_id: [getattr(p, c) for c in stats_repository.PROJECT_STATS_COLUMNS] for p in projects},
+    )
+
+
+async def _assert_matches_rebuild(db_session):
+    maintained = await _snapshot(db_session)
+    await stats_repository.rebuild_user_stats(db_session)
+    await stats_repository.rebuild_project_stats(db_session)
+    await db_session.commit()
+    assert maintained == await _snapshot(db_session)
+
+
+@pytest.fixture
+async def project(db_session, user_id):
+    return await project_repository.create_project(db_session, ProjectCreate(
+        name="Chemia", subject="Chem",
+        deadline=datetime.now() + timedelta(days=14),
+        topics=["Wiązania", "Reakcje"],
+    ), user_id)
+
+
+class TestIncrementalStats:
+    """Test that repository writes keep the stats tables in sync"""
+
+    @pytest.mark.asyncio
+    async def test_create_project_materializes_rows(self, db_session, user_id, project):
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_projects == 1
+        assert overview.total_topics == 2
+
+        project_stats = await stats.get_project_stats(db_session, str(project.id), user_id)
+        assert project_stats.topics_count == 2
+        assert project_stats.average_confidence == 1.0
+        await _assert_matches_rebuild(db_session)
+
+    @pytest.mark.asyncio
+    async def test_session_lifecycle(self, db_session, user_id, project):
+        topic_id = str(project.topics[0].id)
+        started = await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+        await session_repository.pause_session(db_session, str(started.id), user_id)
+        await session_repository.resume_session(db_session, str(started.id), user_id)
+        completed = await session_repository.complete_session(db_session, str(started.id), user_id)
+        await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_sessions == 2
+        assert overview.completed_sessions == 1
+        assert overview.total_study_time == completed.duration
+        await _assert_matches_rebuild(db_session)
+
+    @pytest.mark.asyncio
+    async def test_topic_changes(self, db_session, user_id, project):
+        topic = await topic_repository.create_topic(
+            db_session, str(project.id), TopicCreate(name="Kwasy", confidence_level=3), user_id
+        )
+        await topic_repository.update_topic(db_session, str(topic.id), TopicUpdate(confidence_level=5), user_id)
+
+        project_stats = await stats.get_project_stats(db_session, str(project.id), user_id)
+        assert project_stats.topics_count == 3
+        assert project_stats.average_confidence == pytest.approx(7 / 3)
+        await _assert_matches_rebuild(db_session)
+
+    @pytest.mark.asyncio
+    async def test_delete_topic_removes_its_sessions(self, db_session, user_id, project):
+        topic_id = str(project.topics[0].id)
+        started = await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+        await session_repository.complete_session(db_session, str(started.id), user_id)
+
+        assert await topic_repository.delete_topic(db_session, topic_id, user_id)
+
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_topics == 1
+        assert overview.total_sessions == 0
+        await _assert_matches_rebuild(db_session)
+
+    @pytest.mark.asyncio
+    async def test_delete_project(self, db_session, user_id, project):
+        started = await session_repository.start_session(
+            db_session, SessionStart(topic_id=str(project.topics[0].id)), user_id
+        )
+        await session_repository.complete_session(db_session, str(started.id), user_id)
+
+        assert await project_repository.delete_project(db_session, str(project.id), user_id)
+
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_projects == 0
+        assert overview.total_topics == 0
+        assert overview.total_sessions == 0
+        assert await stats.get_project_stats(db_session, str(project.id), user_id) is None
+        await _assert_matches_rebuild(db_session)
+
+
+class TestLazyMaterialization:
+    """Test rebuilding rows that do not exist yet"""
+
+    @pytest.mark.asyncio
+    async def test_missing_rows_are_rebuilt(self, db_session, user_id, project):
+        await session_repository.start_session(db_session, SessionStart(topic_id=str(project.topics[0].id)), user_id)
+        await db_session.execute(UserStatsModel.__table__.delete())
+        await db_session.execute(ProjectStatsModel.__table__.delete())
+        await db_session.commit()
+
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_sessions == 1
+        project_stats = await stats.get_project_stats(db_session, str(project.id), user_id)
+        assert project_stats.total_sessions == 1
+
+    @pytest.mark.asyncio
+    async def test_delta_on_missing_row_rebuilds_once(self, db_session, user_id, project):
+        await db_session.execute(UserStatsModel.__table__.delete())
+        await db_session.commit()
+
+        await topic_repository.create_topic(db_session, str(project.id), TopicCreate(name="Gazy"), user_id)
+
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_topics == 3
+
+    @pytest.mark.asyncio
+    async def test_other_users_project_is_hidden(self, db_session, project, make_user):
+        other_user_id = await make_user()
+        assert await stats.get_project_stats(db_session, str(project.id), other_user_id) is None
+
+    @pytest.mark.asyncio
+    async def test_other_user_does_not_trigger_rebuild(self, db_session, project, make_user):
+        await db_session.execute(ProjectStatsModel.__table__.delete())
+        await db_session.commit()
+
+        other_user_id = await make_user()
+        assert await stats.get_project_stats(db_session, str(project.id), other_user_id) is None
+        assert await db_session.get(ProjectStatsModel, str(project.id)) is None
+
+    @pytest.mark.asyncio
+    async def test_new_user_overview_is_zero(self, db_session, user_id):
+        overview = await stats.get_overview_stats(db_session, user_id)
+        assert overview.total_sessions == 0
+        assert overview.total_projects == 0
+
+
+class TestDailyStats:
+    """Test daily study buckets fed by completed sessions"""
+
+    @pytest.mark.asyncio
+    async def test_completed_sessions_share_a_bucket(self, db_session, user_id, project):
+        topic_id = str(project.topics[0].id)
+        for _ in range(2):
+            started = await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+            await session_repository.complete_session(db_session, str(started.id), user_id)
+        await session_repository.start_session(db_session, SessionStart(topic_id=topic_id), user_id)
+
+        rows = (await db_session.execute(select(DailyStudyStatsModel))).scalars().all()
+        assert len(rows) == 1
+        assert rows[0].day == date.today()
+        assert rows[0].sessions_completed == 2
+
+    @pytest.mark.asyncio
+    async def test_daily_range_is_zero_filled(self, db_session, user_id, project):
+        today = date.today()
+        for days_ago, minutes in [(0, 30), (2, 45), (10, 60)]:
+            await stats_repository.record_study_day(
+                db_session, user_id, str(project.id), str(project.topics[days_ago % 2].id),
+                today - timedelta(days=days_ago), minutes * 60,
+            )
+        await db_session.commit()
+
+        daily = await stats.get_daily_stats(db_session, user_id)
+        assert [d.day for d in daily.days] == [today - timedelta(days=n) for n in range(6, -1, -1)]
+        assert [d.study_time for d in daily.days] == [0, 0, 0, 0, 45 * 60, 0, 30 * 60]
+        assert daily.total_study_time == 75 * 60
+
+        other_project = await stats.get_daily_stats(db_session, user_id, project_id=str(uuid4()))
+        assert other_project.total_study_time == 0
+
+    @pytest.mark.asyncio
+    async def test_invalid_range_rejected(self, db_session, user_id):
+        today = date.today()
+        with pytest.raises(ValidationError):
+            await stats.get_daily_stats(db_session, user_id, today, today - timedelta(days=1))
+        with pytest.raises(ValidationError):
+            await stats.get_daily_stats(db_session, user_id, today - timedelta(days=400), today)
+
+    @pytest.mark.asyncio
+    async def test_streak_from_buckets(self, db_session, user_id, project):
+        today = date.today()
+        for days_ago in [0, 1, 2, 5, 6, 7, 8]:
+            await stats_repository.record_study_day(
+                db_session, user_id, str(project.id), str(project.topics[0].id),
+                today - timedelta(days=days_ago), 600,
+            )
+        await db_session.commit()
+
+        streak = await stats.get_study_streak(db_session, user_id)
+        assert streak.current_streak == 3
+        assert streak.longest_streak == 4
+        assert streak.last_study_day == today
+
+
+async def _record_days(db_session, user_id, project, days_ago):
+    today = date.today()
+    for offset in days_ago:
+        await stats_repository.record_study_day(
+            db_session, user_id, str(project.id), str(project.topics[0].id), today - timedelta(days=offset), 600,
+        )
+    await db_session.commit()
+
+
+class TestStudyStreak:
+    """Test the windowed current streak and the SQL longest streak"""
+
+    def test_count_run(self):
+        days = [date(2024, 3, 9), date(2024, 3, 8), date(2024, 3, 6)]
+        assert stats.count_run(days, date(2024, 3, 9)) == 2
+        assert stats.count_run(days, date(2024, 3, 10)) == 0
+        assert stats.count_run([], date(2024, 3, 10)) == 0
+
+    @pytest.mark.asyncio
+    async def test_no_study_days(self, db_session, user_id):
+        streak = await stats.get_study_streak(db_session, user_id)
+        assert streak.current_streak == 0
+        assert streak.longest_streak == 0
+        assert streak.last_study_day is None
+
+    @pytest.mark.asyncio
+    async def test_streak_survives_until_end_of_today(self, db_session, user_id, project):
+        await _record_days(db_session, user_id, project, [1, 2])
+        streak = await stats.get_study_streak(db_session, user_id)
+        assert streak.current_streak == 2
+        assert streak.last_study_day == date.today() - timedelta(days=1)
+
+    @pytest.mark.asyncio
+    async def test_gap_breaks_current_streak(self, db_session, user_id, project):
+        await _record_days(db_session, user_id, project, [3, 7, 8, 9])
+        streak = await stats.get_study_streak(db_session, user_id)
+        assert streak.current_streak == 0
+        assert streak.longest_streak == 3
+
+    @pytest.mark.asyncio
+    async def test_current_streak_read_in_windows(self, db_session, user_id, project, monkeypatch):
+        await _record_days(db_session, user_id, project, [0, 1, 2, 3, 4, 5, 6, 8, 9, 20])
+        calls = []
+        get_study_days = stats_repository.get_study_days
+
+        async def counting(*args, **kwargs):
+            calls.append(kwargs)
+            return await get_study_days(*args, **kwargs)
+
+        monkeypatch.setattr(stats, "STREAK_WINDOW", 3)
+        monkeypatch.setattr(stats_repository, "get_study_days", counting)
+        streak = await stats.get_study_streak(db_session, user_id)
+        assert streak.current_streak == 7
+        assert streak.longest_streak == 7
+        # Windows [0, 1, 2], [3, 4, 5], [6, 8, 9]; day 20 is never read
+        assert len(calls) == 3
+        assert all(call["limit"] == 3 for call in calls)
@@ -0,0 +1,203 @@
+"""
+Tests for services/stuck_buffer.py
+
+Tests cover:
+- Buffering clicks in memory until flush
+- Batched counter UPDATEs, stuck events and priority recompute in one flush
+- Re-queueing clicks when a flush fails, dropping them after max attempts
+- Clicks of deleted sessions skipped, topic counters included
+- Endpoint-level validation (404 / 409)
+"""
+
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import delete, event, select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import Session as SessionModel, Topic as TopicModel, SessionEvent as SessionEventModel
+from database import session_repository, project_repository, topic_repository
+from models.project import ProjectCreate
+from models.session import SessionStart
+from services.stuck_buffer import StuckCounterBuffer, report_stuck
+from exceptions import ConflictError
+
+
+@pytest.fixture
+async def started(db_session, user_id):
+    project = await project_repository.create_project(db_session, ProjectCreate(
+        name="Matematyka", subject="Mat", deadline=datetime.now() + timedelta(days=5), topics=["Całki", "Pochodne"],
+    ), user_id)
+    return await session_repository.start_session(
+        db_session, SessionStart(topic_id=project.topics[0].id), user_id
+    )
+
+
+@pytest.fixture
+def buffer(db_engine):
+    return StuckCounterBuffer(async_sessionmaker(db_engine, expire_on_commit=False), flush_interval=60)
+
+
+async def _counters(db_engine, session_id, topic_id):
+    async with async_sessionmaker(db_engine)() as session:
+        stuck_moments = (await session.execute(
+            select(SessionModel.stuck_moments).where(SessionModel.id == session_id))).scalar()
+        topic = (await session.execute(select(TopicModel).where(TopicModel.id == topic_id))).scalar_one()
+        events = (await session.execute(
+            select(func.count()).where(SessionEventModel.session_id == session_id, SessionEventModel.type == "stuck")
+        )).scalar()
+        return stuck_moments, topic.stuck_count, topic.priority_score, events
+
+
+class TestStuckBuffer:
+    """Test buffering and flushing"""
+
+    @pytest.mark.asyncio
+    async def test_clicks_wait_for_flush(self, db_engine, db_session, user_id, started, buffer):
+        session_id, topic_id = str(started.id), str(started.topic_id)
+        for _ in range(3):
+            status = await report_stuck(db_session, session_id, user_id, buffer)
+        assert status.stuck_moments == 3
+        assert (await _counters(db_engine, session_id, topic_id))[:2] == (0, 0)
+
+        assert await buffer.flush() == 3
+        assert buffer.pending == 0
+        stuck_moments, stuck_count, priority, events = await _counters(db_engine, session_id, topic_id)
+        assert (stuck_moments, stuck_count, events) == (3, 3, 3)
+
+    @pytest.mark.asyncio
+    async def test_flush_recomputes_priority(self, db_engine, db_session, user_id, started, buffer):
+        session_id, topic_id = str(started.id), str(started.topic_id)
+        # Baseline computed the same way (in SQL, whole days) before the click
+        await topic_repository.recompute_priorities(db_session, [topic_id])
+        await db_session.commit()
+        before = (await _counters(db_engine, session_id, topic_id))[2]
+
+        await report_stuck(db_session, session_id, user_id, buffer)
+        await buffer.flush()
+
+        after = (await _counters(db_engine, session_id, topic_id))[2]
+        assert after == pytest.approx(before * 1.2)
+
+    @pytest.mark.asyncio
+    async def test_burst_is_one_batch(self, db_engine, db_session, user_id, started, buffer):
+        for _ in range(50):
+            await report_stuck(db_session, str(started.id), user_id, buffer)
+
+        statements = []
+
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split()[0].upper())
+
+        event.listen(db_engine.sync_engine, "before_cursor_execute", _capture)
+        try:
+            assert await buffer.flush() == 50
+        finally:
+            event.remove(db_engine.sync_engine, "before_cursor_execute", _capture)
+
+        # existence check, sessions UPDATE, topics UPDATE, events INSERT, priority UPDATE
+        assert statements == ["SELECT", "UPDATE", "UPDATE", "INSERT", "UPDATE"]
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_requeues(self, db_engine, db_session, user_id, started, buffer, monkeypatch):
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+
+        async def _broken(*args, **kwargs):
+            raise RuntimeError("baza niedostępna")
+
+        monkeypatch.setattr(topic_repository, "recompute_priorities", _broken)
+        assert await buffer.flush() == 0
+        assert buffer.pending == 1
+        assert buffer.pending_for(str(started.id)) == 1
+
+        monkeypatch.undo()
+        assert await buffer.flush() == 1
+        assert (await _counters(db_engine, str(started.id), str(started.topic_id)))[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_failing_batch_dropped(self, db_engine, db_session, user_id, started, monkeypatch):
+        buffer = StuckCounterBuffer(async_sessionmaker(db_engine, expire_on_commit=False), max_attempts=3)
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+
+        async def _broken(*args, **kwargs):
+            raise RuntimeError("baza niedostępna")
+
+        monkeypatch.setattr(topic_repository, "recompute_priorities", _broken)
+        assert await buffer.flush() == 0
+        # A click arriving between failed flushes keeps its own attempts
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+        assert await buffer.flush() == 0
+        assert await buffer.flush() == 0
+        assert (buffer.pending, buffer.dropped) == (1, 1)
+        assert buffer.pending_for(str(started.id)) == 1
+
+        monkeypatch.undo()
+        assert await buffer.flush() == 1
+        assert (await _counters(db_engine, str(started.id), str(started.topic_id)))[:2] == (1, 1)
+
+    @pytest.mark.asyncio
+    async def test_deleted_session_not_counted_for_topic(self, db_engine, db_session, user_id, started, buffer):
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+        await db_session.execute(delete(SessionModel).where(SessionModel.id == str(started.id)))
+        await db_session.commit()
+
+        assert await buffer.flush() == 1
+        topic = await db_session.get(TopicModel, str(started.topic_id))
+        await db_session.refresh(topic)
+        assert topic.stuck_count == 0
+
+    @pytest.mark.asyncio
+    async def test_deleted_session_is_skipped(self, db_session, user_id, started, buffer):
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+        await topic_repository.delete_topic(db_session, str(started.topic_id), user_id)
+
+        assert await buffer.flush() == 1
+        assert buffer.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_stop_during_flush_keeps_batch(self, db_engine, db_session, user_id, started, buffer, monkeypatch):
+        writing, release = asyncio.Event(), asyncio.Event()
+        apply_stuck_counts = session_repository.apply_stuck_counts
+
+        async def _slow(*args, **kwargs):
+            writing.set()
+            await release.wait()
+            return await apply_stuck_counts(*args, **kwargs)
+
+        monkeypatch.setattr(session_repository, "apply_stuck_counts", _slow)
+        buffer.flush_interval = 0.01
+        buffer.start()
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+        await asyncio.wait_for(writing.wait(), timeout=2.0)
+
+        # stop() cancels the flusher in the middle of its write
+        stopping = asyncio.create_task(buffer.stop())
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.wait_for(stopping, timeout=2.0)
+
+        assert buffer.pending == 0
+        assert (await _counters(db_engine, str(started.id), str(started.topic_id)))[:2] == (1, 1)
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_remaining(self, db_engine, db_session, user_id, started, buffer):
+        buffer.start()
+        await report_stuck(db_session, str(started.id), user_id, buffer)
+        await buffer.stop()
+        assert (await _counters(db_engine, str(started.id), str(started.topic_id)))[0] == 1
+
+
+class TestReportStuck:
+    """Test validation before buffering"""
+
+    @pytest.mark.asyncio
+    async def test_unknown_session(self, db_session, user_id, buffer):
+        assert await report_stuck(db_session, str(uuid4()), user_id, buffer) is None
+        assert buffer.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_completed_session_conflicts(self, db_session, user_id, started, buffer):
+        await session_repository.complete_session(db_session, str(started.id), user_id)
+        with pytest.raises(ConflictError):
+            await report_stuck(db_session, str(started.id), user_id, buffer)